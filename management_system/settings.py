@@ -43,14 +43,19 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "myapp.middleware.RequestTimingMiddleware",
+    "myapp.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "myapp.middleware.UserAccessMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "myapp.middleware.ReadReplicaMiddleware",
+    "myapp.middleware.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "management_system.urls"
@@ -65,6 +70,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "myapp.context_processors.access",
             ],
         },
     },
@@ -76,10 +82,74 @@ WSGI_APPLICATION = "management_system.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# SQLite tuned for concurrent use (python manage.py bench_sqlite compares it
+# with the stock settings). WAL lets reads run alongside the one writer;
+# IMMEDIATE transactions take the write lock up front, so concurrent edits
+# wait up to "timeout" seconds for it instead of failing with "database is
+# locked" when a read lock cannot be upgraded. synchronous=NORMAL skips the
+# fsync on every commit; in WAL mode a power cut can lose the last commits
+# but never corrupts the database. cache_size is per connection.
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 20,
+            "init_command": (
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=NORMAL;"
+                "PRAGMA cache_size=-32768;"
+                "PRAGMA mmap_size=268435456;"
+                "PRAGMA temp_store=MEMORY;"
+            ),
+        },
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+    },
+    # Read replica, used when READ_REPLICA_ENABLED is on. Locally it is a
+    # copy of the primary kept up to date by
+    # `python manage.py refresh_replica --interval 30`.
+    "replica": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db.replica.sqlite3",
+        "OPTIONS": {
+            "timeout": 20,
+            "init_command": (
+                "PRAGMA query_only=ON;"
+                "PRAGMA cache_size=-32768;"
+                "PRAGMA mmap_size=268435456;"
+                "PRAGMA temp_store=MEMORY;"
+            ),
+        },
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+        "TEST": {"MIRROR": "default"},
+    },
+}
+
+# Asset shards (see ASSET_SHARDS below) are further entries here. Locally a
+# shard is another SQLite file; foreign keys are not enforced in it because
+# assets refer to users that only exist in "default":
+#
+#     DATABASES["assets_north"] = {
+#         "ENGINE": "django.db.backends.sqlite3",
+#         "NAME": BASE_DIR / "db.assets_north.sqlite3",
+#         "OPTIONS": {"init_command": "PRAGMA foreign_keys=OFF;"},
+#     }
+
+DATABASE_ROUTERS = ["myapp.routers.AssetShardRouter", "myapp.routers.ReadReplicaRouter"]
+
+
+# Cache
+# Shared by every worker process on the host: sessions reuse a user's
+# resolved role until its version here changes (myapp.access), and the asset
+# list caches its row counts. Use Redis or Memcached across several hosts.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(BASE_DIR, "cache"),
+        "OPTIONS": {"MAX_ENTRIES": 10000},
     }
 }
 
@@ -129,5 +199,102 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Keeps the test suite's metrics, profiles, cache and files out of the project.
+TEST_RUNNER = "myapp.test_runner.TestRunner"
+
 LOGIN_URL = "login"
 LOGIN_REDIRECT_URL = "dashboard"
+
+# Format for new asset IDs; receives the allocation ``year`` and the
+# per-year sequence ``number``.
+ASSET_ID_FORMAT = "AST-{year}-{number:05d}"
+
+# Asset list pagination
+ASSET_LIST_PAGE_SIZE = 25
+ASSET_LIST_MAX_PAGE_SIZE = 200
+# Seconds to cache the total row count per filter; None hides the count.
+ASSET_LIST_COUNT_CACHE_TIMEOUT = 60
+
+# Exports
+# Rows fetched per database round trip when streaming exports.
+EXPORT_CHUNK_SIZE = 2000
+# Generated files are kept in memory up to this size, then spill to disk.
+EXPORT_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+# PDF backend: "xhtml2pdf" renders the HTML template, "reportlab" lays the
+# report out natively and scales to much larger exports. A request can pick
+# one with ?engine=.
+ASSET_PDF_ENGINE = "xhtml2pdf"
+# Processes the reportlab engine renders branch sections in; None uses one
+# per CPU and 1 renders in the calling process.
+ASSET_PDF_WORKERS = None
+
+# Generated PDF and Excel exports are kept here and reused until their data
+# changes; None disables the cache. Least recently used files are evicted
+# once the directory grows past EXPORT_CACHE_MAX_SIZE bytes.
+EXPORT_CACHE_DIR = os.path.join(BASE_DIR, "export_cache")
+EXPORT_CACHE_MAX_SIZE = 512 * 1024 * 1024
+
+# Background export jobs
+EXPORT_JOB_WORKERS = 2
+EXPORT_JOB_MAX_ACTIVE_PER_USER = 2
+EXPORT_JOB_MAX_QUEUED = 20
+# Seconds a finished export stays downloadable.
+EXPORT_JOB_TTL = 24 * 60 * 60
+# Seconds after which a queued or running job is considered lost.
+EXPORT_JOB_TIMEOUT = 60 * 60
+
+# Request timing: a Server-Timing header with total, SQL, template and export
+# rendering times on responses to staff users (to everyone when DEBUG is on),
+# and a warning logged (with the slowest SQL statements) for requests slower
+# than REQUEST_TIMING_SLOW_MS; None turns the log off.
+REQUEST_TIMING_ENABLED = True
+REQUEST_TIMING_SLOW_MS = 1000
+REQUEST_TIMING_SLOW_QUERIES = 5
+
+# Prometheus metrics for requests and exports, served to staff at /metrics/.
+# Worker processes share them through a SQLite file, each adding its counts
+# at most every METRICS_FLUSH_INTERVAL seconds from a background thread.
+METRICS_ENABLED = True
+METRICS_DB_PATH = BASE_DIR / "metrics.sqlite3"
+METRICS_FLUSH_INTERVAL = 5
+
+# Profiling: staff users can profile a request with ?_profile=1 or an
+# X-Profile: 1 header, and PROFILE_SAMPLING profiles 1 in N requests per URL
+# name, e.g. {"asset_list": 100}. A .prof dump and a text report of the
+# largest allocations go to PROFILE_DIR, which keeps the newest
+# PROFILE_MAX_FILES profiles.
+PROFILE_ENABLED = True
+PROFILE_SAMPLING = {}
+PROFILE_DIR = os.path.join(BASE_DIR, "profiles")
+PROFILE_MAX_FILES = 50
+
+# Read replica routing: GET requests to these URL names read this app's
+# tables from the READ_REPLICA_ALIAS database; users, sessions and all writes
+# stay on the primary. After a POST the user reads from the primary for
+# READ_REPLICA_STICKY_SECONDS, which should be longer than the replica's lag.
+READ_REPLICA_ENABLED = False
+READ_REPLICA_ALIAS = "replica"
+READ_REPLICA_VIEWS = [
+    "dashboard",
+    "asset_list",
+    "asset_detail",
+    "branch_list",
+    "export_assets_pdf",
+    "export_assets_excel",
+    "export_assets_csv",
+    "export_assets_ndjson",
+]
+READ_REPLICA_STICKY_SECONDS = 60
+READ_REPLICA_STICKY_COOKIE = "read_primary"
+
+# Asset sharding: assets and their dashboard rollups are stored in the
+# database of their branch's region, e.g.
+#     {"assets_north": {"number": 1, "regions": ["North", "Adamawa"]}}
+# Regions not listed stay in "default". A shard's assets are numbered from
+# number * ASSET_SHARD_ID_SPAN, so never renumber a shard. Create a shard with
+# `python manage.py migrate --database=<alias>` and fill it, or move existing
+# assets, with `python manage.py shard_assets`. Empty turns sharding off.
+ASSET_SHARDS = {}
+ASSET_SHARD_ID_SPAN = 10**12
+# Threads running the shard queries of views that span every branch.
+ASSET_SHARD_WORKERS = 8
@@ -0,0 +1,99 @@
+import uuid
+from dataclasses import dataclass
+
+from django.core.cache import cache
+
+
+@dataclass(frozen=True)
+class UserAccess:
+    """A user's resolved role and branch, safe to share for a whole request."""
+
+    role: str = None
+    branch_id: int = None
+
+    @property
+    def is_super_admin(self):
+        return self.role == "super_admin"
+
+    @property
+    def can_view_branches(self):
+        return self.role in ("super_admin", "branch_manager")
+
+
+NO_ACCESS = UserAccess()
+
+
+def resolve_user_access(user):
+    from .models import UserRole
+
+    if not user.is_authenticated:
+        return NO_ACCESS
+    if user.is_superuser:
+        return UserAccess(role="super_admin")
+
+    row = UserRole.objects.filter(user_id=user.pk).values_list("role", "branch_id")
+    row = row.first()
+    if row is None:
+        return NO_ACCESS
+    role, branch_id = row
+    return UserAccess(role=role, branch_id=branch_id)
+
+
+def get_user_access(user):
+    """Resolve ``user``'s access once and cache it on the user instance."""
+    access = getattr(user, "_access", None)
+    if access is None:
+        access = resolve_user_access(user)
+        user._access = access
+    return access
+
+
+SESSION_KEY = "_user_access"
+
+
+def _version_key(user_id):
+    return f"user-access-version:{user_id}"
+
+
+def get_access_version(user_id):
+    """
+    The current version of ``user_id``'s access, shared by every worker
+    through the default cache. A version the cache lost is replaced by a new
+    one, so losing it only costs sessions one lookup of their role.
+    """
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    if version is None:
+        # A cache that stores nothing: never trust a session's copy.
+        version = uuid.uuid4().hex
+    return version
+
+
+def invalidate_user_access(user_id):
+    """Make every session of ``user_id`` re-resolve its access."""
+    cache.set(_version_key(user_id), uuid.uuid4().hex, None)
+
+
+def load_request_access(request):
+    """
+    Resolve the access for ``request.user``, reusing the copy stored in the
+    session until the user's role changes.
+    """
+    user = request.user
+    if not user.is_authenticated:
+        return NO_ACCESS
+    if user.is_superuser:
+        access = UserAccess(role="super_admin")
+    else:
+        version = get_access_version(user.pk)
+        stored = request.session.get(SESSION_KEY)
+        if stored and stored[0] == version:
+            access = UserAccess(role=stored[1], branch_id=stored[2])
+        else:
+            access = resolve_user_access(user)
+            request.session[SESSION_KEY] = [version, access.role, access.branch_id]
+    user._access = access
+    return access
@@ -1,5 +1,9 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR
+from import_export.admin import ImportMixin
 from .models import UserRole, Branch, Asset
+from .resources import AssetResource
+from .search import fts_enabled, fts_query, search_assets
 
 
 @admin.register(UserRole)
@@ -17,8 +21,16 @@ class BranchAdmin(admin.ModelAdmin):
 
 
 @admin.register(Asset)
-class AssetAdmin(admin.ModelAdmin):
+class AssetAdmin(ImportMixin, admin.ModelAdmin):
+    resource_classes = [AssetResource]
     list_display = ("asset_id", "name", "category", "branch", "status", "condition")
     list_filter = ("category", "status", "condition", "branch")
     search_fields = ("asset_id", "name", "serial_number")
     readonly_fields = ("asset_id", "created_by", "created_at", "updated_at")
+
+    def get_search_results(self, request, queryset, search_term):
+        if not fts_enabled(queryset.db) or not fts_query(search_term):
+            return super().get_search_results(request, queryset, search_term)
+        # Rank by relevance unless the user sorted by a column.
+        ranked = ORDER_VAR not in request.GET
+        return search_assets(queryset, search_term, ranked=ranked), False
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class MyappConfig(AppConfig):
     name = 'myapp'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
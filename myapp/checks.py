@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+# Backends whose entries other worker processes cannot see.
+PROCESS_LOCAL_CACHES = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get("default", {}).get("BACKEND")
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [
+        Warning(
+            "The default cache is not shared between worker processes.",
+            hint=(
+                "Sessions keep a user's resolved role until the cache says it "
+                "changed, so with several workers a role change only reaches "
+                "the sessions checked by the worker that saved it. Use a "
+                "shared backend such as FileBasedCache, Redis or Memcached."
+            ),
+            id="myapp.W001",
+        )
+    ]
@@ -0,0 +1,22 @@
+"""Spreadsheet columns shared by the Excel export and the XLSX import."""
+
+# Excel export columns: (header, values_list lookups). Branch needs two
+# lookups to render as "Name (CODE)" without loading Branch instances.
+# xlsx_import reads workbooks by the same headers, so exports round-trip.
+EXCEL_COLUMNS = [
+    ("Asset ID", ("asset_id",)),
+    ("Name", ("name",)),
+    ("Category", ("category",)),
+    ("Branch", ("branch__name", "branch__code")),
+    ("Department", ("department",)),
+    ("Manufacturer", ("brand",)),
+    ("Model", ("model",)),
+    ("Serial Number", ("serial_number",)),
+    ("Purchase Date", ("purchase_date",)),
+    ("Supplier", ("supplier_name",)),
+    ("Custodian Name", ("custodian_name",)),
+    ("Custodian Phone", ("custodian_phone",)),
+    ("Status", ("status",)),
+    ("Condition", ("condition",)),
+    ("Cost", ("purchase_cost",)),
+]
@@ -0,0 +1,5 @@
+from .access import NO_ACCESS
+
+
+def access(request):
+    return {"access": getattr(request, "access", NO_ACCESS)}
@@ -0,0 +1,52 @@
+"""Database aliases registered at runtime, for benchmarks and tests."""
+
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+@contextmanager
+def scratch_database(alias, settings_dict):
+    """Register ``settings_dict`` as database ``alias`` for the block."""
+    configured = connections.configure_settings(
+        {DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS], alias: settings_dict}
+    )
+    connections.settings[alias] = configured[alias]
+    try:
+        yield alias
+    finally:
+        close_connection(alias)
+        del connections.settings[alias]
+
+
+def close_connection(alias):
+    """Close and forget this thread's connection to ``alias``, if any."""
+    try:
+        connection = getattr(connections._connections, alias)
+    except AttributeError:
+        return
+    connection.close()
+    del connections[alias]
+
+
+@contextmanager
+def scratch_default(settings_dict):
+    """
+    Point the ``default`` alias at ``settings_dict`` for the block, so code
+    that only knows ``default`` (views, the test client) runs against it.
+    This thread's existing default connection is set aside untouched and
+    restored afterwards.
+    """
+    configured = connections.configure_settings({DEFAULT_DB_ALIAS: settings_dict})
+    original_settings = connections.settings[DEFAULT_DB_ALIAS]
+    original = getattr(connections._connections, DEFAULT_DB_ALIAS, None)
+    if original is not None:
+        delattr(connections._connections, DEFAULT_DB_ALIAS)
+    connections.settings[DEFAULT_DB_ALIAS] = configured[DEFAULT_DB_ALIAS]
+    try:
+        yield DEFAULT_DB_ALIAS
+    finally:
+        close_connection(DEFAULT_DB_ALIAS)
+        connections.settings[DEFAULT_DB_ALIAS] = original_settings
+        if original is not None:
+            setattr(connections._connections, DEFAULT_DB_ALIAS, original)
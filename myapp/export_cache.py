@@ -0,0 +1,154 @@
+"""
+Disk cache for generated export files.
+
+An entry is keyed by the export kind, its filters, the user's branch scope
+and the scope's export version. Versions live in the default cache, shared
+by every worker, and are replaced when a transaction that writes a branch's
+assets commits: every asset save or delete, ``Asset.objects.update()``, the
+rollup's bulk paths (which bulk imports, sharding and the sample data loader
+all go through) and branch edits. Raw SQL writes must call
+``invalidate_exports`` themselves. So a hit costs no query, and a write only
+regenerates exports that include its branch. Superseded files are never read again; they are evicted
+least recently used first once the directory grows past
+``EXPORT_CACHE_MAX_SIZE``.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+logger = logging.getLogger(__name__)
+
+PARTIAL_SUFFIX = ".part"
+
+
+def _version_key(scope):
+    return f"export-cache-version:{scope}"
+
+
+def get_export_version(scope):
+    """
+    The current export version of ``scope``: a branch ID, or "all" for
+    exports across every branch. A version the cache lost is replaced by a
+    new one, so losing it only costs a regeneration.
+    """
+    key = _version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    if version is None:
+        # A cache that stores nothing: never reuse an export.
+        version = uuid.uuid4().hex
+    return version
+
+
+def invalidate_exports(branch_ids, using=DEFAULT_DB_ALIAS):
+    """
+    Supersede the cached exports that include any of ``branch_ids`` once the
+    current transaction on ``using`` commits, so no export of the old rows
+    can be cached under the new versions.
+    """
+    keys = [_version_key("all")]
+    keys.extend(_version_key(branch_id) for branch_id in set(branch_ids))
+
+    def replace_versions():
+        cache.set_many({key: uuid.uuid4().hex for key in keys}, None)
+
+    transaction.on_commit(replace_versions, using=using)
+
+
+def export_cache_key(kind, params, access):
+    scope = "all" if access.is_super_admin else access.branch_id
+    version = get_export_version(scope)
+    raw = json.dumps([kind, sorted(params.items()), scope, version])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _entries():
+    """Yield ``(path, stat)`` for every finished file in the cache."""
+    try:
+        names = os.listdir(settings.EXPORT_CACHE_DIR)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name.endswith(PARTIAL_SUFFIX):
+            continue
+        path = os.path.join(settings.EXPORT_CACHE_DIR, name)
+        try:
+            yield path, os.stat(path)
+        except FileNotFoundError:
+            continue
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def evict_export_cache(max_size=None):
+    """Delete least recently used files until the cache fits ``max_size``."""
+    if max_size is None:
+        max_size = settings.EXPORT_CACHE_MAX_SIZE
+    entries = sorted(_entries(), key=lambda entry: entry[1].st_mtime)
+    total = sum(stat.st_size for _, stat in entries)
+    for path, stat in entries:
+        if total <= max_size:
+            break
+        _remove(path)
+        total -= stat.st_size
+
+
+def cached_export(key, extension, render):
+    """
+    Return a readable file holding the export for ``key``, calling
+    ``render(output)`` to generate it on a miss. Returns None if rendering
+    reports failure.
+    """
+    cache_dir = settings.EXPORT_CACHE_DIR
+    if not cache_dir:
+        output = tempfile.SpooledTemporaryFile(max_size=settings.EXPORT_SPOOL_MAX_SIZE)
+        if not render(output):
+            output.close()
+            return None
+        output.seek(0)
+        return output
+
+    path = os.path.join(cache_dir, f"{key}.{extension}")
+    try:
+        output = open(path, "rb")
+    except FileNotFoundError:
+        pass
+    else:
+        # The modification time doubles as the last-used time for eviction.
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted since it was opened: regenerate rather than serve it.
+            output.close()
+        else:
+            return output
+
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, partial_path = tempfile.mkstemp(dir=cache_dir, suffix=PARTIAL_SUFFIX)
+    try:
+        with os.fdopen(fd, "wb") as partial:
+            ok = render(partial)
+        if not ok:
+            return None
+        output = open(partial_path, "rb")
+        os.replace(partial_path, path)
+    finally:
+        _remove(partial_path)
+
+    evict_export_cache()
+    return output
@@ -0,0 +1,160 @@
+"""
+Background export jobs.
+
+Exports submitted here are rendered by a small in-process thread pool into
+``MEDIA_ROOT/exports/`` and downloaded later, so a large report never ties
+up a request worker. No external broker is needed: a job that was queued or
+running when its process died is marked failed by ``cleanup_export_jobs``
+once it is older than ``EXPORT_JOB_TIMEOUT``.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .access import get_user_access
+from .metrics import record_export
+from .models import Asset, ExportJob
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("pending", "running")
+
+EXPORT_EXTENSIONS = {
+    "pdf": "pdf",
+    "excel": "xlsx",
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class ExportJobLimitError(Exception):
+    pass
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.EXPORT_JOB_WORKERS,
+                thread_name_prefix="export-job",
+            )
+        return _executor
+
+
+def submit_export(user, kind, params):
+    """
+    Queue an export of ``kind`` for ``user`` with the asset list filters in
+    ``params``, and return the new job.
+    """
+    cleanup_export_jobs()
+
+    # The limits are checked and the job inserted in one transaction, under
+    # the write lock: on SQLite an IMMEDIATE transaction holds the database
+    # lock from its start, and on other backends the user's row is locked,
+    # so concurrent submissions of a user are counted one after another.
+    with transaction.atomic():
+        User.objects.select_for_update().filter(pk=user.pk).exists()
+        active = ExportJob.objects.filter(status__in=ACTIVE_STATUSES)
+        if active.filter(user=user).count() >= settings.EXPORT_JOB_MAX_ACTIVE_PER_USER:
+            raise ExportJobLimitError("You already have exports in progress.")
+        if active.count() >= settings.EXPORT_JOB_MAX_QUEUED:
+            raise ExportJobLimitError("The export queue is full; try again shortly.")
+        job = ExportJob.objects.create(user=user, kind=kind, params=params)
+
+    get_executor().submit(run_export_job, job.pk)
+    return job
+
+
+def run_export_job(job_id):
+    from .export_views import render_assets_pdf, write_assets_excel
+    from .views import filter_assets
+
+    close_old_connections()
+    job = ExportJob.objects.select_related("user").get(pk=job_id)
+    renderers = {
+        "pdf": partial(render_assets_pdf, engine=job.params.get("engine")),
+        "excel": write_assets_excel,
+    }
+    name = f"exports/{job.pk}.{EXPORT_EXTENSIONS[job.kind]}"
+    path = default_storage.path(name)
+    partial_path = f"{path}.part"
+
+    try:
+        assets = filter_assets(
+            Asset.objects.for_user(job.user), job.params, get_user_access(job.user)
+        )
+        job.rows_total = assets.count()
+        job.status = "running"
+        job.started_at = timezone.now()
+        job.save(update_fields=["rows_total", "status", "started_at"])
+
+        def progress(rows_done):
+            ExportJob.objects.filter(pk=job.pk).update(rows_done=rows_done)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        started = time.monotonic()
+        with open(partial_path, "wb") as output:
+            ok = renderers[job.kind](assets, output, progress=progress)
+        if not ok:
+            raise RuntimeError(f"Error generating {job.get_kind_display()} export")
+        os.replace(partial_path, path)
+        record_export(
+            job.kind,
+            job.rows_total,
+            os.path.getsize(path),
+            time.monotonic() - started,
+        )
+
+        job.file.name = name
+        job.status = "done"
+        job.rows_done = job.rows_total
+    except Exception as exc:
+        logger.exception("Export job %s failed", job.pk)
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        job.status = "failed"
+        job.error = str(exc)
+    finally:
+        job.finished_at = timezone.now()
+        job.expires_at = job.finished_at + timedelta(seconds=settings.EXPORT_JOB_TTL)
+        job.save()
+        connection.close()
+
+
+def cleanup_export_jobs():
+    """
+    Delete expired jobs and their files, and fail jobs that were lost when
+    their worker process stopped. Returns the number of jobs deleted.
+    """
+    now = timezone.now()
+    ExportJob.objects.filter(
+        status__in=ACTIVE_STATUSES,
+        created_at__lt=now - timedelta(seconds=settings.EXPORT_JOB_TIMEOUT),
+    ).update(
+        status="failed",
+        error="The export did not finish in time.",
+        finished_at=now,
+        expires_at=now + timedelta(seconds=settings.EXPORT_JOB_TTL),
+    )
+
+    expired = ExportJob.objects.filter(expires_at__lt=now)
+    deleted = 0
+    for job in expired.iterator():
+        if job.file:
+            job.file.delete(save=False)
+        job.delete()
+        deleted += 1
+    return deleted
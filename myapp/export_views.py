@@ -1,12 +1,43 @@
+import csv
+import io
+import json
 import os
+from itertools import chain, islice
 from django.conf import settings
-from django.http import HttpResponse
+from django.contrib.auth.decorators import login_required
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import require_GET, require_POST
 from django.template.loader import get_template
 from xhtml2pdf import pisa
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
 import openpyxl
-from .models import Asset
-from datetime import datetime
+from django.db import connections
+from django.db.models import CharField
+from django.db.models.functions import Cast
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .export_cache import cached_export, export_cache_key
+from .columns import EXCEL_COLUMNS
+from .export_jobs import ExportJobLimitError, submit_export
+from .metrics import record_export, record_export_cache
+from .models import Asset, ExportJob
+from .pdf_reports import render_assets_pdf_reportlab
+from .timing import timed
+from .views import asset_filter_params, filter_assets
+from datetime import datetime, time, timezone as dt_timezone
+from decimal import Decimal
+from time import monotonic
 
 
 def link_callback(uri, rel):
@@ -20,96 +51,440 @@ def link_callback(uri, rel):
     return path
 
 
-def export_assets_pdf(request):
-    assets = Asset.objects.all()
-
+def render_assets_pdf_xhtml2pdf(assets, output, progress=None):
+    """
+    Render the inventory report for ``assets`` into ``output`` and return
+    True on success. xhtml2pdf renders in one step, so ``progress`` is only
+    called once, with the number of rows, when the report is laid out.
+    """
     now = datetime.now()
     current_inventory_period = now.strftime("%B %Y").upper()
     template_path = "assets_pdf_template.html"
+    rows = list(assets.select_related("branch"))
     context = {
-        "assets": assets,
+        "assets": rows,
         "report_period": current_inventory_period,
         "generated_at": now,
     }
 
-    response = HttpResponse(content_type="application/pdf")
-    response["Content-Disposition"] = 'attachment; filename="inventory_report.pdf"'
-
     template = get_template(template_path)
     html = template.render(context)
 
-    pisa_status = pisa.CreatePDF(html, dest=response, link_callback=link_callback)
+    pisa_status = pisa.CreatePDF(html, dest=output, link_callback=link_callback)
+    if progress is not None:
+        progress(len(rows))
+    return not pisa_status.err
+
+
+def export_queryset(request):
+    """
+    The assets the user is looking at in the asset list: their branch scope
+    narrowed by the list's search and filters.
+    """
+    return filter_assets(
+        Asset.objects.for_user(request.user), request.GET, request.access
+    )
+
+
+def _cached_export(request, kind, extension, render):
+    key = export_cache_key(kind, asset_filter_params(request.GET), request.access)
+    name = kind.split(":")[0]
+    rendered = False
+    rows = 0
+
+    def count_rows(done):
+        nonlocal rows
+        rows = done
+
+    def measured_render(output):
+        nonlocal rendered
+        rendered = True
+        started = monotonic()
+        with timed(name):
+            ok = render(output, count_rows)
+        if ok:
+            record_export(
+                name,
+                rows,
+                output.seek(0, os.SEEK_END),
+                monotonic() - started,
+            )
+        return ok
 
-    if pisa_status.err:
+    output = cached_export(key, extension, measured_render)
+    record_export_cache(name, hit=not rendered)
+    return output
+
+
+PDF_ENGINES = {
+    "xhtml2pdf": render_assets_pdf_xhtml2pdf,
+    "reportlab": render_assets_pdf_reportlab,
+}
+
+
+def render_assets_pdf(assets, output, progress=None, engine=None):
+    """
+    Render the inventory report with ``engine``, or ``ASSET_PDF_ENGINE``
+    when it is not given.
+    """
+    renderer = PDF_ENGINES[engine or settings.ASSET_PDF_ENGINE]
+    return renderer(assets, output, progress=progress)
+
+
+@login_required
+def export_assets_pdf(request):
+    engine = request.GET.get("engine") or settings.ASSET_PDF_ENGINE
+    if engine not in PDF_ENGINES:
+        return HttpResponseBadRequest("Unknown PDF engine.")
+
+    assets = export_queryset(request)
+
+    # The title shows the month the report was generated in.
+    output = _cached_export(
+        request,
+        f"pdf:{engine}:{datetime.now():%Y-%m}",
+        "pdf",
+        lambda output, progress: render_assets_pdf(
+            assets, output, progress=progress, engine=engine
+        ),
+    )
+    if output is None:
         return HttpResponse("Error generating PDF", status=500)
-    return response
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename="inventory_report.pdf",
+        content_type="application/pdf",
+    )
+
+
+# Widths are estimated from the header and the first rows, because a
+# write-only worksheet must declare its columns before any row is written.
+EXCEL_WIDTH_SAMPLE_ROWS = 1000
+EXCEL_MAX_COLUMN_WIDTH = 60
+
+
+def iter_excel_rows(assets):
+    """Yield one list of cell values per asset, without building instances."""
+    lookups = [lookup for _, column in EXCEL_COLUMNS for lookup in column]
+    categories = dict(Asset.CATEGORY_CHOICES)
+    departments = dict(Asset.DEPARTMENT_CHOICES)
+    statuses = dict(Asset.STATUS_CHOICES)
+    conditions = dict(Asset.CONDITION_CHOICES)
+
+    rows = assets.values_list(*lookups).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    for (
+        asset_id,
+        name,
+        category,
+        branch_name,
+        branch_code,
+        department,
+        brand,
+        model,
+        serial_number,
+        purchase_date,
+        supplier_name,
+        custodian_name,
+        custodian_phone,
+        status,
+        condition,
+        purchase_cost,
+    ) in rows:
+        yield [
+            asset_id,
+            name,
+            categories.get(category, category),
+            f"{branch_name} ({branch_code})",
+            departments.get(department, department),
+            brand,
+            model,
+            serial_number,
+            purchase_date.strftime("%Y-%m-%d") if purchase_date else "",
+            supplier_name,
+            custodian_name,
+            custodian_phone,
+            statuses.get(status, status),
+            conditions.get(condition, condition),
+            purchase_cost,
+        ]
+
+
+def write_assets_excel(assets, output, progress=None):
+    """
+    Write the asset inventory workbook to ``output`` in bounded memory.
+
+    ``progress``, if given, is called with the number of rows written after
+    every ``EXPORT_CHUNK_SIZE`` rows and once all of them are written.
+    """
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Assets")
 
+    headers = [header for header, _ in EXCEL_COLUMNS]
+    rows = iter_excel_rows(assets)
+    sample = list(islice(rows, EXCEL_WIDTH_SAMPLE_ROWS))
 
+    widths = [len(header) for header in headers]
+    for row in sample:
+        for index, value in enumerate(row):
+            widths[index] = max(widths[index], len(str(value)))
+    for index, width in enumerate(widths, start=1):
+        ws.column_dimensions[get_column_letter(index)].width = min(
+            width + 2, EXCEL_MAX_COLUMN_WIDTH
+        )
+
+    header_cells = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = Font(bold=True)
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    chunk_size = settings.EXPORT_CHUNK_SIZE
+    count = 0
+    for count, row in enumerate(chain(sample, rows), start=1):
+        ws.append(row)
+        if progress is not None and count % chunk_size == 0:
+            progress(count)
+    if progress is not None and count % chunk_size:
+        progress(count)
+
+    wb.save(output)
+    return True
+
+
+@login_required
 def export_assets_excel(request):
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    assets = export_queryset(request)
+
+    # Rows are streamed into a file that is reused until the data changes,
+    # then sent to the client in blocks.
+    output = _cached_export(
+        request,
+        "excel",
+        "xlsx",
+        lambda output, progress: write_assets_excel(assets, output, progress=progress),
     )
-    response["Content-Disposition"] = 'attachment; filename="assets_inventory.xlsx"'
-
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Assets"
-
-    # 1. Define Headers (Exactly matching your <thead>)
-    columns = [
-        "Asset ID",
-        "Name",
-        "Branch",
-        "Department",
-        "Manufacturer",
-        "Serial Number",
-        "Purchase Date",
-        "Custodian Name",
-        "Custodian Phone",
-        "Status",
-        "Condition",
-        "Cost",
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename="assets_inventory.xlsx",
+        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
+
+
+# Machine-readable dump columns: (output name, values_list lookup).
+DUMP_FIELDS = [
+    ("asset_id", "asset_id"),
+    ("name", "name"),
+    ("category", "category"),
+    ("brand", "brand"),
+    ("model", "model"),
+    ("serial_number", "serial_number"),
+    ("branch_code", "branch__code"),
+    ("branch_name", "branch__name"),
+    ("department", "department"),
+    ("purchase_date", "purchase_date"),
+    ("purchase_cost", "purchase_cost"),
+    ("supplier_name", "supplier_name"),
+    ("status", "status"),
+    ("condition", "condition"),
+    ("custodian_name", "custodian_name"),
+    ("custodian_phone", "custodian_phone"),
+    ("created_at", "created_at"),
+    ("updated_at", "updated_at"),
+]
+
+# On SQLite, non-text columns are cast to text in SQL, which skips Django's
+# per-row date/decimal converters that otherwise dominate the dump time. The
+# text is then put in the same form as native values would be: decimals with
+# the field's decimal places, dates and datetimes as ISO 8601 in UTC.
+DUMP_CAST_TO_TEXT = {"purchase_date", "purchase_cost", "created_at", "updated_at"}
+
+
+def format_dump_date(value):
+    if value is None or isinstance(value, str):
+        return value
+    return value.isoformat()
+
+
+def format_dump_datetime(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        # SQLite's text form of a UTC datetime, "YYYY-MM-DD HH:MM:SS[.ffffff]".
+        return f"{value[:10]}T{value[11:]}+00:00"
+    return value.astimezone(dt_timezone.utc).isoformat()
+
+
+def dump_decimal_format(field):
+    places = f".{field.decimal_places}f"
+
+    def format_decimal(value):
+        if value is None:
+            return None
+        return format(Decimal(value), places)
+
+    return format_decimal
+
+
+DUMP_FORMATS = {
+    "purchase_date": format_dump_date,
+    "purchase_cost": dump_decimal_format(Asset._meta.get_field("purchase_cost")),
+    "created_at": format_dump_datetime,
+    "updated_at": format_dump_datetime,
+}
+
+
+def parse_updated_since(value):
+    """Parse an ISO date or datetime; dates mean midnight in the current zone."""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def dump_queryset(request):
+    assets = export_queryset(request)
+    updated_since = request.GET.get("updated_since")
+    if updated_since:
+        # Oldest changes first so consumers can checkpoint on updated_at.
+        assets = assets.filter(
+            updated_at__gte=parse_updated_since(updated_since)
+        ).order_by("updated_at", "id")
+    return assets
+
+
+def iter_dump_chunks(assets):
+    """Yield lists of row lists, one database chunk at a time."""
+    aliases = getattr(assets, "databases", None) or [assets.db]
+    cast = all(connections[alias].vendor == "sqlite" for alias in aliases)
+    lookups = []
+    casts = {}
+    for name, lookup in DUMP_FIELDS:
+        if cast and lookup in DUMP_CAST_TO_TEXT:
+            casts[f"{name}_text"] = Cast(lookup, CharField())
+            lookups.append(f"{name}_text")
+        else:
+            lookups.append(lookup)
+    formats = [
+        (index, DUMP_FORMATS[lookup])
+        for index, (_, lookup) in enumerate(DUMP_FIELDS)
+        if lookup in DUMP_FORMATS
     ]
-    ws.append(columns)
 
-    # 2. Make Headers Bold
-    for cell in ws[1]:
-        cell.font = Font(bold=True)
+    chunk_size = settings.EXPORT_CHUNK_SIZE
+    rows = assets.annotate(**casts).values_list(*lookups).iterator(chunk_size)
+    while True:
+        chunk = [list(row) for row in islice(rows, chunk_size)]
+        if not chunk:
+            return
+        for row in chunk:
+            for index, format_value in formats:
+                row[index] = format_value(row[index])
+        yield chunk
+
 
-    # 3. Pull Data and Map to Columns
-    # Using select_related('branch') to avoid N+1 database queries
-    assets = Asset.objects.all().select_related("branch")
-
-    for asset in assets:
-        ws.append(
-            [
-                asset.asset_id,
-                asset.name,
-                str(asset.branch),
-                asset.get_department_display(),  # Assuming choices
-                asset.brand,  # Maps to "Manufacturer"
-                asset.serial_number,
-                asset.purchase_date.strftime("%Y-%m-%d") if asset.purchase_date else "",
-                asset.custodian_name,
-                asset.custodian_phone,
-                asset.get_status_display(),
-                asset.get_condition_display(),
-                asset.purchase_cost,
-            ]
+def _stream_csv(assets):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in DUMP_FIELDS])
+    for chunk in iter_dump_chunks(assets):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _stream_ndjson(assets):
+    names = [name for name, _ in DUMP_FIELDS]
+    dumps = json.dumps
+    for chunk in iter_dump_chunks(assets):
+        yield "".join(
+            dumps(dict(zip(names, row)), ensure_ascii=False) + "\n" for row in chunk
         )
 
-    # 4. Optional: Auto-adjust column widths for readability
-    for col in ws.columns:
-        max_length = 0
-        column = col[0].column_letter  # Get the column name
-        for cell in col:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = max_length + 2
-        ws.column_dimensions[column].width = adjusted_width
-
-    wb.save(response)
+
+def _dump_response(request, stream, content_type, filename):
+    try:
+        assets = dump_queryset(request)
+    except ValueError:
+        return HttpResponseBadRequest("updated_since must be an ISO date or datetime.")
+    response = StreamingHttpResponse(stream(assets), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
     return response
+
+
+@login_required
+def export_assets_csv(request):
+    return _dump_response(request, _stream_csv, "text/csv", "assets.csv")
+
+
+@login_required
+def export_assets_ndjson(request):
+    return _dump_response(
+        request, _stream_ndjson, "application/x-ndjson", "assets.ndjson"
+    )
+
+
+def _job_payload(job):
+    payload = {
+        "id": str(job.pk),
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress,
+        "rows_done": job.rows_done,
+        "rows_total": job.rows_total,
+        "status_url": reverse("export_job_status", args=[job.pk]),
+        "download_url": None,
+        "error": job.error,
+    }
+    if job.status == "done":
+        payload["download_url"] = reverse("export_job_download", args=[job.pk])
+    return payload
+
+
+@login_required
+@require_POST
+def export_job_submit(request):
+    kind = request.POST.get("kind", "")
+    if kind not in dict(ExportJob.KIND_CHOICES):
+        return JsonResponse({"error": "Unknown export type."}, status=400)
+
+    params = asset_filter_params(request.GET)
+    if kind == "pdf":
+        # The job renders with the engine chosen when it was submitted.
+        params["engine"] = request.GET.get("engine") or settings.ASSET_PDF_ENGINE
+        if params["engine"] not in PDF_ENGINES:
+            return JsonResponse({"error": "Unknown PDF engine."}, status=400)
+    try:
+        job = submit_export(request.user, kind, params)
+    except ExportJobLimitError as exc:
+        return JsonResponse({"error": str(exc)}, status=429)
+    return JsonResponse(_job_payload(job), status=202)
+
+
+@login_required
+@require_GET
+def export_job_status(request, job_id):
+    job = get_object_or_404(ExportJob, pk=job_id, user=request.user)
+    return JsonResponse(_job_payload(job))
+
+
+@login_required
+@require_GET
+def export_job_download(request, job_id):
+    job = get_object_or_404(ExportJob, pk=job_id, user=request.user, status="done")
+    try:
+        output = job.file.open("rb")
+    except FileNotFoundError:
+        raise Http404
+    return FileResponse(
+        output, as_attachment=True, filename=os.path.basename(job.file.name)
+    )
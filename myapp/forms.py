@@ -1,6 +1,8 @@
 from django import forms
+from django.conf import settings
 from django.contrib.auth.models import User
 from .models import Branch, Asset, UserRole
+from .sharding import shard_for_region
 
 
 class BranchForm(forms.ModelForm):
@@ -37,6 +39,21 @@ class BranchForm(forms.ModelForm):
             "status": forms.Select(attrs={"class": "form-select"}),
         }
 
+    def clean_region(self):
+        region = self.cleaned_data["region"]
+        branch = self.instance
+        if branch.pk is None or not settings.ASSET_SHARDS:
+            return region
+        # The instance still has the saved region here.
+        old_shard = shard_for_region(branch.region)
+        if shard_for_region(region) != old_shard:
+            if Asset.objects.using(old_shard).filter(branch_id=branch.pk).exists():
+                raise forms.ValidationError(
+                    "This branch has assets stored with its current region, so "
+                    "it cannot move to a region stored in another database."
+                )
+        return region
+
 
 class AssetForm(forms.ModelForm):
     class Meta:
@@ -93,3 +110,18 @@ class AssetForm(forms.ModelForm):
             ),
             "user_manual": forms.FileInput(attrs={"class": "form-control"}),
         }
+
+    def clean_serial_number(self):
+        serial_number = self.cleaned_data["serial_number"]
+        # The model's own unique check only looks in the default database.
+        for alias in settings.ASSET_SHARDS:
+            taken = (
+                Asset.objects.using(alias)
+                .filter(serial_number=serial_number)
+                .exclude(pk=self.instance.pk)
+            )
+            if taken.exists():
+                raise forms.ValidationError(
+                    "Asset with this Serial number already exists."
+                )
+        return serial_number
@@ -0,0 +1,342 @@
+import json
+import math
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from myapp import sample_data
+from myapp.databases import scratch_default
+from myapp.metrics import get_store
+from myapp.models import Asset
+
+ROLES = ["super_admin", "branch_manager", "inventory_officer"]
+VIEWS = [
+    "dashboard",
+    "asset_list",
+    "asset_detail",
+    "branch_list",
+    "export_assets_pdf",
+    "export_assets_excel",
+]
+EXPORT_VIEWS = {"export_assets_pdf", "export_assets_excel"}
+
+# Metrics compared against a baseline (higher is worse for all of them),
+# with the smallest increase that counts as a regression whatever the
+# threshold, so sub-millisecond noise is not reported. Query counts are
+# exact, so any increase is a regression.
+COMPARED_METRICS = {"p95_ms": 2, "queries": 0, "sql_ms": 1, "peak_memory_kb": 64}
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of ``values``."""
+    ordered = sorted(values)
+    index = max(0, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+class QueryTimer:
+    """Database execute wrapper counting queries and the time spent in them."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure view latency, SQL queries and memory per role at several "
+        "dataset sizes, each in a scratch SQLite database with the "
+        "DATABASES['default'] profile. The configured databases, cache, "
+        "metrics and profiles are never touched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=int,
+            nargs="+",
+            default=[1000, 10000, 100000],
+            help="Asset counts to benchmark.",
+        )
+        parser.add_argument(
+            "--branches", type=int, default=10, help="Branches per dataset."
+        )
+        parser.add_argument("--roles", nargs="+", choices=ROLES, default=ROLES)
+        parser.add_argument("--views", nargs="+", choices=VIEWS, default=VIEWS)
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=20,
+            help="Timed requests per view, role and size.",
+        )
+        parser.add_argument(
+            "--export-iterations",
+            type=int,
+            default=3,
+            help="Timed requests per export view, role and size.",
+        )
+        parser.add_argument(
+            "--pdf-max-rows",
+            type=int,
+            default=10000,
+            help="Skip the PDF export above this many assets (0 runs every size).",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", metavar="PATH", help="Write a JSON report.")
+        parser.add_argument(
+            "--baseline",
+            metavar="PATH",
+            help="Compare with an earlier JSON report and fail on regressions.",
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.25,
+            help="Allowed increase in latency, SQL time and memory over the "
+            "baseline, as a fraction.",
+        )
+
+    def handle(self, *args, **options):
+        default = settings.DATABASES["default"]
+        if default["ENGINE"] != "django.db.backends.sqlite3":
+            raise CommandError("The default database is not SQLite.")
+        sizes = sorted(options["sizes"])
+        if sizes[0] < 1 or options["branches"] < 1:
+            raise CommandError("--sizes and --branches must be positive.")
+        if options["iterations"] < 1 or options["export_iterations"] < 1:
+            raise CommandError("Iterations must be positive.")
+
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                baseline = json.load(f)
+
+        results = []
+        directory = tempfile.mkdtemp()
+        # Exports are measured rendering, not served from the disk cache, and
+        # slow requests are reported here rather than logged. Everything the
+        # requests write goes to the scratch directory.
+        overrides = override_settings(
+            EXPORT_CACHE_DIR=None,
+            REQUEST_TIMING_SLOW_MS=None,
+            READ_REPLICA_ENABLED=False,
+            ASSET_SHARDS={},
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                    "LOCATION": "bench",
+                }
+            },
+            METRICS_DB_PATH=os.path.join(directory, "metrics.sqlite3"),
+            PROFILE_DIR=os.path.join(directory, "profiles"),
+            MEDIA_ROOT=os.path.join(directory, "media"),
+        )
+        try:
+            with overrides:
+                template = os.path.join(directory, "template.sqlite3")
+                with scratch_default(self.scratch_settings(template)):
+                    call_command("migrate", verbosity=0)
+                for size in sizes:
+                    path = os.path.join(directory, f"bench_{size}.sqlite3")
+                    shutil.copyfile(template, path)
+                    with scratch_default(self.scratch_settings(path)):
+                        results.extend(self.run_size(size, options))
+                store = get_store()
+                if store is not None:
+                    store.flush()
+        finally:
+            shutil.rmtree(directory)
+
+        report = {
+            "meta": {
+                "generated_at": timezone.now().isoformat(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+                "branches": options["branches"],
+                "seed": options["seed"],
+                "iterations": options["iterations"],
+                "export_iterations": options["export_iterations"],
+            },
+            "results": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+                f.write("\n")
+            self.stdout.write(f"Wrote {options['output']}")
+
+        if baseline is not None:
+            regressions = self.compare(baseline, results, options["threshold"])
+            if regressions:
+                raise CommandError(
+                    f"{regressions} regressions against {options['baseline']}."
+                )
+            self.stdout.write(self.style.SUCCESS("✓ No regressions against baseline"))
+
+    def scratch_settings(self, path):
+        """The configured default database profile, on the file at ``path``."""
+        default = settings.DATABASES["default"]
+        return {
+            "ENGINE": default["ENGINE"],
+            "NAME": path,
+            "OPTIONS": default.get("OPTIONS", {}),
+            "CONN_MAX_AGE": default.get("CONN_MAX_AGE", 0),
+            "CONN_HEALTH_CHECKS": default.get("CONN_HEALTH_CHECKS", False),
+        }
+
+    def run_size(self, size, options):
+        branch_count = options["branches"]
+        _, users, _ = sample_data.populate(
+            branch_count, size, users=2 * branch_count + 1, seed=options["seed"]
+        )
+
+        results = []
+        for role in options["roles"]:
+            user = self.user_for(role, users)
+            client = Client()
+            client.force_login(user)
+            for view in options["views"]:
+                limit = options["pdf_max_rows"]
+                if view == "export_assets_pdf" and limit and size > limit:
+                    self.stdout.write(
+                        f"{size:>8} {role:<18} {view:<20} skipped "
+                        f"(above --pdf-max-rows {limit})"
+                    )
+                    continue
+                if view in EXPORT_VIEWS:
+                    iterations, warmup = options["export_iterations"], 0
+                else:
+                    iterations, warmup = options["iterations"], 1
+                result = self.measure(
+                    client, self.url_for(view, user), iterations, warmup
+                )
+                result.update(size=size, role=role, view=view)
+                self.report(result)
+                results.append(result)
+        return results
+
+    def user_for(self, role, users):
+        """A user with ``role``; branch roles belong to the largest branch."""
+        if role == "super_admin":
+            return next(user for user, user_role, _ in users if user_role == role)
+        largest = (
+            Asset.objects.filter(branch__in={branch for _, _, branch in users})
+            .values("branch_id")
+            .annotate(assets=Count("pk"))
+            .order_by("-assets", "branch_id")
+            .values_list("branch_id", flat=True)
+            .first()
+        )
+        return next(
+            user
+            for user, user_role, branch in users
+            if user_role == role and branch is not None and branch.pk == largest
+        )
+
+    def url_for(self, view, user):
+        if view == "asset_detail":
+            asset = Asset.objects.for_user(user).values_list("pk", flat=True).first()
+            return reverse(view, args=[asset])
+        if view == "export_assets_pdf":
+            return reverse(view) + "?engine=reportlab"
+        return reverse(view)
+
+    def fetch(self, client, url):
+        response = client.get(url)
+        # The test client closes streaming responses once they are consumed.
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response
+
+    def measure(self, client, url, iterations, warmup):
+        for _ in range(warmup):
+            self.fetch(client, url)
+
+        latencies = []
+        queries = []
+        sql_times = []
+        for _ in range(iterations):
+            timer = QueryTimer()
+            with connection.execute_wrapper(timer):
+                started = time.perf_counter()
+                response = self.fetch(client, url)
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(timer.count)
+            sql_times.append(timer.seconds * 1000)
+
+        # Memory is traced in a separate request, as tracing slows every
+        # allocation down and would distort the timings.
+        tracemalloc.start()
+        try:
+            baseline, _ = tracemalloc.get_traced_memory()
+            self.fetch(client, url)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            "status": response.status_code,
+            "requests": iterations,
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "queries": max(queries),
+            "sql_ms": round(statistics.median(sql_times), 2),
+            "peak_memory_kb": round((peak - baseline) / 1024),
+        }
+
+    def report(self, result):
+        self.stdout.write(
+            f"{result['size']:>8} {result['role']:<18} {result['view']:<20} "
+            f"{result['status']} p50 {result['p50_ms']:8.1f}ms "
+            f"p95 {result['p95_ms']:8.1f}ms p99 {result['p99_ms']:8.1f}ms "
+            f"{result['queries']:4d} queries {result['sql_ms']:7.1f}ms SQL "
+            f"{result['peak_memory_kb']:7d} KB"
+        )
+
+    def compare(self, baseline, results, threshold):
+        previous = {
+            (result["size"], result["role"], result["view"]): result
+            for result in baseline["results"]
+        }
+        regressions = 0
+        for result in results:
+            old = previous.get((result["size"], result["role"], result["view"]))
+            if old is None:
+                continue
+            for metric, floor in COMPARED_METRICS.items():
+                before, after = old[metric], result[metric]
+                allowed = 0 if metric == "queries" else before * threshold
+                if after > before + max(allowed, floor):
+                    regressions += 1
+                    self.stdout.write(
+                        self.style.ERROR(
+                            f"{result['size']:>8} {result['role']:<18} "
+                            f"{result['view']:<20} {metric}: {before} -> {after}"
+                        )
+                    )
+        return regressions
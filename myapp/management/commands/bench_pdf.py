@@ -0,0 +1,115 @@
+import datetime
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from myapp.export_views import PDF_ENGINES, render_assets_pdf
+from myapp.models import Asset, Branch
+
+BENCH_BRANCHES = 10
+
+
+class Command(BaseCommand):
+    help = "Time the PDF export engines on generated assets (nothing is saved)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            nargs="+",
+            default=[1000, 10000, 100000],
+            help="Row counts to benchmark.",
+        )
+        parser.add_argument(
+            "--engines",
+            nargs="+",
+            choices=sorted(PDF_ENGINES),
+            default=sorted(PDF_ENGINES),
+        )
+        parser.add_argument(
+            "--xhtml2pdf-max-rows",
+            type=int,
+            default=10000,
+            help="Skip xhtml2pdf above this many rows (0 runs every size); "
+            "it needs hours and several GB of memory at 100k rows.",
+        )
+
+    def handle(self, *args, **options):
+        sizes = sorted(options["rows"])
+        if sizes[0] < 1:
+            raise CommandError("--rows must be positive.")
+
+        # Everything is generated inside a transaction that is rolled back,
+        # so the benchmark can run against any database without leaving rows.
+        with transaction.atomic():
+            branches = self.create_branches()
+            created = 0
+            for size in sizes:
+                self.create_assets(branches, created, size)
+                created = size
+                assets = Asset.objects.filter(branch__in=branches).order_by("pk")
+                for engine in options["engines"]:
+                    limit = options["xhtml2pdf_max_rows"]
+                    if engine == "xhtml2pdf" and limit and size > limit:
+                        self.stdout.write(
+                            f"{engine:>10} {size:>8} rows: skipped "
+                            f"(above --xhtml2pdf-max-rows {limit})"
+                        )
+                        continue
+                    self.run(engine, assets, size)
+            transaction.set_rollback(True)
+
+    def run(self, engine, assets, size):
+        with tempfile.TemporaryFile() as output:
+            started = time.perf_counter()
+            ok = render_assets_pdf(assets, output, engine=engine)
+            elapsed = time.perf_counter() - started
+            output_size = output.tell()
+
+        if not ok:
+            self.stdout.write(self.style.ERROR(f"{engine:>10} {size:>8} rows: failed"))
+            return
+        self.stdout.write(
+            f"{engine:>10} {size:>8} rows: {elapsed:8.2f}s "
+            f"{size / elapsed:9.0f} rows/s {output_size / 1024 / 1024:8.1f} MB"
+        )
+
+    def create_branches(self):
+        return Branch.objects.bulk_create(
+            Branch(
+                name=f"Benchmark Hospital {i:02d}",
+                code=f"BENCH-{i:02d}",
+                city="Yaoundé",
+                region="Centre",
+                manager_name="Benchmark",
+                manager_phone="+237 600 000 000",
+            )
+            for i in range(BENCH_BRANCHES)
+        )
+
+    def create_assets(self, branches, start, stop):
+        statuses = [value for value, _ in Asset.STATUS_CHOICES]
+        categories = [value for value, _ in Asset.CATEGORY_CHOICES]
+        departments = [value for value, _ in Asset.DEPARTMENT_CHOICES]
+        Asset.objects.bulk_create(
+            (
+                Asset(
+                    asset_id=f"AST-BENCH-{i:07d}",
+                    name=f"Benchmark Equipment {i}",
+                    category=categories[i % len(categories)],
+                    brand="Benchmark Medical",
+                    serial_number=f"BENCH-SN-{i:07d}",
+                    branch=branches[i % len(branches)],
+                    department=departments[i % len(departments)],
+                    purchase_date=datetime.date(2024, 1, 1),
+                    purchase_cost=1000 + i % 5000,
+                    supplier_name="Benchmark Supplier",
+                    status=statuses[i % len(statuses)],
+                    custodian_name="Benchmark Custodian",
+                    custodian_phone="+237 600 000 000",
+                )
+                for i in range(start, stop)
+            ),
+            batch_size=1000,
+        )
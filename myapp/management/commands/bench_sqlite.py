@@ -0,0 +1,224 @@
+import math
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+from django.test.utils import override_settings
+from myapp import sample_data
+from myapp.databases import close_connection, scratch_database
+from myapp.models import Asset, AssetRollup, Branch
+
+STATUSES = [value for value, _ in Asset.STATUS_CHOICES]
+CONDITIONS = [value for value, _ in Asset.CONDITION_CHOICES]
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of ``values``."""
+    ordered = sorted(values)
+    index = max(0, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+class WorkerStats:
+    def __init__(self):
+        self.reads = []
+        self.writes = []
+        self.lock_errors = 0
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent asset reads and edits against scratch copies of the "
+        "schema, once with Django's stock SQLite settings and once with the "
+        "DATABASES['default'] profile, and compare throughput and "
+        "'database is locked' errors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument(
+            "--operations", type=int, default=200, help="Operations per thread."
+        )
+        parser.add_argument(
+            "--write-ratio",
+            type=float,
+            default=0.25,
+            help="Fraction of operations that edit an asset.",
+        )
+        parser.add_argument("--assets", type=int, default=5000)
+        parser.add_argument("--branches", type=int, default=10)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        default = settings.DATABASES["default"]
+        if default["ENGINE"] != "django.db.backends.sqlite3":
+            raise CommandError("The default database is not SQLite.")
+        if options["threads"] < 1 or options["operations"] < 1:
+            raise CommandError("--threads and --operations must be positive.")
+
+        profiles = {
+            "stock": {"ENGINE": default["ENGINE"]},
+            "tuned": {
+                "ENGINE": default["ENGINE"],
+                "OPTIONS": default.get("OPTIONS", {}),
+                "CONN_MAX_AGE": default.get("CONN_MAX_AGE", 0),
+                "CONN_HEALTH_CHECKS": default.get("CONN_HEALTH_CHECKS", False),
+            },
+        }
+
+        directory = tempfile.mkdtemp()
+        try:
+            # Edits are measured writing the database, not clearing exports.
+            with override_settings(EXPORT_CACHE_DIR=None):
+                template = os.path.join(directory, "template.sqlite3")
+                self.stdout.write("Preparing the scratch database…")
+                self.prepare(template, options)
+
+                results = {}
+                for name, profile in profiles.items():
+                    path = os.path.join(directory, f"{name}.sqlite3")
+                    shutil.copyfile(template, path)
+                    with scratch_database(f"bench_{name}", {**profile, "NAME": path}):
+                        results[name] = self.run_profile(f"bench_{name}", options)
+                    self.report(name, results[name], options)
+        finally:
+            shutil.rmtree(directory)
+
+        stock, tuned = results["stock"], results["tuned"]
+        gain = tuned["ops_per_second"] / stock["ops_per_second"]
+        self.stdout.write(f"Tuned throughput: {gain:.2f}x stock")
+        if tuned["lock_errors"]:
+            raise CommandError(
+                f"{tuned['lock_errors']} 'database is locked' errors with the "
+                "configured profile."
+            )
+        self.stdout.write(
+            self.style.SUCCESS("✓ No lock errors with the configured profile")
+        )
+
+    def prepare(self, path, options):
+        rng = random.Random(options["seed"])
+        with scratch_database(
+            "bench_template",
+            {"NAME": path, "ENGINE": settings.DATABASES["default"]["ENGINE"]},
+        ) as alias:
+            call_command("migrate", database=alias, verbosity=0)
+            branches = Branch.objects.using(alias).bulk_create(
+                sample_data.generate_branches(rng, options["branches"])
+            )
+            assets = []
+            for batch in sample_data.generate_asset_rows(
+                rng, branches, [], options["assets"]
+            ):
+                for row in batch:
+                    values = dict(zip(sample_data.ASSET_FIELDS, row))
+                    branch_id = values.pop("branch")
+                    # Timestamps are left to the model.
+                    for field in ("created_by", "created_at", "updated_at"):
+                        del values[field]
+                    assets.append(Asset(branch_id=branch_id, **values))
+            for number, asset in enumerate(assets, start=1):
+                asset.asset_id = f"AST-BENCH-{number:07d}"
+            with transaction.atomic(using=alias):
+                Asset.objects.using(alias).bulk_create(assets)
+                AssetRollup.objects.db_manager(alias).add_assets(assets)
+
+    def run_profile(self, alias, options):
+        asset_ids = list(Asset.objects.using(alias).values_list("pk", flat=True))
+        branch_ids = list(Branch.objects.using(alias).values_list("pk", flat=True))
+        close_connection(alias)
+
+        threads = options["threads"]
+        stats = [WorkerStats() for _ in range(threads)]
+        barrier = threading.Barrier(threads + 1)
+        workers = [
+            threading.Thread(
+                target=self.work,
+                args=(
+                    alias,
+                    options,
+                    options["seed"] + i,
+                    asset_ids,
+                    branch_ids,
+                    barrier,
+                    stats[i],
+                ),
+            )
+            for i in range(threads)
+        ]
+        for worker in workers:
+            worker.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for worker in workers:
+            worker.join()
+        seconds = time.perf_counter() - started
+
+        reads = [latency for s in stats for latency in s.reads]
+        writes = [latency for s in stats for latency in s.writes]
+        return {
+            "seconds": seconds,
+            "ops_per_second": (len(reads) + len(writes)) / seconds,
+            "reads": len(reads),
+            "writes": len(writes),
+            "read_p95_ms": percentile(reads, 95) * 1000 if reads else 0,
+            "write_p50_ms": statistics.median(writes) * 1000 if writes else 0,
+            "write_p95_ms": percentile(writes, 95) * 1000 if writes else 0,
+            "lock_errors": sum(s.lock_errors for s in stats),
+        }
+
+    def work(self, alias, options, seed, asset_ids, branch_ids, barrier, stats):
+        rng = random.Random(seed)
+        try:
+            barrier.wait()
+            for _ in range(options["operations"]):
+                write = rng.random() < options["write_ratio"]
+                started = time.perf_counter()
+                try:
+                    if write:
+                        self.edit_asset(alias, rng.choice(asset_ids), rng)
+                    else:
+                        self.list_assets(alias, rng.choice(branch_ids))
+                except OperationalError as exc:
+                    if "locked" not in str(exc):
+                        raise
+                    stats.lock_errors += 1
+                else:
+                    latency = time.perf_counter() - started
+                    (stats.writes if write else stats.reads).append(latency)
+                finally:
+                    # What request_finished does after every request.
+                    connections[alias].close_if_unusable_or_obsolete()
+        finally:
+            close_connection(alias)
+
+    def list_assets(self, alias, branch_id):
+        """The queries of a branch's first asset list page."""
+        assets = Asset.objects.using(alias).filter(branch_id=branch_id)
+        list(assets.select_related("branch").order_by("-created_at", "-id")[:25])
+        assets.count()
+
+    def edit_asset(self, alias, asset_id, rng):
+        """Load an asset and save a change to it in one transaction."""
+        with transaction.atomic(using=alias):
+            asset = Asset.objects.using(alias).get(pk=asset_id)
+            asset.status = rng.choice(STATUSES)
+            asset.condition = rng.choice(CONDITIONS)
+            asset.save(using=alias)
+
+    def report(self, name, result, options):
+        self.stdout.write(
+            f"{name:<6} {options['threads']} threads: {result['reads']} reads and "
+            f"{result['writes']} edits in {result['seconds']:.2f}s, "
+            f"{result['ops_per_second']:.0f} ops/s, read p95 "
+            f"{result['read_p95_ms']:.1f}ms, edit p50 {result['write_p50_ms']:.1f}ms "
+            f"p95 {result['write_p95_ms']:.1f}ms, {result['lock_errors']} lock errors"
+        )
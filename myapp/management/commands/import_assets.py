@@ -0,0 +1,92 @@
+import os
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from import_export.formats.base_formats import CSV, XLSX
+from myapp.resources import AssetResource, import_error_rows, write_error_report
+
+FORMATS = {".csv": CSV, ".xlsx": XLSX}
+
+
+class Command(BaseCommand):
+    help = "Bulk import assets from a CSV or XLSX file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or XLSX file with one asset per row.")
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Validate the whole file and report errors without saving.",
+        )
+        parser.add_argument(
+            "--skip-invalid",
+            action="store_true",
+            help="Import the valid rows even if other rows have errors.",
+        )
+        parser.add_argument(
+            "--errors",
+            metavar="PATH",
+            help="Write every row error to this CSV file.",
+        )
+        parser.add_argument(
+            "--user",
+            help="Username recorded as the creator of the imported assets.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in FORMATS:
+            raise CommandError("Only .csv and .xlsx files can be imported.")
+
+        user = None
+        if options["user"]:
+            try:
+                user = User.objects.get(username=options["user"])
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist.")
+
+        file_format = FORMATS[extension]()
+        if file_format.is_binary():
+            with open(path, "rb") as f:
+                dataset = file_format.create_dataset(f.read())
+        else:
+            with open(path, encoding="utf-8-sig") as f:
+                dataset = file_format.create_dataset(f.read())
+
+        started = time.perf_counter()
+        result = AssetResource().import_data(
+            dataset,
+            dry_run=options["dry_run"],
+            use_transactions=True,
+            rollback_on_validation_errors=not options["skip_invalid"],
+            user=user,
+        )
+        elapsed = time.perf_counter() - started
+
+        if options["errors"]:
+            with open(options["errors"], "w", newline="") as output:
+                count = write_error_report(result, output)
+            self.stdout.write(f"Wrote {count} errors to {options['errors']}")
+        else:
+            for number, field, message in import_error_rows(result):
+                location = f"row {number}" if number else "file"
+                if field:
+                    location += f", {field}"
+                self.stderr.write(f"  {location}: {message}")
+
+        totals = result.totals
+        summary = (
+            f"{len(dataset)} rows in {elapsed:.1f}s: {totals['new']} new, "
+            f"{totals['invalid']} invalid, {totals['error']} errors"
+        )
+        failed = result.has_errors() or (
+            result.has_validation_errors() and not options["skip_invalid"]
+        )
+        if failed:
+            raise CommandError(f"Nothing imported. {summary}")
+        if options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS(f"✓ Dry run OK. {summary}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"✓ Imported. {summary}"))
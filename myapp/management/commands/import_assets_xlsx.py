@@ -0,0 +1,73 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from myapp.xlsx_import import DEFAULT_BATCH_SIZE, WorkbookError, import_workbook
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream a large XLSX workbook in the Excel export layout into the "
+        "asset table, resuming an interrupted import of the same file"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="XLSX file laid out like the Excel export.")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument(
+            "--errors",
+            metavar="PATH",
+            help="Append rejected rows to this CSV file instead of printing them.",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Start from the first row even if this file was imported before.",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+
+        error_file = None
+        if options["errors"]:
+            error_file = open(options["errors"], "a", newline="")
+            error_writer = csv.writer(error_file)
+
+            def on_error(number, field, message):
+                error_writer.writerow([number, field, message])
+
+        else:
+
+            def on_error(number, field, message):
+                self.stderr.write(f"  row {number}, {field}: {message}")
+
+        started = time.perf_counter()
+
+        def progress(checkpoint):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"  {checkpoint.rows_done} rows, {checkpoint.assets_created} "
+                f"imported, {checkpoint.rows_invalid} rejected ({elapsed:.0f}s)"
+            )
+
+        try:
+            checkpoint = import_workbook(
+                options["path"],
+                batch_size=options["batch_size"],
+                progress=progress,
+                on_error=on_error,
+                restart=options["restart"],
+            )
+        except WorkbookError as e:
+            raise CommandError(str(e))
+        finally:
+            if error_file is not None:
+                error_file.close()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✓ {checkpoint.file_name}: {checkpoint.assets_created} assets "
+                f"imported, {checkpoint.rows_invalid} rows rejected"
+            )
+        )
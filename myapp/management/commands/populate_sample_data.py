@@ -1,13 +1,53 @@
-from django.core.management.base import BaseCommand
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
+from django.db import IntegrityError
+from myapp import sample_data
 from myapp.models import UserRole, Branch, Asset
+from myapp.sharding import across_shards, sharding_enabled
 from datetime import datetime, timedelta
 
 
 class Command(BaseCommand):
     help = "Populate sample data for the Hospital Asset Management system"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--branches",
+            type=int,
+            help="Generate this many synthetic branches instead of the demo data.",
+        )
+        parser.add_argument(
+            "--assets",
+            type=int,
+            help="Generate this many synthetic assets across the new branches.",
+        )
+        parser.add_argument(
+            "--users",
+            type=int,
+            help="Generate this many synthetic users across the new branches.",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Random seed; the same options and seed give the same data.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=sample_data.DEFAULT_BATCH_SIZE,
+            help="Assets inserted per statement.",
+        )
+
     def handle(self, *args, **options):
+        counts = [options["branches"], options["assets"], options["users"]]
+        if any(count is not None for count in counts):
+            self.populate_scale(options)
+            return
+
         self.stdout.write("Creating sample data...")
 
         branches_data = [
@@ -257,12 +297,14 @@ class Command(BaseCommand):
 
         for data in assets_data:
             branch = data.pop("branch")
-            asset, created = Asset.objects.get_or_create(
-                serial_number=data["serial_number"],
-                defaults={**data, "branch": branch, "created_by": admin_user},
+            # Assets may already be in any shard.
+            existing = across_shards(
+                Asset.objects.filter(serial_number=data["serial_number"])
             )
-
-            if created:
+            if not existing.exists():
+                asset = Asset.objects.create(
+                    **data, branch=branch, created_by=admin_user
+                )
                 self.stdout.write(
                     self.style.SUCCESS(
                         f"✓ Created asset: {asset.name} ({asset.asset_id})"
@@ -274,3 +316,52 @@ class Command(BaseCommand):
         self.stdout.write("  Super Admin: admin@hospital.cm / Admin123!")
         self.stdout.write("  Branch Manager: manager@hospital.cm / Manager123!")
         self.stdout.write("  Inventory Officer: officer@hospital.cm / Officer123!")
+
+    def populate_scale(self, options):
+        branches = options["branches"] if options["branches"] is not None else 10
+        assets = options["assets"] or 0
+        users = options["users"] or 0
+        if min(branches, assets, users) < 0 or options["batch_size"] < 1:
+            raise CommandError("Counts must not be negative.")
+        if assets and not branches:
+            raise CommandError("Assets need at least one branch.")
+
+        self.stdout.write(
+            f"Generating {branches} branches, {users} users and {assets} assets "
+            f"(seed {options['seed']})..."
+        )
+        started = time.perf_counter()
+
+        def progress(created):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"  {created} assets ({elapsed:.1f}s)")
+
+        try:
+            sample_data.populate(
+                branches,
+                assets,
+                users,
+                seed=options["seed"],
+                batch_size=options["batch_size"],
+                progress=progress if options["verbosity"] > 1 else None,
+            )
+        except IntegrityError:
+            raise CommandError(
+                "Synthetic data already exists; run against an empty database."
+            )
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✓ Created {branches} branches, {users} users and {assets} assets "
+                f"in {elapsed:.1f}s"
+            )
+        )
+        if users:
+            self.stdout.write(
+                f"  Users: user00001@{sample_data.USER_DOMAIN} ... / "
+                f"{sample_data.USER_PASSWORD}"
+            )
+        if sharding_enabled():
+            # The rows were written straight into the default database.
+            call_command("shard_assets", stdout=self.stdout)
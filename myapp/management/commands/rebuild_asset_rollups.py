@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from myapp.models import AssetRollup
+from myapp.sharding import asset_databases
+
+
+class Command(BaseCommand):
+    help = "Rebuild the dashboard asset rollups from the asset table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only compare the rollups with the asset table; exit non-zero on drift.",
+        )
+
+    def handle(self, *args, **options):
+        if options["verify"]:
+            self.verify()
+            return
+
+        # Each shard keeps the rollups of its own assets.
+        rows = 0
+        for alias in asset_databases():
+            rollups = AssetRollup.objects.db_manager(alias)
+            rollups.rebuild()
+            rows += rollups.count()
+        self.stdout.write(self.style.SUCCESS(f"✓ Rebuilt {rows} asset rollup rows"))
+
+    def verify(self):
+        mismatches = 0
+        for alias in asset_databases():
+            mismatches += self.verify_database(alias)
+
+        if mismatches:
+            raise CommandError(
+                f"{mismatches} rollup rows differ; run rebuild_asset_rollups to fix."
+            )
+        self.stdout.write(self.style.SUCCESS("✓ Asset rollups match the asset table"))
+
+    def verify_database(self, alias):
+        rollups = AssetRollup.objects.db_manager(alias)
+        expected = rollups.compute()
+        actual = {
+            (row.branch_id, row.status, row.category, row.department): (
+                row.asset_count,
+                row.total_cost,
+            )
+            for row in rollups.all()
+            if row.asset_count
+        }
+
+        mismatches = 0
+        for key in sorted(expected.keys() | actual.keys(), key=str):
+            if expected.get(key) != actual.get(key):
+                mismatches += 1
+                self.stdout.write(
+                    f"  {'/'.join(map(str, key))}: "
+                    f"expected {expected.get(key)}, found {actual.get(key)}"
+                )
+        return mismatches
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from myapp.search import FTS_TABLE, fts_enabled, rebuild_fts
+
+
+class Command(BaseCommand):
+    help = "Rebuild the asset full-text search index from the asset table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database",
+            default="default",
+            help="Database alias to rebuild the index on.",
+        )
+
+    def handle(self, *args, **options):
+        using = options["database"]
+        if not fts_enabled(using):
+            raise CommandError("Full-text search is only available on SQLite.")
+
+        connection = connections[using]
+        rebuild_fts(connection)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {FTS_TABLE}")
+            (count,) = cursor.fetchone()
+
+        self.stdout.write(
+            self.style.SUCCESS(f"✓ Rebuilt search index ({count} assets indexed)")
+        )
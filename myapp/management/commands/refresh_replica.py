@@ -0,0 +1,60 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def copy_database(source, path):
+    """
+    Copy the SQLite database behind the Django connection ``source`` into
+    the file at ``path`` with SQLite's online backup API. The copy is made
+    in one step from a consistent snapshot, and connections reading ``path``
+    keep working while it is replaced.
+    """
+    source.ensure_connection()
+    target = sqlite3.connect(path, timeout=20)
+    try:
+        source.connection.backup(target)
+    finally:
+        target.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh the SQLite read replica (READ_REPLICA_ALIAS) from the primary "
+        "database, once or every --interval seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            help="Keep running and refresh every this many seconds.",
+        )
+
+    def handle(self, *args, **options):
+        alias = settings.READ_REPLICA_ALIAS
+        if alias not in settings.DATABASES:
+            raise CommandError(f"No '{alias}' database is configured.")
+        for name in (DEFAULT_DB_ALIAS, alias):
+            if connections[name].vendor != "sqlite":
+                raise CommandError(f"The '{name}' database is not SQLite.")
+        path = str(connections[alias].settings_dict["NAME"])
+
+        while True:
+            started = time.perf_counter()
+            try:
+                copy_database(connections[DEFAULT_DB_ALIAS], path)
+            except sqlite3.Error as exc:
+                if not options["interval"]:
+                    raise CommandError(f"Could not refresh {path}: {exc}")
+                self.stderr.write(f"Could not refresh {path}: {exc}")
+            else:
+                self.stdout.write(
+                    f"Refreshed {path} in {time.perf_counter() - started:.2f}s"
+                )
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
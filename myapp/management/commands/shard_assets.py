@@ -0,0 +1,84 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+from myapp.models import Asset, AssetRollup, Branch
+from myapp.sharding import (
+    asset_databases,
+    copy_branch,
+    shard_for_region,
+    sharding_enabled,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy every branch into its region's shard and move assets stored in "
+        "another database into their branch's shard. Run it after adding a "
+        "shard or a region to ASSET_SHARDS, or after loading assets straight "
+        "into the default database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="Assets moved per step."
+        )
+
+    def handle(self, *args, **options):
+        if not sharding_enabled():
+            raise CommandError("ASSET_SHARDS is empty, so sharding is off.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+
+        homes = self.copy_branches()
+        moved = 0
+        for alias in asset_databases():
+            branch_ids = (
+                Asset.objects.using(alias)
+                .order_by()
+                .values_list("branch_id", flat=True)
+                .distinct()
+            )
+            for branch_id in list(branch_ids):
+                home = homes.get(branch_id)
+                if home is None or home == alias:
+                    continue
+                count = self.move_assets(alias, home, branch_id, options["batch_size"])
+                self.stdout.write(
+                    f"  Moved {count} assets of branch {branch_id} from {alias} to {home}"
+                )
+                moved += count
+        # Drops the copies left behind in the databases assets moved out of.
+        self.copy_branches()
+
+        self.stdout.write(
+            self.style.SUCCESS(f"✓ Moved {moved} assets into their shards")
+        )
+
+    def copy_branches(self):
+        """Copy every branch to its shard; return ``{branch_id: shard}``."""
+        homes = {}
+        for branch in Branch.objects.using(DEFAULT_DB_ALIAS).iterator():
+            copy_branch(branch)
+            homes[branch.pk] = shard_for_region(branch.region)
+        return homes
+
+    def move_assets(self, source, target, branch_id, batch_size):
+        """
+        Move a branch's assets from ``source`` to ``target`` a batch at a
+        time, keeping their primary keys. A batch is written to ``target``
+        before it is deleted from ``source``, so an interrupted run loses
+        nothing and the next run replaces the copies it left.
+        """
+        assets = Asset.objects.using(source).filter(branch_id=branch_id).order_by("pk")
+        moved = 0
+        while True:
+            batch = list(assets[:batch_size])
+            if not batch:
+                return moved
+            pks = [asset.pk for asset in batch]
+            with transaction.atomic(using=target):
+                Asset.objects.using(target).filter(pk__in=pks).delete()
+                Asset.objects.using(target).bulk_create(batch)
+                AssetRollup.objects.db_manager(target).add_assets(batch)
+            with transaction.atomic(using=source):
+                Asset.objects.using(source).filter(pk__in=pks).delete()
+            moved += len(batch)
@@ -0,0 +1,256 @@
+"""
+Request and export metrics in the Prometheus text format.
+
+Every worker process buffers its counts in memory and adds them to a shared
+SQLite file (``METRICS_DB_PATH``) at most every ``METRICS_FLUSH_INTERVAL``
+seconds and when it exits, so the endpoint reports totals across all
+processes; the other processes' last few seconds may not be included yet.
+Periodic flushes run in a short-lived background thread, so a request never
+waits for the file's write lock.
+Histograms are stored as their cumulative ``_bucket`` series plus ``_sum``
+and ``_count``, which add up across processes like any counter.
+"""
+
+import atexit
+import logging
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+RENDER_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# name: (type, help)
+METRICS = {
+    "myapp_http_requests_total": (
+        "counter",
+        "Requests by view, role, method and status.",
+    ),
+    "myapp_http_request_duration_seconds": (
+        "histogram",
+        "Request latency by view and role.",
+    ),
+    "myapp_export_cache_total": (
+        "counter",
+        "PDF and Excel exports by whether the export cache had them.",
+    ),
+    "myapp_export_rows_total": ("counter", "Asset rows in generated exports."),
+    "myapp_export_bytes_total": ("counter", "Bytes of generated exports."),
+    "myapp_export_render_seconds": (
+        "histogram",
+        "Time spent generating PDF and Excel exports.",
+    ),
+}
+
+LE_RE = re.compile(r'(?:^|,)le="([^"]*)"')
+
+
+def format_labels(labels):
+    def escape(value):
+        return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+    return ",".join(f'{name}="{escape(value)}"' for name, value in labels)
+
+
+def format_value(value):
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class MetricsStore:
+    """Counters buffered in this process and shared through a SQLite file."""
+
+    def __init__(self, path, flush_interval):
+        self.path = str(path)
+        self.flush_interval = flush_interval
+        self.pending = defaultdict(float)
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        self.flushing = False
+        self.created = False
+
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        if not self.created:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS samples ("
+                "name TEXT NOT NULL, labels TEXT NOT NULL, value REAL NOT NULL, "
+                "PRIMARY KEY (name, labels))"
+            )
+            self.created = True
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def inc(self, name, labels, value=1):
+        key = (name, format_labels(labels))
+        with self.lock:
+            self.pending[key] += value
+        self.maybe_flush()
+
+    def observe(self, name, labels, value, buckets):
+        labels = format_labels(labels)
+        prefix = f"{labels}," if labels else ""
+        with self.lock:
+            for bound in (*buckets, math.inf):
+                le = "+Inf" if bound == math.inf else format_value(float(bound))
+                key = (f"{name}_bucket", f'{prefix}le="{le}"')
+                # Every bucket is written, empty ones included.
+                self.pending[key] += 1 if value <= bound else 0
+            self.pending[f"{name}_sum", labels] += value
+            self.pending[f"{name}_count", labels] += 1
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if time.monotonic() - self.last_flush < self.flush_interval:
+            return
+        with self.lock:
+            if self.flushing:
+                return
+            self.flushing = True
+            self.last_flush = time.monotonic()
+        # A thread per flush rather than one long-lived thread, which would
+        # not survive a pre-forking server starting its workers.
+        threading.Thread(
+            target=self.background_flush, name="metrics-flush", daemon=True
+        ).start()
+
+    def background_flush(self):
+        try:
+            self.flush()
+        finally:
+            self.flushing = False
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, defaultdict(float)
+            self.last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            db = self.connect()
+            try:
+                db.execute("BEGIN IMMEDIATE")
+                db.executemany(
+                    "INSERT INTO samples (name, labels, value) VALUES (?, ?, ?) "
+                    "ON CONFLICT (name, labels) DO UPDATE "
+                    "SET value = value + excluded.value",
+                    [
+                        (name, labels, value)
+                        for (name, labels), value in pending.items()
+                    ],
+                )
+                db.execute("COMMIT")
+            finally:
+                db.close()
+        except sqlite3.Error:
+            logger.exception("Could not write metrics to %s", self.path)
+            # Keep the counts for the next flush.
+            with self.lock:
+                for key, value in pending.items():
+                    self.pending[key] += value
+
+    def samples(self):
+        """Flush this process's counts and return every ``(name, labels, value)``."""
+        self.flush()
+        db = self.connect()
+        try:
+            return db.execute("SELECT name, labels, value FROM samples").fetchall()
+        finally:
+            db.close()
+
+    def exposition(self):
+        """All metrics in the Prometheus text exposition format."""
+        families = defaultdict(list)
+        for name, labels, value in self.samples():
+            family = re.sub(r"_(bucket|sum|count)$", "", name)
+            if family not in METRICS:
+                family = name
+            families[family].append((name, labels, value))
+
+        lines = []
+        for family in sorted(families):
+            kind, help_text = METRICS.get(family, ("untyped", ""))
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} {kind}")
+            for name, labels, value in sorted(families[family], key=_sample_order):
+                series = f"{name}{{{labels}}}" if labels else name
+                lines.append(f"{series} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _sample_order(sample):
+    # Buckets of one series in increasing order of their upper bound.
+    name, labels, _ = sample
+    match = LE_RE.search(labels)
+    if match is None:
+        return (LE_RE.sub("", labels), name, 0.0)
+    return (LE_RE.sub("", labels), name, float(match.group(1)))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """This process's store for ``METRICS_DB_PATH``, or None when disabled."""
+    global _store
+    if not settings.METRICS_ENABLED:
+        return None
+    path = str(settings.METRICS_DB_PATH)
+    with _store_lock:
+        if _store is None or _store.path != path:
+            if _store is not None:
+                _store.flush()
+            _store = MetricsStore(path, settings.METRICS_FLUSH_INTERVAL)
+    return _store
+
+
+@atexit.register
+def _flush_at_exit():
+    if _store is not None:
+        _store.flush()
+
+
+def record_request(view, role, method, status, seconds):
+    store = get_store()
+    if store is None:
+        return
+    store.inc(
+        "myapp_http_requests_total",
+        [("view", view), ("role", role), ("method", method), ("status", status)],
+    )
+    store.observe(
+        "myapp_http_request_duration_seconds",
+        [("view", view), ("role", role)],
+        seconds,
+        LATENCY_BUCKETS,
+    )
+
+
+def record_export_cache(kind, hit):
+    store = get_store()
+    if store is not None:
+        store.inc(
+            "myapp_export_cache_total",
+            [("kind", kind), ("result", "hit" if hit else "miss")],
+        )
+
+
+def record_export(kind, rows, size, seconds):
+    """Count a generated ``kind`` export of ``rows`` assets and ``size`` bytes."""
+    store = get_store()
+    if store is None:
+        return
+    labels = [("kind", kind)]
+    store.inc("myapp_export_rows_total", labels, rows)
+    store.inc("myapp_export_bytes_total", labels, size)
+    store.observe("myapp_export_render_seconds", labels, seconds, RENDER_BUCKETS)
@@ -0,0 +1,240 @@
+import itertools
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .access import load_request_access
+from .metrics import record_request
+from .profiling import profile_call, trim_profiles
+from .routers import iter_reading_from, route_reads_to, stop_routing
+from .timing import RequestTiming, instrument_templates, measure_request
+
+logger = logging.getLogger("myapp.timing")
+
+
+class UserAccessMiddleware:
+    """
+    Attach the user's resolved role and branch to ``request.access``.
+
+    Must come after ``AuthenticationMiddleware``. ``Asset.objects.for_user``
+    and ``Branch.objects.for_user`` pick up the same object, so a typical
+    request runs no role queries at all.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.access = load_request_access(request)
+        return self.get_response(request)
+
+
+def response_size(response):
+    """The body size in bytes, or None for a stream of unknown length."""
+    if response.has_header("Content-Length"):
+        return int(response["Content-Length"])
+    if response.streaming:
+        return None
+    return len(response.content)
+
+
+class RequestTimingMiddleware:
+    """
+    Measure each request's total time, SQL queries and their time, template
+    rendering and timed steps such as export rendering, and report them in a
+    ``Server-Timing`` header to staff users (to everyone with ``DEBUG`` on).
+    Requests slower than ``REQUEST_TIMING_SLOW_MS`` are logged with their
+    slowest SQL statements, whoever makes them.
+
+    Should come first so the total covers the other middleware. Streaming
+    responses are measured up to the point the response is returned, before
+    the body is generated. Removed from the stack entirely when
+    ``REQUEST_TIMING_ENABLED`` is off.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        slow_ms = settings.REQUEST_TIMING_SLOW_MS
+        self.slow_seconds = None if slow_ms is None else slow_ms / 1000
+        instrument_templates()
+
+    def __call__(self, request):
+        timing = RequestTiming(settings.REQUEST_TIMING_SLOW_QUERIES)
+        request.timing = timing
+        with measure_request(timing), ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timing))
+            response = self.get_response(request)
+
+        if settings.DEBUG or self.is_staff(request):
+            response["Server-Timing"] = timing.server_timing()
+        if self.slow_seconds is not None and timing.seconds >= self.slow_seconds:
+            self.log_slow_request(request, response, timing)
+        return response
+
+    def is_staff(self, request):
+        user = getattr(request, "user", None)
+        return user is not None and user.is_staff
+
+    def log_slow_request(self, request, response, timing):
+        match = request.resolver_match
+        spans = "".join(
+            f", {name} {seconds * 1000:.1f}ms" for name, seconds in timing.spans.items()
+        )
+        statements = "".join(
+            f"\n  {seconds * 1000:8.1f}ms {sql}"
+            for seconds, sql in timing.slowest_queries()
+        )
+        logger.warning(
+            "Slow request %s %s (%s) %s: %.1fms, %d queries in %.1fms%s, " "%s bytes%s",
+            request.method,
+            request.path,
+            match.view_name if match else "unresolved",
+            response.status_code,
+            timing.seconds * 1000,
+            timing.sql_count,
+            timing.sql_seconds * 1000,
+            spans,
+            response_size(response),
+            statements,
+        )
+
+
+class MetricsMiddleware:
+    """
+    Count requests and record their latency per URL name and role in the
+    shared metrics store. Removed from the stack when ``METRICS_ENABLED`` is
+    off.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        seconds = time.perf_counter() - started
+
+        match = request.resolver_match
+        access = getattr(request, "access", None)
+        record_request(
+            match.view_name if match else "unresolved",
+            (access.role if access else None) or "anonymous",
+            request.method,
+            response.status_code,
+            seconds,
+        )
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Run a view under cProfile and tracemalloc when a staff user asks for it
+    with ``?_profile=1`` or an ``X-Profile: 1`` header, and for 1 in N
+    requests to the URL names in ``PROFILE_SAMPLING`` (whoever makes them).
+    The profile's name is returned in the ``X-Profile`` response header.
+    Requests that arrive while another one is profiled are served unprofiled.
+
+    Goes last, so the view is profiled with everything else already set up.
+    Streaming bodies are generated after the view returns and are not
+    profiled. Removed from the stack when ``PROFILE_ENABLED`` is off.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILE_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.directory = settings.PROFILE_DIR
+        self.max_files = settings.PROFILE_MAX_FILES
+        self.sampling = {
+            name: (every, itertools.count(1))
+            for name, every in settings.PROFILE_SAMPLING.items()
+        }
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not self.wants_profile(request):
+            return None
+        match = request.resolver_match
+        access = getattr(request, "access", None)
+        response, name = profile_call(
+            lambda: view_func(request, *view_args, **view_kwargs),
+            self.directory,
+            match.url_name or "view",
+            f"{request.method} {request.get_full_path()} ({match.view_name}) "
+            f"user {request.user} role {access.role if access else None}",
+        )
+        if name is not None:
+            trim_profiles(self.directory, self.max_files)
+            response["X-Profile"] = name
+        return response
+
+    def wants_profile(self, request):
+        sampled = self.sampling.get(request.resolver_match.url_name)
+        if sampled is not None:
+            every, counter = sampled
+            if next(counter) % every == 0:
+                return True
+        if request.GET.get("_profile") or request.headers.get("X-Profile"):
+            return request.user.is_staff
+        return False
+
+
+class ReadReplicaMiddleware:
+    """
+    Route the read-only views in ``READ_REPLICA_VIEWS`` to the read replica
+    for GET and HEAD requests, including the body of streaming responses.
+
+    After a successful POST (or other unsafe request) the user gets a cookie
+    that keeps their reads on the primary for ``READ_REPLICA_STICKY_SECONDS``,
+    so they see their own changes before the replica catches up. Removed
+    from the stack when ``READ_REPLICA_ENABLED`` is off.
+    """
+
+    def __init__(self, get_response):
+        if not settings.READ_REPLICA_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.alias = settings.READ_REPLICA_ALIAS
+        self.views = set(settings.READ_REPLICA_VIEWS)
+        self.sticky_seconds = settings.READ_REPLICA_STICKY_SECONDS
+        self.cookie = settings.READ_REPLICA_STICKY_COOKIE
+
+    def __call__(self, request):
+        request.read_replica_token = None
+        response = self.get_response(request)
+
+        if request.read_replica_token is not None:
+            stop_routing(request.read_replica_token)
+            if response.streaming:
+                response.streaming_content = iter_reading_from(
+                    self.alias, response.streaming_content
+                )
+        if request.method not in ("GET", "HEAD", "OPTIONS", "TRACE"):
+            if response.status_code < 400:
+                response.set_cookie(
+                    self.cookie,
+                    "1",
+                    max_age=self.sticky_seconds,
+                    httponly=True,
+                    samesite="Lax",
+                )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            request.method in ("GET", "HEAD")
+            and request.resolver_match.url_name in self.views
+            and self.cookie not in request.COOKIES
+        ):
+            request.read_replica_token = route_reads_to(self.alias)
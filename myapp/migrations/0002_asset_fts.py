@@ -0,0 +1,74 @@
+from django.db import migrations
+
+# The SQL is frozen here rather than imported from myapp.search, so later
+# changes to the search module never rewrite this migration.
+CREATE_FTS = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS myapp_asset_fts USING fts5(
+        asset_id, name, brand, model, serial_number, supplier_name, custodian_name,
+        content='myapp_asset',
+        content_rowid='id',
+        prefix='2 3',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS myapp_asset_fts_ai AFTER INSERT ON myapp_asset
+    BEGIN
+        INSERT INTO myapp_asset_fts(rowid, asset_id, name, brand, model, serial_number, supplier_name, custodian_name)
+        VALUES (new.id, new.asset_id, new.name, new.brand, new.model, new.serial_number, new.supplier_name, new.custodian_name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS myapp_asset_fts_ad AFTER DELETE ON myapp_asset
+    BEGIN
+        INSERT INTO myapp_asset_fts(myapp_asset_fts, rowid, asset_id, name, brand, model, serial_number, supplier_name, custodian_name)
+        VALUES ('delete', old.id, old.asset_id, old.name, old.brand, old.model, old.serial_number, old.supplier_name, old.custodian_name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS myapp_asset_fts_au
+    AFTER UPDATE OF asset_id, name, brand, model, serial_number, supplier_name, custodian_name ON myapp_asset
+    BEGIN
+        INSERT INTO myapp_asset_fts(myapp_asset_fts, rowid, asset_id, name, brand, model, serial_number, supplier_name, custodian_name)
+        VALUES ('delete', old.id, old.asset_id, old.name, old.brand, old.model, old.serial_number, old.supplier_name, old.custodian_name);
+        INSERT INTO myapp_asset_fts(rowid, asset_id, name, brand, model, serial_number, supplier_name, custodian_name)
+        VALUES (new.id, new.asset_id, new.name, new.brand, new.model, new.serial_number, new.supplier_name, new.custodian_name);
+    END
+    """,
+    "INSERT INTO myapp_asset_fts(myapp_asset_fts) VALUES ('rebuild')",
+]
+
+DROP_FTS = [
+    "DROP TRIGGER IF EXISTS myapp_asset_fts_ai",
+    "DROP TRIGGER IF EXISTS myapp_asset_fts_ad",
+    "DROP TRIGGER IF EXISTS myapp_asset_fts_au",
+    "DROP TABLE IF EXISTS myapp_asset_fts",
+]
+
+
+def execute_sqlite(schema_editor, statements):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def create_fts(apps, schema_editor):
+    execute_sqlite(schema_editor, CREATE_FTS)
+
+
+def drop_fts(apps, schema_editor):
+    execute_sqlite(schema_editor, DROP_FTS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 6.0.2 on 2026-10-18 17:24
+
+import re
+import string
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def asset_id_regex(id_format):
+    """Build a regex that parses IDs produced by ``ASSET_ID_FORMAT``."""
+    pattern = ""
+    for literal, field, _, _ in string.Formatter().parse(id_format):
+        pattern += re.escape(literal)
+        if field == "year":
+            pattern += r"(?P<year>\d{4})"
+        elif field == "number":
+            pattern += r"(?P<number>\d+)"
+        elif field is not None:
+            pattern += r".*?"
+    return re.compile(f"^{pattern}$")
+
+
+def backfill_sequences(apps, schema_editor):
+    Asset = apps.get_model("myapp", "Asset")
+    AssetSequence = apps.get_model("myapp", "AssetSequence")
+    db_alias = schema_editor.connection.alias
+    regex = asset_id_regex(settings.ASSET_ID_FORMAT)
+
+    last_values = {}
+    asset_ids = Asset.objects.using(db_alias).values_list("asset_id", flat=True)
+    for asset_id in asset_ids.iterator(chunk_size=2000):
+        match = regex.match(asset_id)
+        if match:
+            year, number = int(match["year"]), int(match["number"])
+            last_values[year] = max(last_values.get(year, 0), number)
+
+    AssetSequence.objects.using(db_alias).bulk_create(
+        AssetSequence(year=year, last_value=last_value)
+        for year, last_value in last_values.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0003_asset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssetSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveIntegerField(unique=True)),
+                ('last_value', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Asset ID Sequence',
+                'verbose_name_plural': 'Asset ID Sequences',
+            },
+        ),
+        migrations.RunPython(backfill_sequences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 6.0.2 on 2026-10-18 17:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_rollups(apps, schema_editor):
+    Asset = apps.get_model("myapp", "Asset")
+    AssetRollup = apps.get_model("myapp", "AssetRollup")
+    db_alias = schema_editor.connection.alias
+
+    rows = (
+        Asset.objects.using(db_alias)
+        .order_by()
+        .values("branch_id", "status", "category", "department")
+        .annotate(asset_count=Count("id"), total_cost=Sum("purchase_cost"))
+    )
+    AssetRollup.objects.using(db_alias).bulk_create(
+        AssetRollup(**row) for row in rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0004_asset_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssetRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('in_use', 'In Use'), ('available', 'Available'), ('maintenance', 'Under Maintenance'), ('retired', 'Retired')], max_length=20)),
+                ('category', models.CharField(choices=[('medical_equipment', 'Medical Equipment'), ('vehicle', 'Vehicle'), ('generator', 'Generator'), ('furniture', 'Furniture'), ('computer', 'Computer'), ('other', 'Other')], max_length=50)),
+                ('department', models.CharField(choices=[('emergency', 'Emergency'), ('surgery', 'Surgery'), ('maternity', 'Maternity'), ('pediatrics', 'Pediatrics'), ('radiology', 'Radiology'), ('laboratory', 'Laboratory'), ('administration', 'Administration'), ('maintenance', 'Maintenance'), ('other', 'Other')], max_length=50)),
+                ('asset_count', models.IntegerField(default=0)),
+                ('total_cost', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='asset_rollups', to='myapp.branch')),
+            ],
+            options={
+                'verbose_name': 'Asset Rollup',
+                'verbose_name_plural': 'Asset Rollups',
+                'constraints': [models.UniqueConstraint(fields=('branch', 'status', 'category', 'department'), name='unique_asset_rollup')],
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
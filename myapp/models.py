@@ -1,5 +1,21 @@
-from django.db import models
+import uuid
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, models, router, transaction
+from django.db.models import Count, F, Sum
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .access import get_user_access
+from .export_cache import invalidate_exports
+from .sharding import (
+    across_shards,
+    asset_databases,
+    on_branch_shard,
+    shard_for_branch,
+    sharding_enabled,
+)
 
 
 class UserRole(models.Model):
@@ -25,6 +41,17 @@ class UserRole(models.Model):
         return f"{self.user.username} - {self.get_role_display()}"
 
 
+class BranchQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """Branches ``user`` may see, as a single SQL predicate."""
+        access = get_user_access(user)
+        if access.is_super_admin:
+            return self
+        if access.branch_id is None:
+            return self.none()
+        return self.filter(pk=access.branch_id)
+
+
 class Branch(models.Model):
     STATUS_CHOICES = [
         ("active", "Active"),
@@ -41,6 +68,8 @@ class Branch(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = BranchQuerySet.as_manager()
+
     class Meta:
         ordering = ["name"]
 
@@ -48,6 +77,47 @@ class Branch(models.Model):
         return f"{self.name} ({self.code})"
 
 
+class AssetQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """
+        Assets ``user`` may see, as a single SQL predicate. With sharding on,
+        a branch's assets are read from its shard, and a super admin's from
+        every shard (a ``ShardedQuerySet``).
+        """
+        access = get_user_access(user)
+        if access.is_super_admin:
+            return across_shards(self) if self._db is None else self
+        if access.branch_id is None:
+            return self.none()
+        queryset = self.filter(branch_id=access.branch_id)
+        if self._db is None:
+            queryset = on_branch_shard(queryset, access.branch_id)
+        return queryset
+
+    def update(self, **kwargs):
+        """
+        Bulk updates send no signals, so supersede the exports of every
+        branch the rows are in or are moved to.
+        """
+        with transaction.atomic(using=self.db):
+            branch_ids = set(
+                self.order_by().values_list("branch_id", flat=True).distinct()
+            )
+            for field in ("branch", "branch_id"):
+                if field in kwargs:
+                    target = getattr(kwargs[field], "pk", kwargs[field])
+                    if not isinstance(target, int):
+                        # An expression: any branch may receive the rows.
+                        target = Branch.objects.using(self.db).values_list(
+                            "pk", flat=True
+                        )
+                        branch_ids.update(target)
+                    else:
+                        branch_ids.add(target)
+            invalidate_exports(branch_ids, using=self.db)
+            return super().update(**kwargs)
+
+
 class Asset(models.Model):
     CATEGORY_CHOICES = [
         ("medical_equipment", "Medical Equipment"),
@@ -110,19 +180,388 @@ class Asset(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = AssetQuerySet.as_manager()
+
     class Meta:
         ordering = ["-created_at"]
+        # Every list, dashboard and export query filters on branch and/or
+        # status/category and pages newest-first on (created_at, id).
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="asset_created_idx"),
+            models.Index(
+                fields=["branch", "created_at", "id"], name="asset_branch_created_idx"
+            ),
+            models.Index(
+                fields=["branch", "status", "created_at", "id"],
+                name="asset_branch_status_idx",
+            ),
+            models.Index(
+                fields=["branch", "category", "created_at", "id"],
+                name="asset_branch_category_idx",
+            ),
+            models.Index(
+                fields=["status", "created_at", "id"], name="asset_status_created_idx"
+            ),
+            models.Index(
+                fields=["category", "created_at", "id"],
+                name="asset_category_created_idx",
+            ),
+            # Incremental dumps with ?updated_since=.
+            models.Index(fields=["updated_at", "id"], name="asset_updated_idx"),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.asset_id})"
 
+    ROLLUP_FIELDS = ("branch_id", "status", "category", "department", "purchase_cost")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Only loaded values are read: reading a deferred field would load it
+        # through from_db again. Without a snapshot, save() and delete read
+        # the old row from the database instead.
+        if all(field in instance.__dict__ for field in cls.ROLLUP_FIELDS):
+            instance._rollup_state = instance.get_rollup_state()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        reloaded = (
+            fields is None
+            or "branch" in fields
+            or any(field in fields for field in self.ROLLUP_FIELDS)
+        )
+        if reloaded:
+            self.__dict__.pop("_rollup_state", None)
+
+    def get_rollup_state(self):
+        return tuple(
+            self._meta.get_field(field).to_python(getattr(self, field, None))
+            for field in self.ROLLUP_FIELDS
+        )
+
+    def get_saved_rollup_state(self, using):
+        """The rollup state of this asset's row in ``using``."""
+        if hasattr(self, "_rollup_state"):
+            return self._rollup_state
+        if self.pk is None:
+            return None
+        return (
+            Asset.objects.using(using)
+            .filter(pk=self.pk)
+            .values_list(*self.ROLLUP_FIELDS)
+            .first()
+        )
+
     def save(self, *args, **kwargs):
         if not self.asset_id:
             self.asset_id = self.generate_asset_id()
-        super().save(*args, **kwargs)
+
+        using = kwargs.get("using") or router.db_for_write(Asset, instance=self)
+        moved_from = None
+        if sharding_enabled() and using in asset_databases():
+            # An asset always lives in its branch's shard. One moved to a
+            # branch stored elsewhere is inserted there, then deleted here;
+            # an error in between leaves a copy rather than losing it.
+            home = shard_for_branch(self.branch_id)
+            if not self._state.adding and self._state.db not in (None, home):
+                moved_from = self._state.db
+                kwargs["force_insert"] = True
+                kwargs.pop("update_fields", None)
+            using = kwargs["using"] = home
+
+        if moved_from is not None:
+            old_state = None
+        else:
+            old_state = self.get_saved_rollup_state(using)
+
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+            new_state = self.get_rollup_state()
+            if old_state != new_state:
+                AssetRollup.objects.db_manager(using).move(old_state, new_state)
+        self._rollup_state = new_state
+        if moved_from is not None:
+            Asset.objects.using(moved_from).filter(pk=self.pk).delete()
 
     def generate_asset_id(self):
-        import datetime
+        return self.allocate_asset_ids(1)[0]
+
+    @classmethod
+    def allocate_asset_ids(cls, count):
+        """Reserve ``count`` consecutive asset IDs in a single round trip."""
+        year = timezone.localdate().year
+        first = AssetSequence.objects.reserve(year, count)
+        template = settings.ASSET_ID_FORMAT
+        return [
+            template.format(year=year, number=number)
+            for number in range(first, first + count)
+        ]
+
+
+class AssetSequenceManager(models.Manager):
+    def reserve(self, year, count=1):
+        """
+        Atomically advance the sequence for ``year`` by ``count`` and return
+        the first reserved number.
+
+        The UPDATE takes the row (or, on SQLite, database) write lock before
+        the new value is read back, so concurrent callers never overlap.
+        """
+        with transaction.atomic(using=self.db):
+            updated = self.filter(year=year).update(last_value=F("last_value") + count)
+            if not updated:
+                try:
+                    with transaction.atomic(using=self.db):
+                        self.create(year=year, last_value=count)
+                    return 1
+                except IntegrityError:
+                    # Another worker created this year's row first.
+                    self.filter(year=year).update(last_value=F("last_value") + count)
+            last_value = self.filter(year=year).values_list("last_value", flat=True)
+            return last_value.get() - count + 1
+
+
+class AssetSequence(models.Model):
+    year = models.PositiveIntegerField(unique=True)
+    last_value = models.PositiveIntegerField(default=0)
+
+    objects = AssetSequenceManager()
+
+    class Meta:
+        verbose_name = "Asset ID Sequence"
+        verbose_name_plural = "Asset ID Sequences"
+
+    def __str__(self):
+        return f"{self.year}: {self.last_value}"
+
+
+class AssetRollupManager(models.Manager):
+    def apply_delta(self, state, count, cost):
+        branch_id, status, category, department, _ = state
+        key = {
+            "branch_id": branch_id,
+            "status": status,
+            "category": category,
+            "department": department,
+        }
+        updated = self.filter(**key).update(
+            asset_count=F("asset_count") + count, total_cost=F("total_cost") + cost
+        )
+        if updated or count < 0:
+            return
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(**key, asset_count=count, total_cost=cost)
+        except IntegrityError:
+            self.filter(**key).update(
+                asset_count=F("asset_count") + count,
+                total_cost=F("total_cost") + cost,
+            )
+
+    def add_assets(self, assets):
+        """Count newly inserted ``assets``, grouped by bucket."""
+        counts = Counter()
+        costs = defaultdict(int)
+        for asset in assets:
+            state = asset.get_rollup_state()
+            counts[state[:-1]] += 1
+            costs[state[:-1]] += state[-1] or 0
+        self.add_buckets(counts, costs)
+
+    def add_buckets(self, counts, costs):
+        """
+        Add ``counts[key]`` assets costing ``costs[key]`` in total to each
+        ``(branch_id, status, category, department)`` bucket.
+        """
+        branch_ids = {branch_id for branch_id, _, _, _ in counts}
+        invalidate_exports(branch_ids, using=self.db)
+        existing = set(
+            self.filter(branch_id__in=branch_ids).values_list(
+                "branch_id", "status", "category", "department"
+            )
+        )
+        created = []
+        for key, count in counts.items():
+            if key in existing:
+                self.apply_delta((*key, None), count, costs[key])
+                continue
+            branch_id, status, category, department = key
+            created.append(
+                AssetRollup(
+                    branch_id=branch_id,
+                    status=status,
+                    category=category,
+                    department=department,
+                    asset_count=count,
+                    total_cost=costs[key],
+                )
+            )
+        if not created:
+            return
+
+        # Buckets seen for the first time are inserted together; if another
+        # writer created one of them meanwhile, fall back to one at a time.
+        try:
+            with transaction.atomic(using=self.db):
+                self.bulk_create(created)
+        except IntegrityError:
+            for rollup in created:
+                state = (*rollup.get_bucket(), None)
+                self.apply_delta(state, rollup.asset_count, rollup.total_cost)
+
+    def move(self, old_state, new_state):
+        """Move one asset's contribution from ``old_state`` to ``new_state``."""
+        invalidate_exports(
+            [state[0] for state in (old_state, new_state) if state is not None],
+            using=self.db,
+        )
+        if old_state is not None:
+            self.apply_delta(old_state, -1, -(old_state[-1] or 0))
+        if new_state is not None:
+            self.apply_delta(new_state, 1, new_state[-1] or 0)
 
-        count = Asset.objects.count() + 1
-        return f"AST-{datetime.datetime.now().year}-{count:05d}"
+    def compute(self):
+        """Aggregate the rollup rows from scratch, keyed like the table."""
+        rows = (
+            Asset.objects.using(self.db)
+            .order_by()
+            .values("branch_id", "status", "category", "department")
+            .annotate(asset_count=Count("id"), total_cost=Sum("purchase_cost"))
+        )
+        return {
+            (row["branch_id"], row["status"], row["category"], row["department"]): (
+                row["asset_count"],
+                row["total_cost"],
+            )
+            for row in rows
+        }
+
+    def rebuild(self):
+        with transaction.atomic(using=self.db):
+            rollups = self.compute()
+            branch_ids = set(self.values_list("branch_id", flat=True))
+            invalidate_exports(
+                branch_ids.union(branch_id for branch_id, _, _, _ in rollups),
+                using=self.db,
+            )
+            self.all().delete()
+            self.bulk_create(
+                AssetRollup(
+                    branch_id=branch_id,
+                    status=status,
+                    category=category,
+                    department=department,
+                    asset_count=asset_count,
+                    total_cost=total_cost,
+                )
+                for (branch_id, status, category, department), (
+                    asset_count,
+                    total_cost,
+                ) in rollups.items()
+            )
+
+
+class AssetRollup(models.Model):
+    """
+    Asset counts and total purchase cost per (branch, status, category,
+    department), maintained by ``Asset.save`` and the ``post_delete`` signal
+    so the dashboard never has to scan the asset table.
+    """
+
+    branch = models.ForeignKey(
+        Branch, on_delete=models.CASCADE, related_name="asset_rollups"
+    )
+    status = models.CharField(max_length=20, choices=Asset.STATUS_CHOICES)
+    category = models.CharField(max_length=50, choices=Asset.CATEGORY_CHOICES)
+    department = models.CharField(max_length=50, choices=Asset.DEPARTMENT_CHOICES)
+    asset_count = models.IntegerField(default=0)
+    total_cost = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    objects = AssetRollupManager()
+
+    class Meta:
+        verbose_name = "Asset Rollup"
+        verbose_name_plural = "Asset Rollups"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["branch", "status", "category", "department"],
+                name="unique_asset_rollup",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.branch_id}/{self.status}/{self.category}/{self.department}"
+
+    def get_bucket(self):
+        return (self.branch_id, self.status, self.category, self.department)
+
+
+class ExportJob(models.Model):
+    KIND_CHOICES = [
+        ("pdf", "PDF"),
+        ("excel", "Excel"),
+    ]
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="export_jobs")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    rows_total = models.PositiveIntegerField(null=True, blank=True)
+    rows_done = models.PositiveIntegerField(default=0)
+    file = models.FileField(upload_to="exports/", blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["user", "status"], name="exportjob_user_status_idx"),
+            models.Index(fields=["expires_at"], name="exportjob_expires_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} export {self.id} ({self.status})"
+
+    @property
+    def progress(self):
+        if self.status == "done":
+            return 100
+        if not self.rows_total:
+            return 0
+        return min(99, self.rows_done * 100 // self.rows_total)
+
+
+class AssetImport(models.Model):
+    """
+    Progress of a streaming spreadsheet import. ``rows_done`` is committed
+    together with each batch, so an interrupted import resumes right after
+    the last batch that was saved.
+    """
+
+    file_hash = models.CharField(max_length=64, unique=True)
+    file_name = models.CharField(max_length=255)
+    rows_done = models.PositiveIntegerField(default=0)
+    assets_created = models.PositiveIntegerField(default=0)
+    rows_invalid = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-started_at"]
+
+    def __str__(self):
+        return f"{self.file_name}: {self.rows_done} rows"
@@ -0,0 +1,156 @@
+import base64
+import binascii
+import hashlib
+import math
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .sharding import ShardedQuerySet, gather
+
+
+def encode_cursor(value, pk):
+    """
+    Encode a row's sort key: its ``created_at``, or its search rank when the
+    rows are ranked.
+    """
+    value = value.isoformat() if hasattr(value, "isoformat") else repr(value)
+    raw = f"{value}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def parse_rank(value):
+    rank = float(value)
+    if math.isnan(rank):
+        raise ValueError(value)
+    return rank
+
+
+def decode_cursor(cursor, parse=parse_datetime):
+    """
+    Return ``(value, pk)`` for a cursor, with ``value`` read by ``parse``, or
+    None if it is malformed.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, pk = base64.urlsafe_b64decode(padded).decode().split("|", 1)
+        value = parse(value)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if value is None:
+        return None
+    return value, pk
+
+
+class KeysetPage:
+    def __init__(self, object_list, has_next, has_previous, field="created_at"):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.field = field
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def next_cursor(self):
+        if not self.has_next:
+            return None
+        last = self.object_list[-1]
+        return encode_cursor(getattr(last, self.field), last.pk)
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous:
+            return None
+        first = self.object_list[0]
+        return encode_cursor(getattr(first, self.field), first.pk)
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset newest-first on ``(created_at, id)``, or, with
+    ``ranked=True``, best match first on ``(search_rank, id)`` as annotated
+    by ``search_assets(ranked=True)``.
+
+    Pages are addressed by opaque cursors instead of offsets, so fetching
+    page N costs the same as fetching page 1 and never loads more than
+    ``per_page + 1`` rows.
+    """
+
+    def __init__(self, queryset, per_page, ranked=False):
+        self.queryset = queryset
+        self.per_page = per_page
+        if ranked:
+            # bm25 ranks are lower for better matches.
+            self.field, self.descending, self.parse = "search_rank", False, parse_rank
+        else:
+            self.field, self.descending, self.parse = "created_at", True, parse_datetime
+
+    def _beyond(self, cursor, forward):
+        """Rows after ``cursor`` in page order, or before it if not ``forward``."""
+        value, pk = cursor
+        op = "lt" if forward == self.descending else "gt"
+        field = self.field
+        return Q(**{f"{field}__{op}e": value}) & (
+            Q(**{f"{field}__{op}": value}) | Q(**{f"pk__{op}": pk})
+        )
+
+    def _ordering(self, forward):
+        prefix = "-" if forward == self.descending else ""
+        return [prefix + self.field, prefix + "pk"]
+
+    def get_page(self, after=None, before=None):
+        after = decode_cursor(after, self.parse)
+        before = decode_cursor(before, self.parse) if after is None else None
+
+        if before is not None:
+            rows = list(
+                self.queryset.filter(self._beyond(before, forward=False)).order_by(
+                    *self._ordering(forward=False)
+                )[: self.per_page + 1]
+            )
+            has_previous = len(rows) > self.per_page
+            rows = rows[: self.per_page]
+            rows.reverse()
+            return KeysetPage(
+                rows, has_next=True, has_previous=has_previous, field=self.field
+            )
+
+        queryset = self.queryset
+        if after is not None:
+            queryset = queryset.filter(self._beyond(after, forward=True))
+        rows = list(queryset.order_by(*self._ordering(forward=True))[: self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        return KeysetPage(
+            rows[: self.per_page],
+            has_next=has_next,
+            has_previous=after is not None,
+            field=self.field,
+        )
+
+
+def cached_count(queryset, timeout):
+    """Count ``queryset``, reusing the result for ``timeout`` seconds."""
+    if isinstance(queryset, ShardedQuerySet):
+        counts = gather(lambda qs: cached_count(qs, timeout), queryset.querysets)
+        return sum(counts)
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    raw = f"{queryset.db}{sql}{params!r}"
+    key = "count:" + hashlib.md5(raw.encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
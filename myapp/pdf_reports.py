@@ -0,0 +1,481 @@
+"""
+Inventory report rendered directly with ReportLab platypus.
+
+Produces the same layout as ``assets_pdf_template.html`` without going
+through xhtml2pdf's HTML and CSS parsing. Rows are read from a queryset
+iterator and laid out in small tables that are created only when the page
+layout reaches them, so layout memory stays flat however many assets are
+exported.
+
+Each branch is an independent section, so sections are rendered in a pool
+of worker processes and merged with pypdf, which then adds the bookmarks
+and the page numbers. pypdf assembles the merged document in memory, so the
+finished pages of every section are held until it is written: about the
+size of the output file, not of the layout.
+"""
+
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from xml.sax.saxutils import escape
+
+import django
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.db import connections
+from django.db.models import Count
+from django.utils import dateformat
+from pypdf import PdfReader, PdfWriter
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import (
+    BaseDocTemplate,
+    Frame,
+    Image,
+    NextPageTemplate,
+    PageTemplate,
+    Paragraph,
+    Spacer,
+    Table,
+    TableStyle,
+)
+
+from .databases import close_connection
+from .models import Asset
+from .sharding import ShardedQuerySet, can_query_in_threads
+
+PAGE_SIZE = landscape(A4)
+MARGIN = 1 * cm
+
+FONT = "Helvetica"
+FONT_BOLD = "Helvetica-Bold"
+BODY_FONT_SIZE = 7
+HEADER_FONT_SIZE = 7
+CELL_PADDING = 3
+
+# (header, width in points); widths add up to the printable page width.
+COLUMNS = [
+    ("Asset ID", 70),
+    ("Name", 95),
+    ("Branch", 85),
+    ("Department", 60),
+    ("Manufacturer", 60),
+    ("Serial Number", 75),
+    ("Purchase Date", 50),
+    ("Custodian", 75),
+    ("Phone", 65),
+    ("Status", 50),
+    ("Condition", 45),
+    ("Cost", 55),
+]
+COLUMN_WIDTHS = [width for _, width in COLUMNS]
+
+LOGOS = ["images/logos/presb logo1.png", "images/logos/presb logo2.png"]
+
+# Rows per platypus Table. Small tables keep page splitting cheap; the
+# column header is repeated by the page template rather than per table.
+TABLE_ROWS = 100
+
+HEADER_STYLE = TableStyle(
+    [
+        ("BACKGROUND", (0, 0), (-1, -1), colors.HexColor("#2c3e50")),
+        ("TEXTCOLOR", (0, 0), (-1, -1), colors.white),
+        ("FONT", (0, 0), (-1, -1), FONT_BOLD, HEADER_FONT_SIZE),
+        ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.HexColor("#2c3e50")),
+        ("TOPPADDING", (0, 0), (-1, -1), CELL_PADDING),
+        ("BOTTOMPADDING", (0, 0), (-1, -1), CELL_PADDING),
+    ]
+)
+
+BODY_STYLE = TableStyle(
+    [
+        ("FONT", (0, 0), (-1, -1), FONT, BODY_FONT_SIZE),
+        ("TEXTCOLOR", (0, 0), (-1, -1), colors.HexColor("#333333")),
+        ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.HexColor("#bdc3c7")),
+        ("TOPPADDING", (0, 0), (-1, -1), CELL_PADDING),
+        ("BOTTOMPADDING", (0, 0), (-1, -1), CELL_PADDING),
+    ]
+)
+
+
+class _LazyStory(list):
+    """
+    A story that pulls the next flowable from an iterator whenever the
+    layout loop has consumed everything before it.
+    """
+
+    def __init__(self, flowables):
+        super().__init__()
+        self._pending = iter(flowables)
+
+    def __len__(self):
+        if not super().__len__():
+            flowable = next(self._pending, None)
+            if flowable is not None:
+                self.append(flowable)
+        return super().__len__()
+
+
+def _header_table():
+    table = Table([[header for header, _ in COLUMNS]], colWidths=COLUMN_WIDTHS)
+    table.setStyle(HEADER_STYLE)
+    return table
+
+
+def _fit(value, width):
+    """Wrap ``value`` onto several lines if it is wider than its cell."""
+    text = str(value)
+    available = width - 2 * CELL_PADDING
+    if stringWidth(text, FONT, BODY_FONT_SIZE) <= available:
+        return text
+    return "\n".join(simpleSplit(text, FONT, BODY_FONT_SIZE, available))
+
+
+def iter_report_rows(assets):
+    departments = dict(Asset.DEPARTMENT_CHOICES)
+    statuses = dict(Asset.STATUS_CHOICES)
+    conditions = dict(Asset.CONDITION_CHOICES)
+
+    rows = assets.values_list(
+        "asset_id",
+        "name",
+        "branch__name",
+        "department",
+        "brand",
+        "serial_number",
+        "purchase_date",
+        "custodian_name",
+        "custodian_phone",
+        "status",
+        "condition",
+        "purchase_cost",
+    ).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+    for (
+        asset_id,
+        name,
+        branch_name,
+        department,
+        brand,
+        serial_number,
+        purchase_date,
+        custodian_name,
+        custodian_phone,
+        status,
+        condition,
+        purchase_cost,
+    ) in rows:
+        values = [
+            asset_id,
+            name,
+            branch_name,
+            departments.get(department, department),
+            brand,
+            serial_number,
+            purchase_date.strftime("%d/%m/%Y") if purchase_date else "",
+            custodian_name,
+            custodian_phone,
+            statuses.get(status, status),
+            conditions.get(condition, condition),
+            purchase_cost,
+        ]
+        yield [_fit(value, width) for value, width in zip(values, COLUMN_WIDTHS)]
+
+
+def _title_block(report_period):
+    def style(size, bold=False, leading=None):
+        return ParagraphStyle(
+            "title",
+            fontName=FONT_BOLD if bold else FONT,
+            fontSize=size,
+            leading=leading or size * 1.3,
+            alignment=1,
+        )
+
+    text = [
+        Paragraph("PRESBYTERIAN CHURCH IN CAMEROON", style(14, bold=True)),
+        Paragraph("PCC HEALTH SERVICES", style(12, bold=True)),
+        Paragraph(
+            f"BIOMEDICAL EQUIPMENT INVENTORY FORM FOR THE YEAR: {report_period}<br/>"
+            "INSTITUTION: PRESBYTERIAN DIAGNOSTIC URGENT CARE HOSPITAL (PDUCH)",
+            style(10),
+        ),
+    ]
+
+    logos = []
+    for logo in LOGOS:
+        path = finders.find(logo)
+        logos.append(
+            Image(path, width=60, height=60, kind="proportional") if path else ""
+        )
+
+    printable = PAGE_SIZE[0] - 2 * MARGIN
+    table = Table(
+        [[logos[0], text, logos[1]]],
+        colWidths=[printable * 0.15, printable * 0.7, printable * 0.15],
+    )
+    table.setStyle(
+        TableStyle(
+            [
+                ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+            ]
+        )
+    )
+    return table
+
+
+def _iter_story(assets, report_period, heading, progress):
+    if report_period:
+        yield _title_block(report_period)
+        yield Spacer(1, 20)
+    if heading:
+        # Paragraph text is markup; the heading holds a user's branch name.
+        yield Paragraph(
+            escape(heading),
+            ParagraphStyle("heading", fontName=FONT_BOLD, fontSize=10, leading=14),
+        )
+        yield Spacer(1, 4)
+    yield NextPageTemplate("later")
+    yield _header_table()
+
+    rows = iter_report_rows(assets)
+    done = 0
+    while True:
+        chunk = list(islice(rows, TABLE_ROWS))
+        if not chunk:
+            return
+        table = Table(chunk, colWidths=COLUMN_WIDTHS)
+        table.setStyle(BODY_STYLE)
+        yield table
+        done += len(chunk)
+        if progress is not None:
+            progress(done)
+
+
+def render_section(
+    assets, output, generated_at, title=True, heading=None, progress=None
+):
+    """
+    Lay out one section of the report: the title block when ``title`` is
+    set, an optional ``heading`` line and the table of ``assets``. Page
+    numbers are left to ``stamp_page_numbers`` so that they run across
+    sections.
+    """
+    report_period = generated_at.strftime("%B %Y").upper() if title else None
+    footer = (
+        f"Generated on: {dateformat.format(generated_at, 'F j, Y, g:i a')} "
+        "| Source: PDUCH Inventory System"
+    )
+
+    header = _header_table()
+    _, header_height = header.wrap(PAGE_SIZE[0] - 2 * MARGIN, PAGE_SIZE[1])
+
+    def draw_footer(canvas, doc):
+        canvas.saveState()
+        canvas.setFont(FONT, 7)
+        canvas.setFillColor(colors.HexColor("#777777"))
+        canvas.drawString(MARGIN, MARGIN / 2, footer)
+        canvas.restoreState()
+
+    def draw_later_page(canvas, doc):
+        # Repeat the column header at the top of every continuation page.
+        header.drawOn(canvas, MARGIN, PAGE_SIZE[1] - MARGIN - header_height)
+        draw_footer(canvas, doc)
+
+    width = PAGE_SIZE[0] - 2 * MARGIN
+    height = PAGE_SIZE[1] - 2 * MARGIN
+    doc = BaseDocTemplate(
+        output,
+        pagesize=PAGE_SIZE,
+        leftMargin=MARGIN,
+        rightMargin=MARGIN,
+        topMargin=MARGIN,
+        bottomMargin=MARGIN,
+        title="Inventory Report",
+    )
+    doc.addPageTemplates(
+        [
+            PageTemplate(
+                id="first",
+                frames=[Frame(MARGIN, MARGIN, width, height, 0, 0, 0, 0)],
+                onPage=draw_footer,
+            ),
+            PageTemplate(
+                id="later",
+                frames=[
+                    Frame(MARGIN, MARGIN, width, height - header_height, 0, 0, 0, 0)
+                ],
+                onPage=draw_later_page,
+            ),
+        ]
+    )
+    doc.build(_LazyStory(_iter_story(assets, report_period, heading, progress)))
+
+
+def stamp_page_numbers(writer):
+    """Draw "Page N of M" on every page of ``writer``."""
+    total = len(writer.pages)
+    overlay = io.BytesIO()
+    canvas = Canvas(overlay, pagesize=PAGE_SIZE)
+    for number in range(1, total + 1):
+        canvas.setFont(FONT, 7)
+        canvas.setFillColor(colors.HexColor("#777777"))
+        canvas.drawRightString(
+            PAGE_SIZE[0] - MARGIN, MARGIN / 2, f"Page {number} of {total}"
+        )
+        canvas.showPage()
+    canvas.save()
+
+    for page, stamp in zip(writer.pages, PdfReader(overlay).pages):
+        page.merge_page(stamp)
+
+
+def _use_database(alias, settings_dict):
+    """Point ``alias`` at ``settings_dict`` in this process, if it differs."""
+    if connections.settings.get(alias) != settings_dict:
+        close_connection(alias)
+        connections.settings[alias] = settings_dict
+
+
+def _render_section_file(query, db, settings_dict, generated_at, title, heading):
+    """
+    Process pool entry point: render one section into a temporary file.
+    ``settings_dict`` is the parent's configuration of ``db``, which may have
+    been set at runtime (a test or scratch database) rather than in settings.
+    """
+    _use_database(db, settings_dict)
+    assets = Asset.objects.using(db)
+    assets.query = query
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as output:
+        render_section(assets, output, generated_at, title=title, heading=heading)
+    return output.name
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Workers are spawned rather than forked so that they never share
+            # the parent's database connections; each one sets Django up once
+            # and is reused for later exports.
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.ASSET_PDF_WORKERS or os.cpu_count(),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            )
+        return _pool
+
+
+def _can_render_in_workers(assets):
+    """
+    Worker processes open their own database connections, so they only see
+    committed rows in a database file or server.
+    """
+    workers = settings.ASSET_PDF_WORKERS or os.cpu_count()
+    if workers < 2:
+        return False
+    if isinstance(assets, ShardedQuerySet):
+        return can_query_in_threads(assets.databases)
+    return can_query_in_threads([assets.db])
+
+
+def _branch_assets(assets, branch_id):
+    """A plain queryset of the assets of one branch, from its shard."""
+    if isinstance(assets, ShardedQuerySet):
+        return assets.for_branch(branch_id)
+    return assets.filter(branch_id=branch_id)
+
+
+def render_assets_pdf_reportlab(assets, output, progress=None):
+    """
+    Render the inventory report for ``assets`` into ``output`` and return
+    True. ``progress`` is called with the number of rows laid out so far.
+
+    Each branch is rendered as its own section, in a process pool when the
+    data is visible to other processes, and the sections are merged into
+    one document with a bookmark per branch.
+    """
+    generated_at = datetime.now()
+    branches = list(
+        assets.order_by()
+        .values_list("branch_id", "branch__name", "branch__code")
+        .annotate(rows=Count("pk"))
+        .order_by("branch__name", "branch_id")
+    )
+    if isinstance(assets, ShardedQuerySet):
+        # Each shard's branches come sorted on their own.
+        branches.sort(key=lambda branch: (branch[1], branch[0]))
+
+    writer = PdfWriter()
+    if not branches:
+        section = io.BytesIO()
+        render_section(assets.none(), section, generated_at)
+        writer.append(section)
+    elif _can_render_in_workers(assets):
+        pool = get_process_pool()
+        sections = [_branch_assets(assets, branch_id) for branch_id, *_ in branches]
+        futures = [
+            pool.submit(
+                _render_section_file,
+                section.query,
+                section.db,
+                connections[section.db].settings_dict,
+                generated_at,
+                index == 0,
+                f"{name} ({code})",
+            )
+            for index, (section, (_, name, code, _)) in enumerate(
+                zip(sections, branches)
+            )
+        ]
+        try:
+            done = 0
+            for future, (_, name, code, rows) in zip(futures, branches):
+                writer.append(future.result(), outline_item=f"{name} ({code})")
+                done += rows
+                if progress is not None:
+                    progress(done)
+        finally:
+            for future in futures:
+                future.cancel()
+            for future in futures:
+                if not future.cancelled() and future.exception() is None:
+                    os.remove(future.result())
+    else:
+        done = 0
+        for index, (branch_id, name, code, rows) in enumerate(branches):
+            section = io.BytesIO()
+            render_section(
+                _branch_assets(assets, branch_id),
+                section,
+                generated_at,
+                title=index == 0,
+                heading=f"{name} ({code})",
+            )
+            writer.append(section, outline_item=f"{name} ({code})")
+            done += rows
+            if progress is not None:
+                progress(done)
+
+    stamp_page_numbers(writer)
+    writer.write(output)
+    return True
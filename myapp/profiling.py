@@ -0,0 +1,112 @@
+"""
+Profiling of single requests for ``ProfilingMiddleware``.
+
+A profiled view runs under cProfile and tracemalloc. Its ``.prof`` dump (for
+``python -m pstats`` or snakeviz) and a text report of the slowest functions
+and the largest allocations are written to ``PROFILE_DIR``, which keeps only
+the newest ``PROFILE_MAX_FILES`` profiles.
+
+tracemalloc is process-wide, so one call is profiled at a time; calls made
+while another is being profiled just run.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+
+from django.utils import timezone
+
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 30
+
+_profiling = threading.Lock()
+
+
+def profile_call(func, directory, label, description=""):
+    """
+    Call ``func()`` under cProfile and tracemalloc and write its profile to
+    ``directory``. Returns ``(result, name)``; the profile files are
+    ``name.prof`` and ``name.txt``. ``name`` is None if another call was
+    being profiled, in which case ``func()`` ran without profiling.
+    """
+    if not _profiling.acquire(blocking=False):
+        return func(), None
+    try:
+        return _profile_call(func, directory, label, description)
+    finally:
+        _profiling.release()
+
+
+def _profile_call(func, directory, label, description):
+    profiler = cProfile.Profile()
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        result = func()
+    finally:
+        profiler.disable()
+        seconds = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        if not tracing:
+            tracemalloc.stop()
+
+    name = f"{timezone.now():%Y%m%d-%H%M%S}-{label}-{uuid.uuid4().hex[:8]}"
+    os.makedirs(directory, exist_ok=True)
+    profiler.dump_stats(os.path.join(directory, f"{name}.prof"))
+    with open(os.path.join(directory, f"{name}.txt"), "w") as f:
+        f.write(report(profiler, snapshot, seconds, peak, description))
+    return result, name
+
+
+def report(profiler, snapshot, seconds, peak, description=""):
+    out = io.StringIO()
+    if description:
+        out.write(f"{description}\n")
+    out.write(f"{seconds * 1000:.1f}ms, peak traced memory {peak / 1024:.0f} KB\n")
+
+    out.write(f"\nTop {TOP_ALLOCATIONS} allocations by line:\n")
+    snapshot = snapshot.filter_traces(
+        [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ]
+    )
+    for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+        frame = stat.traceback[0]
+        out.write(
+            f"{stat.size / 1024:10.1f} KB {stat.count:8d} blocks  "
+            f"{frame.filename}:{frame.lineno}\n"
+        )
+
+    out.write(f"\nTop {TOP_FUNCTIONS} functions by cumulative time:\n")
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+    return out.getvalue()
+
+
+def trim_profiles(directory, max_files):
+    """Delete all but the newest ``max_files`` profiles in ``directory``."""
+    profiles = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            stem, extension = os.path.splitext(entry.name)
+            if extension in (".prof", ".txt") and entry.is_file():
+                mtime = entry.stat().st_mtime
+                profiles[stem] = max(profiles.get(stem, 0), mtime)
+    stale = sorted(profiles, key=profiles.get, reverse=True)[max_files:]
+    for stem in stale:
+        for extension in (".prof", ".txt"):
+            try:
+                os.remove(os.path.join(directory, stem + extension))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,117 @@
+"""
+Database routing for asset shards and the read replica.
+
+With ``ASSET_SHARDS`` set, assets are written to their branch's shard (see
+``myapp.sharding``), and models that only live in the primary are never
+looked up in a shard through an asset's relations.
+
+While a request is routed to the replica (see ``ReadReplicaMiddleware``),
+reads of this app's models go to the replica alias. Users, sessions and
+every write always use the primary, so logging in and saving never depend
+on how far behind the replica is. Shards have no replica.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from .sharding import asset_databases, shard_for_branch, sharding_enabled
+
+# Models stored in the shards; branches are copied there for joins.
+SHARDED_MODELS = {"asset", "assetrollup"}
+
+_read_alias = ContextVar("read_alias", default=None)
+
+
+def route_reads_to(alias):
+    """Send reads to ``alias`` until ``stop_routing()`` is called with the result."""
+    return _read_alias.set(alias)
+
+
+def stop_routing(token):
+    _read_alias.reset(token)
+
+
+@contextmanager
+def reading_from(alias):
+    token = route_reads_to(alias)
+    try:
+        yield
+    finally:
+        stop_routing(token)
+
+
+def iter_reading_from(alias, iterable):
+    """
+    Iterate ``iterable`` with reads routed to ``alias``, such as the body of
+    a streaming response generated after its view has returned. Routing is
+    only in effect while each item is produced.
+    """
+    iterator = iter(iterable)
+    while True:
+        with reading_from(alias):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+class AssetShardRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get("instance")
+        if instance is None or instance._state.db == DEFAULT_DB_ALIAS:
+            return None
+        if model._meta.app_label == "myapp" and model._meta.model_name in (
+            *SHARDED_MODELS,
+            "branch",
+        ):
+            return None
+        if instance._state.db in asset_databases():
+            # e.g. an asset's creator, which is only in the primary.
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get("instance")
+        if (
+            instance is None
+            or model._meta.app_label != "myapp"
+            or model._meta.model_name not in SHARDED_MODELS
+            or not sharding_enabled()
+        ):
+            return None
+        if instance._state.db is not None and not instance._state.adding:
+            return instance._state.db
+        return shard_for_branch(instance.branch_id)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = asset_databases()
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == "myapp":
+            return _read_alias.get()
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Explicit, or instances read from the replica would be saved there.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, settings.READ_REPLICA_ALIAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is a copy of the primary, schema included.
+        if db == settings.READ_REPLICA_ALIAS:
+            return False
+        return None
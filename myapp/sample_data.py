@@ -0,0 +1,629 @@
+"""
+Deterministic synthetic branches, users and assets for load testing.
+
+Everything is drawn from ``random.Random(seed)``, so the same options always
+produce the same rows. Assets are written in batches straight through the
+cursor: building a model instance per row costs far more than SQLite spends
+inserting it, and the scale mode is meant to reach millions of rows.
+"""
+
+import datetime
+import random
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from functools import partial
+from itertools import repeat
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Asset, AssetRollup, Branch, UserRole
+from .search import drop_fts_triggers, fts_enabled, rebuild_fts
+
+DEFAULT_BATCH_SIZE = 10000
+
+# SQLite page cache while loading, in KiB (negative values are sizes).
+LOAD_CACHE_SIZE = -256 * 1024
+
+USER_PASSWORD = "Sample123!"
+USER_DOMAIN = "sample.hospital.cm"
+
+# Timestamps end here rather than at the current time so a seed always
+# produces the same rows.
+END_DATE = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+HISTORY = datetime.timedelta(days=5 * 365)
+
+SITES = [
+    ("Yaoundé", "YAO", "Centre"),
+    ("Mbalmayo", "MBA", "Centre"),
+    ("Douala", "DLA", "Littoral"),
+    ("Edéa", "EDE", "Littoral"),
+    ("Nkongsamba", "NKO", "Littoral"),
+    ("Bamenda", "BAM", "North-West"),
+    ("Kumbo", "KUM", "North-West"),
+    ("Buea", "BUE", "South-West"),
+    ("Limbe", "LIM", "South-West"),
+    ("Kumba", "KBA", "South-West"),
+    ("Bafoussam", "BAF", "West"),
+    ("Dschang", "DSC", "West"),
+    ("Ngaoundéré", "NGA", "Adamawa"),
+    ("Garoua", "GAR", "North"),
+    ("Maroua", "MAR", "Far North"),
+    ("Kousséri", "KOU", "Far North"),
+    ("Bertoua", "BER", "East"),
+    ("Ebolowa", "EBO", "South"),
+    ("Kribi", "KRI", "South"),
+]
+
+HOSPITAL_KINDS = [
+    ("Central Hospital", "CH"),
+    ("General Hospital", "GH"),
+    ("Regional Hospital", "RH"),
+    ("District Hospital", "DH"),
+]
+
+FIRST_NAMES = [
+    "Samuel",
+    "Alice",
+    "Joseph",
+    "Yannick",
+    "Marc",
+    "Amandine",
+    "Jean",
+    "Franck",
+    "Emmanuel",
+    "Peter",
+    "Henry",
+    "Victoria",
+    "Rose",
+    "Brigitte",
+    "Paul",
+    "Grace",
+    "Eric",
+    "Mireille",
+    "Serge",
+    "Estelle",
+    "Blaise",
+    "Nadine",
+    "Christian",
+    "Sandrine",
+]
+
+LAST_NAMES = [
+    "Fokoua",
+    "Mbelle",
+    "Nkosi",
+    "Mensah",
+    "Anye",
+    "Koa",
+    "Tala",
+    "Che",
+    "Molua",
+    "Teke",
+    "Bah",
+    "Nyanga",
+    "Ndi",
+    "Tchoumi",
+    "Ngono",
+    "Abena",
+    "Fon",
+    "Nkeng",
+    "Atangana",
+    "Mbarga",
+    "Njoya",
+    "Kamga",
+    "Tabi",
+    "Ewane",
+]
+
+SUPPLIERS = [
+    "MediTech Solutions",
+    "Medical Imaging Ltd",
+    "Healthcare Supplies Co",
+    "Toyota Motors Cameroon",
+    "Power Solutions Ltd",
+    "Furniture Suppliers",
+    "Tech Store",
+    "Laboratory Equipment",
+    "Central Medical Stores",
+    "Afrique Biomédical",
+]
+
+CLINICAL = ["emergency", "surgery", "maternity", "pediatrics", "radiology"]
+
+# (name, brand, model, lowest cost, highest cost, departments) per category.
+CATALOG = {
+    "medical_equipment": [
+        ("Ultrasound Machine", "GE", "Logiq E9", 20e6, 60e6, CLINICAL),
+        ("X-Ray Machine", "Siemens", "AXIOM", 80e6, 150e6, ["radiology"]),
+        ("Patient Monitor", "Philips", "IntelliVue", 3e6, 10e6, CLINICAL),
+        ("Infusion Pump", "B. Braun", "Infusomat Space", 1e6, 3e6, CLINICAL),
+        ("Defibrillator", "Zoll", "R Series", 4e6, 9e6, ["emergency", "surgery"]),
+        ("Ventilator", "Dräger", "Evita V300", 15e6, 30e6, ["emergency", "surgery"]),
+        ("Incubator", "Atom", "Dual Incu i", 6e6, 12e6, ["maternity", "pediatrics"]),
+        ("Autoclave", "Tuttnauer", "A3850", 5e6, 9e6, ["laboratory", "surgery"]),
+        ("Microscope", "Olympus", "CX23", 1e6, 2.5e6, ["laboratory"]),
+        ("Centrifuge", "Eppendorf", "5702", 1.5e6, 3e6, ["laboratory"]),
+    ],
+    "vehicle": [
+        ("Ambulance", "Toyota", "Hiace", 30e6, 40e6, ["emergency"]),
+        ("Ambulance", "Nissan", "NV200", 25e6, 32e6, ["emergency"]),
+        ("Pickup", "Toyota", "Hilux", 20e6, 28e6, ["administration", "maintenance"]),
+        ("Motorcycle", "Yamaha", "AG200", 1.5e6, 2.5e6, ["administration", "other"]),
+    ],
+    "generator": [
+        ("Generator", "Cummins", "C250", 15e6, 22e6, ["maintenance"]),
+        ("Generator", "Perkins", "GP75", 18e6, 26e6, ["maintenance"]),
+        ("Generator", "Caterpillar", "DE110", 20e6, 30e6, ["maintenance"]),
+    ],
+    "furniture": [
+        ("Hospital Bed", "Standard", "Adjustable", 300e3, 900e3, CLINICAL),
+        ("Examination Couch", "Standard", "EC-2", 150e3, 400e3, CLINICAL),
+        ("Wheelchair", "Invacare", "Action 2", 100e3, 300e3, ["emergency", "other"]),
+        ("Office Desk", "Standard", "D-120", 80e3, 250e3, ["administration"]),
+        ("Filing Cabinet", "Standard", "FC-4", 60e3, 200e3, ["administration"]),
+    ],
+    "computer": [
+        ("Desktop Computer", "Dell", "OptiPlex 7090", 600e3, 1.2e6, ["administration"]),
+        ("Laptop", "HP", "ProBook 450", 500e3, 1e6, ["administration", "laboratory"]),
+        ("Laptop", "Lenovo", "ThinkPad E14", 550e3, 1.1e6, ["administration"]),
+        ("Printer", "HP", "LaserJet M404", 200e3, 450e3, ["administration", "other"]),
+    ],
+    "other": [
+        ("Vaccine Refrigerator", "Haier", "HBC-150", 2e6, 4e6, ["pediatrics", "other"]),
+        ("Air Conditioner", "LG", "Dual Inverter", 400e3, 900e3, ["other"]),
+        ("Water Dispenser", "Nasco", "WD-16", 80e3, 150e3, ["other"]),
+    ],
+}
+
+# Relative frequency of each category, status and condition.
+CATEGORY_WEIGHTS = {
+    "medical_equipment": 35,
+    "furniture": 30,
+    "computer": 20,
+    "other": 8,
+    "vehicle": 4,
+    "generator": 3,
+}
+STATUS_WEIGHTS = {"in_use": 60, "available": 22, "maintenance": 10, "retired": 8}
+CONDITION_WEIGHTS = {"excellent": 25, "good": 45, "fair": 20, "poor": 10}
+
+# Columns of the generated asset rows, in order.
+ASSET_FIELDS = [
+    "asset_id",
+    "name",
+    "category",
+    "brand",
+    "model",
+    "serial_number",
+    "branch",
+    "department",
+    "purchase_date",
+    "purchase_cost",
+    "supplier_name",
+    "status",
+    "condition",
+    "custodian_name",
+    "custodian_phone",
+    "created_by",
+    "created_at",
+    "updated_at",
+]
+
+# Columns of ASSET_FIELDS that make up an ``AssetRollup`` bucket.
+ROLLUP_FIELDS = ["branch", "status", "category", "department"]
+
+
+def _weighted(pairs):
+    """Turn ``(value, weight)`` pairs into values and cumulative weights."""
+    values = []
+    cum_weights = []
+    total = 0
+    for value, weight in pairs:
+        total += weight
+        values.append(value)
+        cum_weights.append(total)
+    return values, cum_weights
+
+
+def _pick(rng, weighted, count):
+    values, cum_weights = weighted
+    return rng.choices(values, cum_weights=cum_weights, k=count)
+
+
+# Each catalog entry gets an equal share of its category's weight, and
+# carries the prefix of its serial numbers.
+_ITEMS = _weighted(
+    ((category, *item, item[1][:3].upper()), CATEGORY_WEIGHTS[category] / len(items))
+    for category, items in CATALOG.items()
+    for item in items
+)
+_STATUSES = _weighted(STATUS_WEIGHTS.items())
+_CONDITIONS = _weighted(CONDITION_WEIGHTS.items())
+
+# Phone numbers are assembled from these parts, drawn a column at a time.
+_PHONE_PREFIXES = [f"+237 6{prefix}" for prefix in range(50, 100)]
+_PHONE_DIGITS = [f"{digits:03d}" for digits in range(1000)]
+
+
+def _person(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def _phone(rng):
+    return (
+        f"+237 6{rng.randint(50, 99)} {rng.randint(100, 999)} "
+        f"{rng.randint(100, 999)}"
+    )
+
+
+def generate_branches(rng, count):
+    """Return ``count`` unsaved branches spread over the regions."""
+    branches = []
+    for i in range(count):
+        city, city_code, region = SITES[i % len(SITES)]
+        kind, kind_code = HOSPITAL_KINDS[(i // len(SITES)) % len(HOSPITAL_KINDS)]
+        name = f"{city} {kind}"
+        if i >= len(SITES) * len(HOSPITAL_KINDS):
+            name += f" {i // (len(SITES) * len(HOSPITAL_KINDS)) + 1}"
+        branches.append(
+            Branch(
+                name=name,
+                code=f"{city_code}-{kind_code}-{i + 1:04d}",
+                city=city,
+                region=region,
+                manager_name=f"Dr. {_person(rng)}",
+                manager_phone=_phone(rng),
+                status="inactive" if rng.random() < 0.05 else "active",
+            )
+        )
+    return branches
+
+
+def generate_users(rng, count, branches):
+    """
+    Return ``count`` unsaved ``(user, role, branch)`` triples: about one
+    super admin in fifty, then one branch manager per branch, then inventory
+    officers spread over the branches.
+    """
+    password = make_password(USER_PASSWORD)
+    super_admins = max(1, count // 50) if branches else count
+    users = []
+    for i in range(count):
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        username = f"user{i + 1:05d}@{USER_DOMAIN}"
+        if i < super_admins:
+            role, branch = "super_admin", None
+        else:
+            staff_number = i - super_admins
+            branch = branches[staff_number % len(branches)]
+            if staff_number < len(branches):
+                role = "branch_manager"
+            else:
+                role = "inventory_officer"
+        user = User(
+            username=username,
+            email=username,
+            first_name=first_name,
+            last_name=last_name,
+            password=password,
+            is_superuser=role == "super_admin",
+            is_staff=role == "super_admin",
+        )
+        users.append((user, role, branch))
+    return users
+
+
+def generate_asset_rows(rng, branches, users, count, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Yield ``count`` asset rows in batches of lists ordered like
+    ``ASSET_FIELDS``, with the asset ID left as None.
+
+    Rows come out oldest first and spread over the last five years. Branch
+    sizes are skewed, as real hospitals are, and each asset is recorded by
+    one of its branch's staff where there are any. Every column of a batch
+    is drawn at once, about three times faster than choosing per row.
+    """
+    branch_ids = [branch.pk for branch in branches]
+    branch_sizes = _weighted(
+        (branch_id, rng.paretovariate(1.5)) for branch_id in branch_ids
+    )
+
+    staff = {branch_id: [] for branch_id in branch_ids}
+    admins = []
+    for user, role, branch in users:
+        if branch is None:
+            admins.append(user.pk)
+        else:
+            staff[branch.pk].append(user.pk)
+    recorders = {
+        branch_id: staff[branch_id] or admins or [None] for branch_id in branch_ids
+    }
+
+    # Naive timestamps in the connection's time zone are what the backend
+    # would store anyway, and skip a conversion per value when inserted.
+    end = timezone.make_naive(END_DATE, connection.timezone)
+    start = end - HISTORY
+    step = HISTORY / max(count, 1)
+    # Purchases are registered up to two years after they are made.
+    purchase_lags = [datetime.timedelta(days=days) for days in range(731)]
+    random = rng.random
+    for first in range(0, count, batch_size):
+        size = min(batch_size, count - first)
+        batch = []
+        columns = zip(
+            range(first, first + size),
+            _pick(rng, branch_sizes, size),
+            _pick(rng, _ITEMS, size),
+            _pick(rng, _STATUSES, size),
+            _pick(rng, _CONDITIONS, size),
+            rng.choices(FIRST_NAMES, k=size),
+            rng.choices(LAST_NAMES, k=size),
+            rng.choices(SUPPLIERS, k=size),
+            rng.choices(_PHONE_PREFIXES, k=size),
+            rng.choices(_PHONE_DIGITS, k=size),
+            rng.choices(_PHONE_DIGITS, k=size),
+        )
+        for (
+            number,
+            branch_id,
+            item,
+            status,
+            condition,
+            first_name,
+            last_name,
+            supplier,
+            phone_prefix,
+            phone_middle,
+            phone_last,
+        ) in columns:
+            category, name, brand, model, low, high, departments, prefix = item
+            created_at = start + step * number
+            purchase_date = (created_at - purchase_lags[int(random() * 731)]).date()
+            if random() < 0.2:
+                updated_at = min(
+                    created_at + datetime.timedelta(days=random() * 365), end
+                )
+            else:
+                updated_at = created_at
+            staff_ids = recorders[branch_id]
+            batch.append(
+                [
+                    None,
+                    name,
+                    category,
+                    brand,
+                    model,
+                    f"{prefix}-{number + 1:08d}",
+                    branch_id,
+                    (
+                        departments[int(random() * len(departments))]
+                        if random() < 0.97
+                        else "other"
+                    ),
+                    purchase_date,
+                    int(low + random() * (high - low)) // 1000 * 1000,
+                    supplier,
+                    status,
+                    condition,
+                    f"{first_name} {last_name}",
+                    f"{phone_prefix} {phone_middle} {phone_last}",
+                    staff_ids[int(random() * len(staff_ids))],
+                    created_at,
+                    updated_at,
+                ]
+            )
+        yield batch
+
+
+def _adapters(fields):
+    """Return ``(index, conversion)`` for the fields the backend converts."""
+    if connection.vendor == "sqlite":
+        # The strings Django's SQLite adapters would store for naive values,
+        # made by C methods rather than a call from the driver back into
+        # Python per value. The driver stores integer costs as they are.
+        adapters = []
+        for index, field in enumerate(fields):
+            internal_type = field.get_internal_type()
+            if internal_type == "DateTimeField":
+                adapters.append((index, partial(datetime.datetime.isoformat, sep=" ")))
+            elif internal_type == "DateField":
+                adapters.append((index, datetime.date.isoformat))
+        return adapters
+
+    ops = connection.ops
+    # ``updated_at`` is usually the very object in ``created_at``, so a
+    # timestamp is only converted when it differs from the previous one.
+    last = [None, None]
+
+    def adapt_datetime(value):
+        if value is not last[0]:
+            last[:] = value, ops.adapt_datetimefield_value(value)
+        return last[1]
+
+    adapters = []
+    for index, field in enumerate(fields):
+        internal_type = field.get_internal_type()
+        if internal_type == "DateTimeField":
+            adapters.append((index, adapt_datetime))
+        elif internal_type == "DateField":
+            adapters.append((index, ops.adapt_datefield_value))
+        elif internal_type == "DecimalField":
+            adapt_decimal = partial(
+                ops.adapt_decimalfield_value,
+                max_digits=field.max_digits,
+                decimal_places=field.decimal_places,
+            )
+            adapters.append((index, adapt_decimal))
+    return adapters
+
+
+def insert_asset_rows(batches, progress=None):
+    """
+    Insert batches of rows ordered like ``ASSET_FIELDS`` with one statement
+    per batch, reserving their asset IDs and counting them in the rollups,
+    and return the number inserted. ``progress(rows inserted)`` is called
+    after every batch.
+
+    Each batch is handled a column at a time, so IDs, conversions and
+    rollup keys are applied by ``map`` and ``zip`` instead of a Python loop
+    over the rows.
+    """
+    fields = [Asset._meta.get_field(name) for name in ASSET_FIELDS]
+    # Columns the generator leaves alone get their model default.
+    defaults = [
+        field
+        for field in Asset._meta.concrete_fields
+        if not field.primary_key and field not in fields
+    ]
+    ops = connection.ops
+    adapters = _adapters(fields)
+    default_values = [
+        field.get_db_prep_save(field.get_default(), connection) for field in defaults
+    ]
+
+    columns = ", ".join(ops.quote_name(field.column) for field in [*fields, *defaults])
+    placeholders = ", ".join(["%s"] * (len(fields) + len(defaults)))
+    table = ops.quote_name(Asset._meta.db_table)
+    sql = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
+
+    bucket = [ASSET_FIELDS.index(name) for name in ROLLUP_FIELDS]
+    cost = ASSET_FIELDS.index("purchase_cost")
+    counts = Counter()
+    costs = defaultdict(int)
+
+    inserted = 0
+    with connection.cursor() as cursor:
+        for batch in batches:
+            size = len(batch)
+            values = list(zip(*batch))
+            values[0] = Asset.allocate_asset_ids(size)
+            keys = list(zip(*(values[index] for index in bucket)))
+            counts.update(keys)
+            for key, value in zip(keys, values[cost]):
+                costs[key] += value
+            for index, adapt in adapters:
+                values[index] = map(adapt, values[index])
+            values.extend(repeat(value, size) for value in default_values)
+            cursor.executemany(sql, list(zip(*values)))
+            inserted += size
+            if progress is not None:
+                progress(inserted)
+    AssetRollup.objects.add_buckets(counts, costs)
+    return inserted
+
+
+@contextmanager
+def _bulk_load_settings():
+    """
+    Give SQLite room to keep the leaf pages of every index in memory and
+    skip the fsyncs while loading. With the default 2 MB cache inserts take
+    nearly twice as long. The load is one transaction that a rerun can
+    repeat, so a crash mid-load costs nothing worth syncing for; inside a
+    caller's transaction, where SQLite won't change it, syncing is left
+    alone.
+    """
+    if connection.vendor != "sqlite":
+        yield
+        return
+    pragmas = {"cache_size": LOAD_CACHE_SIZE, "temp_store": 2}
+    if not connection.in_atomic_block:
+        pragmas["synchronous"] = 0
+    with connection.cursor() as cursor:
+        saved = {}
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}")
+            (saved[name],) = cursor.fetchone()
+            cursor.execute(f"PRAGMA {name} = {value}")
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for name, value in saved.items():
+                cursor.execute(f"PRAGMA {name} = {int(value)}")
+
+
+@contextmanager
+def _deferred_indexes(model):
+    """
+    Drop the non-unique indexes of ``model`` and create them again on exit.
+
+    Building an index from the finished table is a single sort. Keeping
+    the asset table's nine secondary indexes up to date instead means their
+    pages compete with the table's for the cache, and a large load spends
+    more time evicting them than sorting. Unique indexes stay, so constraint
+    violations still fail the insert. Run it inside a transaction, so a
+    failed load restores the indexes.
+
+    Only an empty table is handled this way. On one that already holds rows,
+    such as a live database, recreating the indexes would sort every
+    existing row again while the load holds the write lock.
+    """
+    if (
+        connection.vendor != "sqlite"
+        or model._base_manager.using(connection.alias).exists()
+    ):
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name, sql FROM sqlite_master "
+            "WHERE type = 'index' AND tbl_name = %s AND sql IS NOT NULL",
+            [model._meta.db_table],
+        )
+        indexes = [
+            (name, sql)
+            for name, sql in cursor.fetchall()
+            if not sql.upper().startswith("CREATE UNIQUE")
+        ]
+        for name, _ in indexes:
+            cursor.execute(f"DROP INDEX {connection.ops.quote_name(name)}")
+    yield
+    with connection.cursor() as cursor:
+        for _, sql in indexes:
+            cursor.execute(sql)
+
+
+def populate(
+    branches, assets, users, seed=0, batch_size=DEFAULT_BATCH_SIZE, progress=None
+):
+    """
+    Create the given numbers of branches, users and assets from ``seed``
+    in a single transaction. ``progress(assets created)`` is called after
+    every batch of assets.
+
+    A million assets take just under a minute on SQLite on a single core.
+    About a third of that is generating and converting rows in Python; the
+    rest is SQLite inserting them, building the asset indexes and rebuilding
+    the search index.
+    """
+    rng = random.Random(seed)
+    with _bulk_load_settings(), transaction.atomic():
+        new_branches = Branch.objects.bulk_create(generate_branches(rng, branches))
+
+        new_users = generate_users(rng, users, new_branches)
+        User.objects.bulk_create([user for user, _, _ in new_users])
+        UserRole.objects.bulk_create(
+            UserRole(user=user, role=role, branch=branch)
+            for user, role, branch in new_users
+        )
+
+        # The search index is rebuilt in one pass afterwards, which is much
+        # cheaper than updating it row by row through the triggers. The
+        # table itself stays: FTS5 loses track of a table dropped and
+        # recreated inside a savepoint that is later rolled back.
+        search = fts_enabled(connection.alias)
+        if search and assets:
+            drop_fts_triggers(connection)
+
+        batches = generate_asset_rows(rng, new_branches, new_users, assets, batch_size)
+        with _deferred_indexes(Asset):
+            created = insert_asset_rows(batches, progress)
+
+        if search and assets:
+            rebuild_fts(connection)
+
+    return new_branches, new_users, created
@@ -0,0 +1,187 @@
+import re
+
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .sharding import ShardedQuerySet
+
+FTS_TABLE = "myapp_asset_fts"
+
+# Columns indexed by the FTS5 table, in order, with their bm25 weights.
+FTS_COLUMNS = [
+    ("asset_id", 10.0),
+    ("name", 5.0),
+    ("brand", 1.0),
+    ("model", 1.0),
+    ("serial_number", 8.0),
+    ("supplier_name", 1.0),
+    ("custodian_name", 1.0),
+]
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# FTS5 buffers this many bytes of terms in memory before writing a segment.
+# A rebuild gets a large buffer: with the 1 MB default a million rows make
+# thousands of small segments, and merging them is half the rebuild.
+FTS_HASH_SIZE = 1024 * 1024
+FTS_REBUILD_HASH_SIZE = 64 * 1024 * 1024
+
+# Segments merged per write once enough pile up, FTS5's default. A rebuild
+# writes only a few large segments, and merging them as it goes adds a
+# fifth to its time.
+FTS_AUTOMERGE = 4
+
+
+def _column_list(prefix=""):
+    return ", ".join(prefix + column for column, _ in FTS_COLUMNS)
+
+
+def _install_statements():
+    columns = _column_list()
+    new_values = _column_list("new.")
+    old_values = _column_list("old.")
+    return [
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+            {columns},
+            content='myapp_asset',
+            content_rowid='id',
+            prefix='2 3',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON myapp_asset
+        BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, {columns})
+            VALUES (new.id, {new_values});
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON myapp_asset
+        BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns})
+            VALUES ('delete', old.id, {old_values});
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+        AFTER UPDATE OF {columns} ON myapp_asset
+        BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns})
+            VALUES ('delete', old.id, {old_values});
+            INSERT INTO {FTS_TABLE}(rowid, {columns})
+            VALUES (new.id, {new_values});
+        END
+        """,
+    ]
+
+
+def fts_enabled(using="default"):
+    return connections[using].vendor == "sqlite"
+
+
+def install_fts(connection):
+    """
+    Create the FTS5 table and the triggers that keep it in sync.
+
+    SQLite drops triggers when Django rebuilds ``myapp_asset`` during an
+    ``AlterField``, so this is idempotent and re-run by ``rebuild_search_index``
+    and, through ``reinstall_fts_triggers``, after every migration.
+    """
+    with connection.cursor() as cursor:
+        for statement in _install_statements():
+            cursor.execute(statement)
+
+
+def reinstall_fts_triggers(connection):
+    """Restore triggers lost to a table rebuild, if the index is installed."""
+    if FTS_TABLE in connection.introspection.table_names():
+        install_fts(connection)
+
+
+def drop_fts_triggers(connection):
+    """Stop syncing the index, e.g. for a bulk load followed by ``rebuild_fts``."""
+    with connection.cursor() as cursor:
+        for suffix in ("ai", "ad", "au"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}")
+
+
+def uninstall_fts(connection):
+    drop_fts_triggers(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def _configure(cursor, option, value):
+    cursor.execute(
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES (%s, %s)",
+        [option, value],
+    )
+
+
+def rebuild_fts(connection):
+    install_fts(connection)
+    with connection.cursor() as cursor:
+        _configure(cursor, "hashsize", FTS_REBUILD_HASH_SIZE)
+        _configure(cursor, "automerge", 0)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        _configure(cursor, "automerge", FTS_AUTOMERGE)
+        _configure(cursor, "hashsize", FTS_HASH_SIZE)
+
+
+def fts_query(text):
+    """
+    Turn free text into an FTS5 query that prefix-matches every word.
+
+    Each token is quoted so user input can never be parsed as FTS5 syntax,
+    e.g. ``AST-2026-00`` becomes ``"AST"* "2026"* "00"*``.
+    """
+    return " ".join(f'"{token}"*' for token in _TOKEN_RE.findall(text))
+
+
+def search_assets(queryset, text, ranked=False):
+    """
+    Filter an Asset queryset to rows matching ``text``.
+
+    With ``ranked=True`` the rows are annotated with ``search_rank`` (lower
+    is better) and ordered by it. Without FTS5 every row ranks the same.
+    """
+    if isinstance(queryset, ShardedQuerySet):
+        return queryset.map(lambda qs: search_assets(qs, text, ranked))
+
+    query = fts_query(text)
+    if not query or not fts_enabled(queryset.db):
+        if not query:
+            # Text without a single word, such as "---", matches nothing.
+            queryset = queryset.none()
+        else:
+            condition = Q()
+            for column, _ in FTS_COLUMNS:
+                condition |= Q(**{f"{column}__icontains": text})
+            queryset = queryset.filter(condition)
+        if ranked:
+            queryset = queryset.annotate(
+                search_rank=Value(0.0, output_field=FloatField())
+            ).order_by("search_rank")
+        return queryset
+
+    if ranked:
+        # The index is joined rather than ranked through a correlated
+        # subquery, which would run the MATCH again for every hit.
+        weights = ", ".join(str(weight) for _, weight in FTS_COLUMNS)
+        return (
+            queryset.extra(
+                tables=[FTS_TABLE],
+                where=[f"{FTS_TABLE}.rowid = myapp_asset.id", f"{FTS_TABLE} MATCH %s"],
+                params=[query],
+            )
+            .annotate(search_rank=RawSQL(f"bm25({FTS_TABLE}, {weights})", ()))
+            .order_by("search_rank")
+        )
+    return queryset.filter(
+        pk__in=RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (query,)
+        )
+    )
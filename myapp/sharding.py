@@ -0,0 +1,543 @@
+"""
+Sharding of assets by region.
+
+With ``ASSET_SHARDS`` set, every asset (and its dashboard rollups) lives in
+the database of its branch's region; branches of other regions keep theirs
+in ``default``. Branches, users and everything else stay in ``default``, and
+each branch is copied into its shard so asset queries can still join it.
+
+Users scoped to one branch query that branch's shard directly. Queries that
+span every branch, for super admins, go through ``ShardedQuerySet``, which
+runs the same query on every asset database in parallel threads and merges
+the rows in the query's ordering.
+
+Each shard numbers its assets from ``number * ASSET_SHARD_ID_SPAN``, so an
+asset's primary key stays unique across shards and tells where it was
+created.
+"""
+
+import heapq
+import queue
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+from django.db.models.query import (
+    FlatValuesListIterable,
+    ModelIterable,
+    ValuesIterable,
+    ValuesListIterable,
+)
+
+# Rows a parallel iterator buffers per shard, in chunks, ahead of the merge.
+PREFETCH_CHUNKS = 2
+
+
+def sharding_enabled():
+    return bool(settings.ASSET_SHARDS)
+
+
+def asset_databases():
+    """Every database that holds assets, ``default`` first."""
+    return [DEFAULT_DB_ALIAS, *settings.ASSET_SHARDS]
+
+
+def shard_for_region(region):
+    for alias, shard in settings.ASSET_SHARDS.items():
+        if region in shard["regions"]:
+            return alias
+    return DEFAULT_DB_ALIAS
+
+
+# Branch shards known to this process, and the shared version they were
+# read at. Branch saves and deletes replace the version in the default
+# cache, so every worker drops its map on its next lookup.
+BRANCH_SHARDS_VERSION_KEY = "branch-shards-version"
+_branch_shards = {}
+_branch_shards_version = None
+_branch_shards_lock = threading.Lock()
+
+
+def _current_branch_shards():
+    global _branch_shards, _branch_shards_version
+
+    version = cache.get(BRANCH_SHARDS_VERSION_KEY)
+    if version is None:
+        cache.add(BRANCH_SHARDS_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(BRANCH_SHARDS_VERSION_KEY)
+    with _branch_shards_lock:
+        if version is None or version != _branch_shards_version:
+            # A cache that stores nothing keeps nothing here either.
+            _branch_shards = {}
+            _branch_shards_version = version
+        return _branch_shards
+
+
+def invalidate_branch_shards():
+    """Make every worker look branch regions up again."""
+    cache.set(BRANCH_SHARDS_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def shard_for_branch(branch_id):
+    """
+    The database holding the assets of branch ``branch_id``, looked up once
+    per process until a branch changes.
+    """
+    from .models import Branch
+
+    if not sharding_enabled() or branch_id is None:
+        return DEFAULT_DB_ALIAS
+    shards = _current_branch_shards()
+    alias = shards.get(branch_id)
+    if alias is None:
+        region = (
+            Branch.objects.using(DEFAULT_DB_ALIAS)
+            .filter(pk=branch_id)
+            .values_list("region", flat=True)
+            .first()
+        )
+        alias = shard_for_region(region)
+        if region is not None:
+            shards[branch_id] = alias
+    return alias
+
+
+def shard_for_pk(pk):
+    """The database whose primary key range ``pk`` falls in."""
+    try:
+        number = int(pk) // settings.ASSET_SHARD_ID_SPAN
+    except (TypeError, ValueError):
+        return DEFAULT_DB_ALIAS
+    for alias, shard in settings.ASSET_SHARDS.items():
+        if shard["number"] == number:
+            return alias
+    return DEFAULT_DB_ALIAS
+
+
+def on_branch_shard(queryset, branch_id):
+    """``queryset`` on the shard of ``branch_id``, when sharding is on."""
+    if not sharding_enabled():
+        return queryset
+    return queryset.using(shard_for_branch(branch_id))
+
+
+def across_shards(queryset):
+    """``queryset`` run on every asset database, when sharding is on."""
+    if not sharding_enabled():
+        return queryset
+    return ShardedQuerySet([queryset.using(alias) for alias in asset_databases()])
+
+
+def start_asset_ids(alias):
+    """
+    Make sure the next asset created in shard ``alias`` is numbered from the
+    start of its range. Only SQLite shards are supported; other backends
+    need their asset sequence started by hand.
+    """
+    from .models import Asset
+
+    connection = connections[alias]
+    if connection.vendor != "sqlite":
+        return
+    first = settings.ASSET_SHARDS[alias]["number"] * settings.ASSET_SHARD_ID_SPAN
+    table = Asset._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s",
+            [first, table, first],
+        )
+        cursor.execute(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s "
+            "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)",
+            [table, first, table],
+        )
+
+
+def copy_branch(branch):
+    """
+    Copy ``branch`` into its shard, and drop copies left in other shards by
+    an earlier region, unless they still have assets.
+    """
+    from .models import Asset, Branch
+
+    home = shard_for_region(branch.region)
+    values = {
+        field.attname: getattr(branch, field.attname)
+        for field in Branch._meta.concrete_fields
+    }
+    for alias in settings.ASSET_SHARDS:
+        if alias == home:
+            # A raw save writes the fields as they are, timestamps included.
+            Branch(**values).save_base(raw=True, using=alias)
+        elif not Asset.objects.using(alias).filter(branch_id=branch.pk).exists():
+            Branch.objects.using(alias).filter(pk=branch.pk).delete()
+
+
+def delete_branch_copies(branch_id):
+    """Delete the shard copies of a branch, with their assets."""
+    from .models import Branch
+
+    for alias in settings.ASSET_SHARDS:
+        Branch.objects.using(alias).filter(pk=branch_id).delete()
+
+
+def bulk_create_assets(assets):
+    """
+    ``bulk_create`` new ``assets`` in their branches' shards and count them
+    in each shard's rollups.
+    """
+    from .models import Asset, AssetRollup
+
+    shards = {}
+    groups = {}
+    for asset in assets:
+        if asset.branch_id not in shards:
+            shards[asset.branch_id] = shard_for_branch(asset.branch_id)
+        groups.setdefault(shards[asset.branch_id], []).append(asset)
+    for alias, group in groups.items():
+        Asset.objects.using(alias).bulk_create(group)
+        AssetRollup.objects.db_manager(alias).add_assets(group)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ASSET_SHARD_WORKERS,
+                thread_name_prefix="asset-shard",
+            )
+        return _executor
+
+
+def _in_thread(func, *args):
+    # Like a request: pool threads keep their connections for CONN_MAX_AGE.
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+def can_query_in_threads(aliases):
+    """
+    Other threads use their own connections, so they only see committed
+    rows, and an in-memory SQLite database is not shared with them safely.
+    """
+    for alias in aliases:
+        connection = connections[alias]
+        if connection.in_atomic_block:
+            return False
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            return False
+    return True
+
+
+def gather(func, querysets):
+    """
+    Return ``[func(queryset) for queryset in querysets]``, calling ``func``
+    in parallel threads when there is more than one queryset.
+    """
+    if len(querysets) < 2 or not can_query_in_threads(qs.db for qs in querysets):
+        return [func(qs) for qs in querysets]
+    executor = get_executor()
+    futures = [executor.submit(_in_thread, func, qs) for qs in querysets]
+    return [future.result() for future in futures]
+
+
+_DONE = object()
+
+
+def _produce(rows, chunk_size, buffer, stop):
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                if not put(chunk):
+                    return
+                chunk = []
+        if chunk and not put(chunk):
+            return
+        put(_DONE)
+    except Exception as exc:
+        put(exc)
+    finally:
+        # The thread ends here, so its connections would never be reused.
+        connections.close_all()
+
+
+def _consume(buffer):
+    while True:
+        item = buffer.get()
+        if item is _DONE:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield from item
+
+
+def read_in_thread(rows, chunk_size, stop):
+    """
+    Start iterating ``rows`` in a new thread, ``PREFETCH_CHUNKS`` chunks
+    ahead, and return a generator of the rows. The thread gives up once
+    ``stop`` is set.
+    """
+    buffer = queue.Queue(maxsize=PREFETCH_CHUNKS)
+    threading.Thread(
+        target=_produce, args=(rows, chunk_size, buffer, stop), daemon=True
+    ).start()
+    return _consume(buffer)
+
+
+class ShardedQuerySet:
+    """
+    An Asset query over every asset database.
+
+    Chained methods apply to each database's queryset; evaluating it runs
+    them in parallel threads and merges their rows in the query's ordering.
+    Rows of grouped queries (``values()`` with aggregates), and of orderings
+    that mix directions or span relations, come one database after another.
+    """
+
+    def __init__(self, querysets):
+        self.querysets = list(querysets)
+        self.model = self.querysets[0].model
+        self._result_cache = None
+
+    def __repr__(self):
+        return f"<ShardedQuerySet {self.databases}>"
+
+    @property
+    def databases(self):
+        return [qs.db for qs in self.querysets]
+
+    def map(self, func):
+        """A new ShardedQuerySet of ``func(queryset)`` for every database."""
+        return ShardedQuerySet([func(qs) for qs in self.querysets])
+
+    def _chain(name):
+        def method(self, *args, **kwargs):
+            return self.map(lambda qs: getattr(qs, name)(*args, **kwargs))
+
+        method.__name__ = name
+        return method
+
+    all = _chain("all")
+    filter = _chain("filter")
+    exclude = _chain("exclude")
+    order_by = _chain("order_by")
+    select_related = _chain("select_related")
+    prefetch_related = _chain("prefetch_related")
+    annotate = _chain("annotate")
+    values = _chain("values")
+    values_list = _chain("values_list")
+    only = _chain("only")
+    defer = _chain("defer")
+    none = _chain("none")
+    del _chain
+
+    def for_branch(self, branch_id):
+        """The plain queryset of ``branch_id``'s assets, on its shard."""
+        alias = shard_for_branch(branch_id)
+        for qs in self.querysets:
+            if qs.db == alias:
+                return qs.filter(branch_id=branch_id)
+        return self.querysets[0].none()
+
+    def count(self):
+        if self._result_cache is not None:
+            return len(self._result_cache)
+        return sum(gather(lambda qs: qs.count(), self.querysets))
+
+    def exists(self):
+        if self._result_cache is not None:
+            return bool(self._result_cache)
+        return any(gather(lambda qs: qs.exists(), self.querysets))
+
+    def get(self, *args, **kwargs):
+        """
+        Get one object. A lookup by primary key alone tries the database
+        whose range the key is in before the others.
+        """
+        querysets = self.querysets
+        pk = kwargs.get("pk", kwargs.get("id"))
+        if pk is not None and len(kwargs) == 1 and not args:
+            home = shard_for_pk(pk)
+            for qs in querysets:
+                if qs.db == home:
+                    try:
+                        return qs.get(**kwargs)
+                    except self.model.DoesNotExist:
+                        querysets = [q for q in querysets if q is not qs]
+        found = [
+            obj
+            for rows in gather(
+                lambda qs: list(qs.filter(*args, **kwargs)[:2]), querysets
+            )
+            for obj in rows
+        ]
+        if not found:
+            raise self.model.DoesNotExist(
+                f"{self.model._meta.object_name} matching query does not exist."
+            )
+        if len(found) > 1:
+            raise self.model.MultipleObjectsReturned(
+                f"get() returned more than one {self.model._meta.object_name}."
+            )
+        return found[0]
+
+    def first(self):
+        sharded = self if self._ordering() else self.order_by("pk")
+        rows = sharded[:1]
+        return rows[0] if rows else None
+
+    def __getitem__(self, k):
+        if self._result_cache is not None:
+            return self._result_cache[k]
+        if isinstance(k, int):
+            if k < 0:
+                raise ValueError("Negative indexing is not supported.")
+            return self[k : k + 1][0]
+        if k.stop is None or k.step is not None or (k.start or 0) < 0:
+            raise ValueError("Only slices with a stop and no step are supported.")
+        # The first `stop` rows overall are among each database's first `stop`.
+        querysets, merge = self._plan()
+        parts = gather(lambda qs: list(qs[: k.stop]), querysets)
+        return list(merge(parts))[k]
+
+    def _fetch_all(self):
+        if self._result_cache is None:
+            querysets, merge = self._plan()
+            self._result_cache = list(merge(gather(list, querysets)))
+
+    def __iter__(self):
+        self._fetch_all()
+        return iter(self._result_cache)
+
+    def __len__(self):
+        self._fetch_all()
+        return len(self._result_cache)
+
+    def __bool__(self):
+        self._fetch_all()
+        return bool(self._result_cache)
+
+    def iterator(self, chunk_size=None):
+        """
+        Stream the rows. Each database is read in its own thread, a few
+        chunks ahead, while the rows are merged in this one.
+        """
+        chunk_size = chunk_size or 2000
+        querysets, merge = self._plan()
+        stop = threading.Event()
+        if len(querysets) > 1 and can_query_in_threads(self.databases):
+            parts = [
+                read_in_thread(qs.iterator(chunk_size), chunk_size, stop)
+                for qs in querysets
+            ]
+        else:
+            parts = [qs.iterator(chunk_size) for qs in querysets]
+        try:
+            yield from merge(parts)
+        finally:
+            stop.set()
+
+    def _ordering(self):
+        query = self.querysets[0].query
+        if query.order_by:
+            return list(query.order_by)
+        if query.default_ordering:
+            return list(self.model._meta.ordering)
+        return []
+
+    def _plan(self):
+        """
+        ``(querysets, merge)``: the querysets to run, and a function merging
+        their results, one iterable per database, into the rows in order.
+        ``values()`` querysets get the ordering fields added, to merge on,
+        and ``merge`` removes them again.
+        """
+
+        def concatenate(parts):
+            return chain.from_iterable(parts)
+
+        ordering = self._ordering()
+        qs = self.querysets[0]
+        if (
+            not ordering
+            or not all(isinstance(name, str) for name in ordering)
+            or qs.query.group_by is not None
+        ):
+            return self.querysets, concatenate
+        directions = {name.startswith("-") for name in ordering}
+        names = [name.lstrip("-") for name in ordering]
+        if len(directions) > 1 or any("__" in name or "?" in name for name in names):
+            return self.querysets, concatenate
+        reverse = directions.pop()
+
+        fields = qs._fields
+        iterable_class = qs._iterable_class
+        querysets = self.querysets
+        if not fields and iterable_class is ModelIterable:
+
+            def key(obj):
+                return tuple(getattr(obj, name) for name in names)
+
+            strip = None
+        elif not fields:
+            return self.querysets, concatenate
+        elif iterable_class is ValuesIterable:
+            extra = [name for name in names if name not in fields]
+            querysets = [q.values(*fields, *extra) for q in querysets]
+
+            def key(row):
+                return tuple(row[name] for name in names)
+
+            def strip(row):
+                for name in extra:
+                    del row[name]
+                return row
+
+        elif iterable_class in (ValuesListIterable, FlatValuesListIterable):
+            width = len(fields)
+            querysets = [q.values_list(*fields, *names) for q in querysets]
+
+            def key(row):
+                return row[width:]
+
+            if iterable_class is FlatValuesListIterable:
+
+                def strip(row):
+                    return row[0]
+
+            else:
+
+                def strip(row):
+                    return row[:width]
+
+        else:
+            return self.querysets, concatenate
+
+        def merge(parts):
+            rows = heapq.merge(*parts, key=key, reverse=reverse)
+            return rows if strip is None else map(strip, rows)
+
+        return querysets, merge
@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete
+from django.dispatch import receiver
+
+from .access import invalidate_user_access
+from .export_cache import invalidate_exports
+from .models import Asset, AssetRollup, Branch, UserRole
+from .search import fts_enabled, reinstall_fts_triggers
+from .sharding import (
+    copy_branch,
+    delete_branch_copies,
+    invalidate_branch_shards,
+    start_asset_ids,
+)
+
+
+@receiver(pre_delete, sender=Asset)
+def load_asset_rollup_state(sender, instance, using, **kwargs):
+    # Assets loaded with deferred fields have no snapshot, and their row is
+    # gone by post_delete.
+    instance._rollup_state = instance.get_saved_rollup_state(using)
+
+
+@receiver(post_delete, sender=Asset)
+def remove_asset_from_rollup(sender, instance, using, **kwargs):
+    # Runs inside the deletion's transaction. Prefer the state loaded from
+    # the database over any unsaved edits made to the instance.
+    AssetRollup.objects.db_manager(using).move(instance._rollup_state, None)
+
+
+@receiver(post_save, sender=Asset)
+def invalidate_asset_exports(sender, instance, using, **kwargs):
+    # Moves between branches and deletions are covered by the rollup.
+    invalidate_exports([instance.branch_id], using=using)
+
+
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+def invalidate_branch_exports(sender, instance, using, **kwargs):
+    invalidate_exports([instance.pk], using=using)
+
+
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+def invalidate_role_access(sender, instance, **kwargs):
+    invalidate_user_access(instance.user_id)
+
+
+@receiver(pre_delete, sender=Branch)
+def invalidate_branch_staff_access(sender, instance, **kwargs):
+    # Deleting a branch nulls UserRole.branch without sending signals.
+    for user_id in instance.staff.values_list("user_id", flat=True):
+        invalidate_user_access(user_id)
+
+
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+def invalidate_branch_shard(sender, instance, using, **kwargs):
+    if settings.ASSET_SHARDS and using == DEFAULT_DB_ALIAS:
+        invalidate_branch_shards()
+
+
+@receiver(post_save, sender=Branch)
+def copy_branch_to_shard(sender, instance, using, raw, **kwargs):
+    # Shard copies are saved raw, so they are never copied again.
+    if settings.ASSET_SHARDS and using == DEFAULT_DB_ALIAS and not raw:
+        copy_branch(instance)
+
+
+@receiver(post_delete, sender=Branch)
+def delete_branch_from_shards(sender, instance, using, **kwargs):
+    if settings.ASSET_SHARDS and using == DEFAULT_DB_ALIAS:
+        delete_branch_copies(instance.pk)
+
+
+@receiver(post_migrate)
+def start_shard_asset_ids(sender, using, **kwargs):
+    if sender.name == "myapp" and using in settings.ASSET_SHARDS:
+        start_asset_ids(using)
+
+
+@receiver(post_migrate)
+def reinstall_search_triggers(sender, using, **kwargs):
+    if sender.name == "myapp" and fts_enabled(using):
+        reinstall_fts_triggers(connections[using])
@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from .metrics import get_store
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Run the suite with the metrics file, profiles, caches and media files in
+    a temporary directory instead of the project directory. Export caching
+    is off: test transactions are rolled back without committing, so they
+    never replace export versions. Cache tests turn it on per test. Slow
+    requests are not logged, as exports in the suite routinely are; timing
+    tests turn the log on and assert on it.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.directory = tempfile.mkdtemp(prefix="myapp-tests-")
+        self.settings_override = override_settings(
+            METRICS_DB_PATH=os.path.join(self.directory, "metrics.sqlite3"),
+            PROFILE_DIR=os.path.join(self.directory, "profiles"),
+            EXPORT_CACHE_DIR=None,
+            REQUEST_TIMING_SLOW_MS=None,
+            MEDIA_ROOT=os.path.join(self.directory, "media"),
+            CACHES={
+                "default": {
+                    **settings.CACHES["default"],
+                    "LOCATION": os.path.join(self.directory, "cache"),
+                }
+            },
+        )
+        self.settings_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        store = get_store()
+        if store is not None:
+            store.flush()
+        self.settings_override.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
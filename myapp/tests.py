@@ -1,3 +1,2021 @@
-from django.test import TestCase
+import base64
+import csv
+import datetime
+import importlib
+import io
+import itertools
+import json
+import os
+import pstats
+import random
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+from unittest import mock
+from decimal import Decimal
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import connection, connections, router, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+import openpyxl
+import tablib
+from pypdf import PdfReader
+
+from . import export_jobs, export_views, pdf_reports, sample_data
+from .checks import check_shared_cache
+from .databases import close_connection, scratch_database
+from .export_cache import evict_export_cache
+from .forms import BranchForm
+from .management.commands.refresh_replica import copy_database
+from .metrics import MetricsStore, get_store
+from .pagination import KeysetPaginator, encode_cursor
+from .models import (
+    Asset,
+    AssetRollup,
+    AssetSequence,
+    Branch,
+    ExportJob,
+    UserRole,
+)
+from .profiling import profile_call
+from .resources import AssetResource, import_error_rows
+from .search import FTS_TABLE, install_fts, search_assets, uninstall_fts
+from .sharding import ShardedQuerySet, shard_for_branch
+from .xlsx_import import import_workbook
+
+
+def make_branches(count):
+    return Branch.objects.bulk_create(
+        Branch(
+            name=f"Hospital {i:03d}",
+            code=f"HOS-{i:03d}",
+            city="Yaoundé",
+            region="Centre",
+            manager_name="Dr. Test",
+            manager_phone="+237 600 000 000",
+        )
+        for i in range(count)
+    )
+
+
+def make_assets(branches, count):
+    cycle = itertools.cycle(
+        itertools.product(
+            branches,
+            [value for value, _ in Asset.STATUS_CHOICES],
+            [value for value, _ in Asset.CATEGORY_CHOICES],
+        )
+    )
+    assets = []
+    for i, (branch, status, category) in zip(range(count), cycle):
+        assets.append(
+            Asset(
+                asset_id=f"AST-TEST-{i:07d}",
+                name=f"Asset {i}",
+                category=category,
+                serial_number=f"SN-{i:07d}",
+                branch=branch,
+                department="other",
+                purchase_date=datetime.date(2024, 1, 1),
+                purchase_cost=1000,
+                supplier_name="Supplier",
+                status=status,
+                custodian_name="Custodian",
+                custodian_phone="+237 600 000 000",
+            )
+        )
+    Asset.objects.bulk_create(assets, batch_size=1000)
+
+
+def create_asset(branch, number, **fields):
+    values = {
+        "name": f"Asset {number}",
+        "category": "computer",
+        "serial_number": f"SN-NEW-{number:05d}",
+        "branch": branch,
+        "department": "other",
+        "purchase_date": datetime.date(2024, 1, 1),
+        "purchase_cost": 1000,
+        "supplier_name": "Supplier",
+        "status": "in_use",
+        "custodian_name": "Custodian",
+        "custodian_phone": "+237 600 000 000",
+    }
+    values.update(fields)
+    return Asset.objects.create(**values)
+
+
+def make_user(username, role, branch=None):
+    user = User.objects.create_user(username, password="x")
+    if role == "super_admin":
+        user.is_superuser = user.is_staff = True
+        user.save()
+    UserRole.objects.create(user=user, role=role, branch=branch)
+    return user
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branches = make_branches(1)
+        make_assets(cls.branches, 23)
+        # Groups of three assets share a created_at, so ties fall back to id.
+        start = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+        for index, pk in enumerate(Asset.objects.order_by("pk").values_list("pk")):
+            Asset.objects.filter(pk=pk[0]).update(
+                created_at=start + datetime.timedelta(minutes=index // 3)
+            )
+        cls.expected = list(
+            Asset.objects.order_by("-created_at", "-pk").values_list("pk", flat=True)
+        )
+        cls.admin = make_user("admin", "super_admin")
+
+    def walk_forward(self, paginator):
+        pages = [paginator.get_page()]
+        while pages[-1].has_next:
+            pages.append(paginator.get_page(after=pages[-1].next_cursor))
+        return pages
+
+    def test_pages_cover_every_asset_once(self):
+        paginator = KeysetPaginator(Asset.objects.all(), 5)
+        pages = self.walk_forward(paginator)
+        self.assertEqual([len(page) for page in pages], [5, 5, 5, 5, 3])
+        self.assertEqual([asset.pk for page in pages for asset in page], self.expected)
+        self.assertFalse(pages[0].has_previous)
+        self.assertIsNone(pages[0].previous_cursor)
+        self.assertIsNone(pages[-1].next_cursor)
+
+        # Back from the last page through the same pages.
+        page = pages[-1]
+        for expected in reversed(pages[:-1]):
+            page = paginator.get_page(before=page.previous_cursor)
+            self.assertEqual(list(page), list(expected))
+            self.assertTrue(page.has_next)
+        self.assertFalse(page.has_previous)
+
+    def test_duplicate_sort_keys(self):
+        Asset.objects.update(
+            created_at=datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+        )
+        pages = self.walk_forward(KeysetPaginator(Asset.objects.all(), 4))
+        pks = [asset.pk for page in pages for asset in page]
+        self.assertEqual(pks, sorted(self.expected, reverse=True))
+
+    def test_invalid_cursors_show_the_first_page(self):
+        self.client.force_login(self.admin)
+        url = reverse("asset_list")
+        first = self.client.get(url, {"per_page": 5}).context["page"]
+        tampered = base64.urlsafe_b64encode(b"not-a-date|7").decode()
+        for cursor in (
+            "garbage!",
+            "e30",
+            tampered,
+            encode_cursor(first.object_list[0].created_at, "x"),
+        ):
+            for direction in ("after", "before"):
+                with self.subTest(cursor=cursor, direction=direction):
+                    response = self.client.get(url, {"per_page": 5, direction: cursor})
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(list(response.context["page"]), list(first))
+
+        page = self.client.get(
+            url, {"per_page": 5, "after": first.next_cursor}
+        ).context["page"]
+        self.assertEqual([asset.pk for asset in page], self.expected[5:10])
+
+
+@override_settings(EXPORT_CACHE_DIR=None)
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branches = make_branches(1)
+        make_assets(cls.branches, 10)
+
+    def search(self, text):
+        return list(
+            search_assets(Asset.objects.all(), text).values_list("pk", flat=True)
+        )
+
+    def test_index_follows_inserts_updates_and_deletes(self):
+        asset = create_asset(self.branches[0], 1, name="Infusion Pump", brand="Baxter")
+        self.assertEqual(self.search("infus"), [asset.pk])
+        self.assertEqual(self.search("baxter pump"), [asset.pk])
+        self.assertEqual(self.search(asset.asset_id), [asset.pk])
+        self.assertEqual(len(self.search("SN-")), 11)
+
+        asset.name = "Ventilator"
+        asset.save()
+        self.assertEqual(self.search("infusion"), [])
+        self.assertEqual(self.search("venti"), [asset.pk])
+
+        asset.delete()
+        self.assertEqual(self.search("venti"), [])
+
+    def test_fts_syntax_in_queries_is_matched_literally(self):
+        asset = create_asset(self.branches[0], 1, name="Pump NEAR Door")
+        for text in ['"', '"pump', "pump OR", "NEAR(pump door)", "name:pump", "*"]:
+            with self.subTest(text=text):
+                self.search(text)
+        self.assertEqual(self.search('"pump" near'), [asset.pk])
+        # Operators are words to match, not FTS5 syntax.
+        self.assertEqual(self.search("pump AND door"), [])
+        self.assertEqual(self.search("-pump"), [asset.pk])
+
+        self.client.force_login(make_user("admin", "super_admin"))
+        response = self.client.get(reverse("asset_list"), {"search": 'pump" OR *'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_punctuation_only_search_matches_nothing(self):
+        self.assertEqual(self.search("---"), [])
+        self.client.force_login(make_user("admin", "super_admin"))
+        response = self.client.get(reverse("asset_list"), {"search": "---"})
+        self.assertEqual(list(response.context["page"]), [])
+
+    def test_asset_list_ranks_matches_across_pages(self):
+        by_supplier = create_asset(self.branches[0], 1, supplier_name="Pump Supplies")
+        by_name = create_asset(self.branches[0], 2, name="Infusion Pump")
+        self.client.force_login(make_user("admin", "super_admin"))
+        url = reverse("asset_list")
+        params = {"search": "pump", "per_page": 1}
+
+        first = self.client.get(url, params).context["page"]
+        self.assertEqual(list(first), [by_name])
+        second = self.client.get(url, {**params, "after": first.next_cursor})
+        second = second.context["page"]
+        self.assertEqual(list(second), [by_supplier])
+        self.assertFalse(second.has_next)
+        back = self.client.get(url, {**params, "before": second.previous_cursor})
+        self.assertEqual(list(back.context["page"]), [by_name])
+
+    def test_post_migrate_reinstalls_dropped_triggers(self):
+        # SQLite drops the triggers when a migration rebuilds myapp_asset.
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER myapp_asset_fts_ai")
+        emit_post_migrate_signal(verbosity=0, interactive=False, db="default")
+        asset = create_asset(self.branches[0], 1, name="Infusion Pump")
+        self.assertEqual(self.search("infusion"), [asset.pk])
+
+    def test_rebuild_search_index(self):
+        asset = create_asset(self.branches[0], 1, name="Infusion Pump")
+        uninstall_fts(connection)
+        install_fts(connection)
+        self.assertEqual(self.search("pump"), [])
+
+        out = io.StringIO()
+        call_command("rebuild_search_index", stdout=out)
+        self.assertIn("11 assets indexed", out.getvalue())
+        self.assertEqual(self.search("pump"), [asset.pk])
+        other = create_asset(self.branches[0], 2, name="Pump Stand")
+        self.assertEqual(sorted(self.search("pump")), [asset.pk, other.pk])
+
+
+@override_settings(EXPORT_CACHE_DIR=None)
+class QueryPlanTests(TestCase):
+    """
+    Run EXPLAIN QUERY PLAN on every asset query the hot views issue against
+    a large dataset, and fail on full table scans or temp B-tree sorts.
+    """
+
+    ASSET_COUNT = 10000
+
+    full_scan_re = re.compile(r"\bSCAN myapp_asset\b(?! USING)")
+    temp_sort_re = re.compile(r"USE TEMP B-TREE")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.branches = make_branches(20)
+        make_assets(cls.branches, cls.ASSET_COUNT)
+        cls.admin = make_user("admin", "super_admin")
+        cls.manager = make_user("manager", "branch_manager", cls.branches[0])
+        cls.officer = make_user("officer", "inventory_officer", cls.branches[1])
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def capture_asset_queries(self, url, params=None):
+        statements = []
+
+        def collect(execute, sql, params, many, context):
+            if (
+                sql.lstrip().upper().startswith("SELECT")
+                and 'FROM "myapp_asset"' in sql
+            ):
+                statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(collect):
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return statements
+
+    def explain(self, sql, params):
+        """Return the plan as ``(id, parent id, detail)`` rows."""
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return [(row[0], row[1], row[-1]) for row in cursor.fetchall()]
+
+    def correlated_lines(self, rows):
+        """Plan lines run once per outer row, inside correlated subqueries."""
+        parents = {node: parent for node, parent, _ in rows}
+        correlated = {
+            node for node, _, detail in rows if detail.startswith("CORRELATED")
+        }
+        lines = []
+        for node, parent, detail in rows:
+            while parent and parent not in correlated:
+                parent = parents.get(parent)
+            if parent:
+                lines.append(detail)
+        return lines
+
+    def assertIndexedPlans(self, url, params=None):
+        statements = self.capture_asset_queries(url, params)
+        self.assertTrue(statements, f"{url} ran no asset queries")
+        for sql, sql_params in statements:
+            rows = self.explain(sql, sql_params)
+            plan = [detail for _, _, detail in rows]
+            fts_scans = [line for line in plan if FTS_TABLE in line]
+            with self.subTest(url=url, params=params, sql=sql, plan=plan):
+                # The full-text index is searched once per statement, never
+                # again for every matched row.
+                self.assertLessEqual(len(fts_scans), 1)
+                for line in self.correlated_lines(rows):
+                    self.assertNotIn(FTS_TABLE, line)
+            # Plans driven by the full-text index only sort the matched rows.
+            fts_driven = bool(fts_scans)
+            for line in plan:
+                with self.subTest(url=url, params=params, sql=sql, plan=plan):
+                    self.assertIsNone(self.full_scan_re.search(line))
+                    if not fts_driven:
+                        self.assertIsNone(self.temp_sort_re.search(line))
+
+    def test_dashboard(self):
+        for user in (self.admin, self.manager, self.officer):
+            self.client.force_login(user)
+            self.assertIndexedPlans(reverse("dashboard"))
+
+    def test_asset_list(self):
+        branch_id = str(self.branches[3].pk)
+        param_sets = [
+            {},
+            {"status": "available"},
+            {"category": "vehicle"},
+            {"status": "maintenance", "category": "generator"},
+            {"search": "Asset 12"},
+        ]
+        for user in (self.admin, self.manager, self.officer):
+            self.client.force_login(user)
+            for params in param_sets:
+                self.assertIndexedPlans(reverse("asset_list"), params)
+                if user is self.admin:
+                    self.assertIndexedPlans(
+                        reverse("asset_list"), {**params, "branch": branch_id}
+                    )
+
+    def test_asset_list_search_matching_every_asset(self):
+        # Every asset ID starts with AST-TEST, so ranking sorts them all.
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("asset_list"), {"search": "AST-TEST"})
+        self.assertEqual(
+            len(response.context["page"]), settings.ASSET_LIST_PAGE_SIZE
+        )
+        cursor = response.context["page"].next_cursor
+        self.assertIndexedPlans(reverse("asset_list"), {"search": "AST-TEST"})
+        self.assertIndexedPlans(
+            reverse("asset_list"), {"search": "AST-TEST", "after": cursor}
+        )
+
+    def test_asset_list_next_page(self):
+        self.client.force_login(self.manager)
+        response = self.client.get(reverse("asset_list"), {"status": "in_use"})
+        cursor = response.context["page"].next_cursor
+        self.assertIndexedPlans(
+            reverse("asset_list"), {"status": "in_use", "after": cursor}
+        )
+        self.assertIndexedPlans(
+            reverse("asset_list"), {"status": "in_use", "before": cursor}
+        )
+
+    def test_exports(self):
+        self.client.force_login(self.admin)
+        self.assertIndexedPlans(reverse("export_assets_excel"))
+        self.client.force_login(self.officer)
+        self.assertIndexedPlans(
+            reverse("export_assets_excel"),
+            {"status": "available", "category": "vehicle"},
+        )
+
+
+@override_settings(EXPORT_CACHE_DIR=None)
+class QueryBudgetTests(TestCase):
+    """
+    Every view runs a fixed number of SQL queries per role, however many
+    assets there are, so N+1 patterns fail here instead of in production.
+    Budgets include the session and user lookups of a logged-in request.
+    """
+
+    SIZES = [30, 300]
+    ROLES = ["super_admin", "branch_manager", "inventory_officer"]
+    # Queries per request for a super admin, branch manager and inventory
+    # officer. Users without access are redirected or get a 404.
+    BUDGETS = {
+        "dashboard": (5, 4, 4),
+        "asset_list": (4, 3, 3),
+        "asset_detail": (3, 3, 3),
+        "asset_add": (3, 3, 3),
+        "asset_edit": (4, 4, 4),
+        "asset_delete": (3, 2, 2),
+        "branch_list": (3, 3, 2),
+        "branch_add": (2, 2, 2),
+        "branch_edit": (3, 2, 2),
+        "export_assets_pdf": (6, 4, 4),
+        "export_assets_excel": (3, 3, 3),
+        "export_assets_csv": (3, 3, 3),
+        "export_assets_ndjson": (3, 3, 3),
+    }
+
+    def url_for(self, view, asset):
+        if view in ("asset_detail", "asset_edit", "asset_delete"):
+            return reverse(view, args=[asset.pk])
+        if view == "branch_edit":
+            return reverse(view, args=[asset.branch_id])
+        if view == "export_assets_pdf":
+            return reverse(view) + "?engine=reportlab"
+        return reverse(view)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+        return [query["sql"] for query in queries]
+
+    def test_query_budgets(self):
+        for size in self.SIZES:
+            with transaction.atomic():
+                _, users, _ = sample_data.populate(3, size, users=7, seed=size)
+                cache.clear()
+                for index, role in enumerate(self.ROLES):
+                    user = next(user for user, r, _ in users if r == role)
+                    asset = Asset.objects.for_user(user).first()
+                    self.client.force_login(user)
+                    for view, budgets in self.BUDGETS.items():
+                        url = self.url_for(view, asset)
+                        # The first request fills caches such as the list's
+                        # row count; the budget is for the ones after it.
+                        self.count_queries(url)
+                        queries = self.count_queries(url)
+                        with self.subTest(size=size, role=role, view=view):
+                            self.assertEqual(
+                                len(queries), budgets[index], "\n".join(queries)
+                            )
+                transaction.set_rollback(True)
+
+
+@override_settings(EXPORT_CACHE_DIR=None, ASSET_ID_FORMAT="AST-{year}-{number:05d}")
+class AssetSequenceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branches = make_branches(1)
+        cls.year = timezone.localdate().year
+
+    def test_sequential_within_a_year(self):
+        ids = [create_asset(self.branches[0], n).asset_id for n in range(3)]
+        self.assertEqual(ids, [f"AST-{self.year}-{n:05d}" for n in (1, 2, 3)])
+
+        # Deleted numbers are never handed out again.
+        Asset.objects.get(asset_id=ids[-1]).delete()
+        self.assertEqual(
+            create_asset(self.branches[0], 3).asset_id, f"AST-{self.year}-00004"
+        )
+
+    def test_year_rollover(self):
+        create_asset(self.branches[0], 0)
+        with mock.patch.object(
+            timezone, "localdate", return_value=datetime.date(self.year + 1, 1, 1)
+        ):
+            asset = create_asset(self.branches[0], 1)
+        self.assertEqual(asset.asset_id, f"AST-{self.year + 1}-00001")
+        self.assertEqual(
+            create_asset(self.branches[0], 2).asset_id, f"AST-{self.year}-00002"
+        )
+        self.assertEqual(
+            dict(AssetSequence.objects.values_list("year", "last_value")),
+            {self.year: 2, self.year + 1: 1},
+        )
+
+    def test_blocks_reserved_for_imports(self):
+        create_asset(self.branches[0], 0)
+        block = Asset.allocate_asset_ids(5)
+        self.assertEqual(block, [f"AST-{self.year}-{n:05d}" for n in range(2, 7)])
+        self.assertEqual(
+            create_asset(self.branches[0], 1).asset_id, f"AST-{self.year}-00007"
+        )
+
+    def test_migration_seeds_sequences_from_existing_ids(self):
+        migration = importlib.import_module("myapp.migrations.0004_asset_sequence")
+        for number, asset_id in enumerate(
+            ["AST-2023-00007", "AST-2023-00012", "AST-2024-00003", "LEGACY-1"]
+        ):
+            create_asset(self.branches[0], number)
+            Asset.objects.filter(serial_number=f"SN-NEW-{number:05d}").update(
+                asset_id=asset_id
+            )
+        AssetSequence.objects.all().delete()
+
+        migration.backfill_sequences(django_apps, connection.schema_editor())
+
+        self.assertEqual(
+            dict(AssetSequence.objects.values_list("year", "last_value")),
+            {2023: 12, 2024: 3},
+        )
+        with mock.patch.object(
+            timezone, "localdate", return_value=datetime.date(2023, 6, 1)
+        ):
+            self.assertEqual(Asset.allocate_asset_ids(1), ["AST-2023-00013"])
+
+
+@override_settings(EXPORT_CACHE_DIR=None)
+class AssetRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branches = make_branches(2)
+
+    def assertRollupsMatchAssets(self):
+        stored = {
+            rollup.get_bucket(): (rollup.asset_count, rollup.total_cost)
+            for rollup in AssetRollup.objects.filter(asset_count__gt=0)
+        }
+        self.assertEqual(stored, AssetRollup.objects.compute())
+
+    def test_rollups_follow_every_change(self):
+        asset = create_asset(self.branches[0], 1, purchase_cost="10.50")
+        create_asset(self.branches[0], 2)
+        self.assertRollupsMatchAssets()
+
+        asset.status = "maintenance"
+        asset.save()
+        self.assertRollupsMatchAssets()
+
+        asset.purchase_cost = "99.99"
+        asset.department = "surgery"
+        asset.save()
+        self.assertRollupsMatchAssets()
+
+        asset.branch = self.branches[1]
+        asset.save()
+        self.assertRollupsMatchAssets()
+        rollup = AssetRollup.objects.get(branch=self.branches[1], asset_count__gt=0)
+        self.assertEqual(rollup.total_cost, Decimal("99.99"))
+
+        asset.delete()
+        self.assertRollupsMatchAssets()
+        Asset.objects.all().delete()
+        self.assertFalse(AssetRollup.objects.filter(asset_count__gt=0).exists())
+
+    def test_unsaved_edits_do_not_leak_into_rollups_on_delete(self):
+        asset = create_asset(self.branches[0], 1, purchase_cost="10.50")
+        asset.status = "retired"
+        asset.delete()
+        self.assertFalse(AssetRollup.objects.filter(asset_count__gt=0).exists())
+
+    def test_assets_loaded_with_deferred_fields(self):
+        for number in range(3):
+            create_asset(self.branches[0], number)
+
+        self.assertEqual(len(Asset.objects.only("name")), 3)
+        asset = Asset.objects.order_by("pk").first()
+        asset.refresh_from_db(fields=["status"])
+
+        asset = Asset.objects.defer("status").order_by("pk").first()
+        asset.status = "retired"
+        asset.save()
+        self.assertRollupsMatchAssets()
+
+        asset = Asset.objects.only("name").order_by("pk").last()
+        asset.branch = self.branches[1]
+        asset.save()
+        self.assertRollupsMatchAssets()
+
+        Asset.objects.only("name").order_by("pk").first().delete()
+        self.assertRollupsMatchAssets()
+
+
+class UserAccessTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branches = make_branches(2)
+        make_assets(cls.branches, 48)
+        cls.officer = make_user("officer", "inventory_officer", cls.branches[0])
+
+    def role_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [q["sql"] for q in queries if "myapp_userrole" in q["sql"]]
+
+    def test_role_resolved_once_per_session(self):
+        self.client.force_login(self.officer)
+        self.assertEqual(len(self.role_queries(reverse("asset_list"))), 1)
+        for name in ("asset_list", "dashboard", "asset_list"):
+            self.assertEqual(self.role_queries(reverse(name)), [])
+
+    def test_role_change_invalidates_session_copy(self):
+        self.client.force_login(self.officer)
+        response = self.client.get(reverse("asset_list"))
+        self.assertEqual(response.wsgi_request.access.branch_id, self.branches[0].pk)
+
+        role = self.officer.role
+        role.branch = self.branches[1]
+        role.save()
+
+        self.assertEqual(len(self.role_queries(reverse("asset_list"))), 1)
+        response = self.client.get(reverse("asset_list"))
+        self.assertEqual(response.wsgi_request.access.branch_id, self.branches[1].pk)
+        self.assertTrue(
+            all(
+                asset.branch_id == self.branches[1].pk
+                for asset in response.context["page"]
+            )
+        )
+
+    def test_out_of_scope_assets_and_branches_are_not_found(self):
+        own = Asset.objects.filter(branch=self.branches[0]).first()
+        other = Asset.objects.filter(branch=self.branches[1]).first()
+        manager = make_user("manager", "branch_manager", self.branches[0])
+        for user in (self.officer, manager):
+            self.client.force_login(user)
+            for view in ("asset_detail", "asset_edit", "asset_delete"):
+                with self.subTest(user=user.username, view=view):
+                    url = reverse(view, args=[other.pk])
+                    self.assertEqual(self.client.get(url).status_code, 404)
+                    self.assertEqual(self.client.post(url).status_code, 404)
+            for view in ("asset_detail", "asset_edit"):
+                url = reverse(view, args=[own.pk])
+                self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertTrue(Asset.objects.filter(pk=other.pk).exists())
+
+        response = self.client.get(reverse("branch_list"))
+        self.assertEqual(list(response.context["branches"]), [self.branches[0]])
+        self.assertEqual(
+            list(Branch.objects.for_user(self.officer)), [self.branches[0]]
+        )
+        response = self.client.get(reverse("branch_edit", args=[self.branches[1].pk]))
+        self.assertRedirects(response, reverse("branch_list"))
+
+        self.client.force_login(make_user("admin", "super_admin"))
+        response = self.client.get(reverse("asset_delete", args=[other.pk]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_role_changes_reach_other_workers(self):
+        self.client.force_login(self.officer)
+        self.assertEqual(len(self.role_queries(reverse("asset_list"))), 1)
+        # Another worker process has its own client for the shared cache.
+        other_worker = caches.create_connection("default")
+        other_worker.set(f"user-access-version:{self.officer.pk}", "changed", None)
+        self.assertEqual(len(self.role_queries(reverse("asset_list"))), 1)
+        self.assertEqual(self.role_queries(reverse("asset_list")), [])
+
+    def test_cache_that_stores_nothing_never_trusts_the_session(self):
+        dummy = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+        with override_settings(CACHES=dummy):
+            self.client.force_login(self.officer)
+            self.assertEqual(len(self.role_queries(reverse("asset_list"))), 1)
+            self.assertEqual(len(self.role_queries(reverse("asset_list"))), 1)
+            self.assertEqual(
+                [error.id for error in check_shared_cache(None)], ["myapp.W001"]
+            )
+        self.assertEqual(check_shared_cache(None), [])
+
+
+@override_settings(EXPORT_CACHE_DIR=None, EXPORT_CHUNK_SIZE=7)
+class ExcelExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branches = make_branches(2)
+        make_assets(cls.branches, 48)
+        cls.admin = make_user("admin", "super_admin")
+        cls.officer = make_user("officer", "inventory_officer", cls.branches[1])
+
+    def export(self, user, **params):
+        self.client.force_login(user)
+        # Rows past the width sample are streamed straight from the query.
+        with mock.patch.object(export_views, "EXCEL_WIDTH_SAMPLE_ROWS", 5):
+            response = self.client.get(reverse("export_assets_excel"), params)
+        self.assertEqual(response.status_code, 200)
+        workbook = openpyxl.load_workbook(io.BytesIO(b"".join(response)))
+        return workbook["Assets"]
+
+    def test_workbook_contents(self):
+        sheet = self.export(self.admin)
+        header, *rows = sheet.iter_rows()
+        self.assertEqual(
+            [cell.value for cell in header],
+            [title for title, _ in export_views.EXCEL_COLUMNS],
+        )
+        self.assertTrue(all(cell.font.bold for cell in header))
+        self.assertEqual(len(rows), 48)
+
+        asset = Asset.objects.select_related("branch").get(asset_id=rows[0][0].value)
+        values = [cell.value for cell in rows[0]]
+        self.assertEqual(values[3], f"{asset.branch.name} ({asset.branch.code})")
+        self.assertEqual(values[2], asset.get_category_display())
+        self.assertEqual(values[8], "2024-01-01")
+        self.assertEqual(values[12], asset.get_status_display())
+        self.assertEqual(values[14], 1000)
+        self.assertEqual(rows[0][14].data_type, "n")
+        self.assertEqual(rows[0][0].data_type, "s")
+        self.assertGreater(sheet.column_dimensions["B"].width, len("Name"))
+
+    def test_scoped_to_the_users_filtered_list(self):
+        rows = list(self.export(self.officer).iter_rows(min_row=2, values_only=True))
+        self.assertEqual(len(rows), 24)
+        branch = f"{self.branches[1].name} ({self.branches[1].code})"
+        self.assertEqual({row[3] for row in rows}, {branch})
+
+        rows = list(
+            self.export(self.admin, status="retired").iter_rows(
+                min_row=2, values_only=True
+            )
+        )
+        self.assertEqual(len(rows), 12)
+        self.assertEqual({row[12] for row in rows}, {"Retired"})
+
+
+class DumpExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branches = make_branches(2)
+        cls.old = create_asset(cls.branches[0], 1, purchase_cost="10.50")
+        cls.new = create_asset(cls.branches[0], 2, purchase_cost=7)
+        create_asset(cls.branches[1], 3)
+        Asset.objects.filter(pk=cls.old.pk).update(
+            updated_at=datetime.datetime(2025, 3, 1, 12, tzinfo=datetime.timezone.utc)
+        )
+        cls.old.refresh_from_db()
+        cls.new.refresh_from_db()
+        cls.officer = make_user("officer", "inventory_officer", cls.branches[0])
+
+    def setUp(self):
+        self.client.force_login(self.officer)
+
+    def dump(self, view, **params):
+        response = self.client.get(reverse(view), params)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode()
+
+    def ndjson(self, **params):
+        lines = self.dump("export_assets_ndjson", **params).splitlines()
+        return [json.loads(line) for line in lines]
+
+    def test_csv(self):
+        header, *rows = csv.reader(io.StringIO(self.dump("export_assets_csv")))
+        self.assertEqual(header[0], "asset_id")
+        rows = {row[0]: dict(zip(header, row)) for row in rows}
+        self.assertEqual(set(rows), {self.old.asset_id, self.new.asset_id})
+        row = rows[self.old.asset_id]
+        self.assertEqual(row["purchase_cost"], "10.50")
+        self.assertEqual(row["purchase_date"], "2024-01-01")
+        self.assertEqual(row["branch_code"], self.branches[0].code)
+        self.assertEqual(row["updated_at"], "2025-03-01T12:00:00+00:00")
+        self.assertEqual(row["created_at"], self.old.created_at.isoformat())
+        self.assertEqual(rows[self.new.asset_id]["purchase_cost"], "7.00")
+
+    def test_ndjson(self):
+        rows = {row["asset_id"]: row for row in self.ndjson()}
+        self.assertEqual(set(rows), {self.old.asset_id, self.new.asset_id})
+        row = rows[self.new.asset_id]
+        self.assertEqual(row["purchase_cost"], "7.00")
+        self.assertEqual(row["status"], "in_use")
+        self.assertEqual(
+            datetime.datetime.fromisoformat(row["updated_at"]), self.new.updated_at
+        )
+        self.assertEqual(row["created_at"], self.new.created_at.isoformat())
+
+    def test_updated_since(self):
+        rows = self.ndjson(updated_since="2025-01-01")
+        self.assertEqual(
+            [row["asset_id"] for row in rows], [self.old.asset_id, self.new.asset_id]
+        )
+        rows = self.ndjson(updated_since="2025-03-01T12:00:01+00:00")
+        self.assertEqual([row["asset_id"] for row in rows], [self.new.asset_id])
+        # 12:30 in UTC+1 is 11:30 UTC, before the old asset's change.
+        rows = self.ndjson(updated_since="2025-03-01T12:30:00+01:00")
+        self.assertEqual(len(rows), 2)
+
+        for view in ("export_assets_csv", "export_assets_ndjson"):
+            response = self.client.get(reverse(view), {"updated_since": "yesterday"})
+            self.assertEqual(response.status_code, 400)
+
+
+class HeldExecutor:
+    """Stands in for the export pool, running jobs only when asked."""
+
+    def __init__(self):
+        self.queued = []
+
+    def submit(self, func, *args):
+        self.queued.append((func, args))
+
+    def run_all(self):
+        while self.queued:
+            func, args = self.queued.pop(0)
+            func(*args)
+
+
+@override_settings(EXPORT_CACHE_DIR=None, EXPORT_CHUNK_SIZE=2)
+class ExportJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branches = make_branches(2)
+        make_assets(cls.branches, 48)
+        cls.officer = make_user("officer", "inventory_officer", cls.branches[0])
+        cls.other = make_user("other", "inventory_officer", cls.branches[1])
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings_override = override_settings(MEDIA_ROOT=media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.executor = HeldExecutor()
+        patcher = mock.patch.object(
+            export_jobs, "get_executor", return_value=self.executor
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def submit(self, user, kind="excel", query=""):
+        self.client.force_login(user)
+        return self.client.post(reverse("export_job_submit") + query, {"kind": kind})
+
+    def test_submit_poll_and_download(self):
+        response = self.submit(self.officer, query="?status=in_use")
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertEqual((job["status"], job["progress"]), ("pending", 0))
+        self.assertIsNone(job["download_url"])
+
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(job["status_url"]).status_code, 404)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.executor.run_all()
+        progress = [
+            query
+            for query in queries
+            if 'UPDATE "myapp_exportjob" SET "rows_done"' in query["sql"]
+        ]
+        self.assertEqual(len(progress), 3)
+
+        self.client.force_login(self.officer)
+        status = self.client.get(job["status_url"]).json()
+        self.assertEqual(status["status"], "done")
+        self.assertEqual(status["progress"], 100)
+        self.assertEqual(status["rows_done"], status["rows_total"])
+        self.assertEqual(status["rows_total"], 6)
+
+        response = self.client.get(status["download_url"])
+        self.assertEqual(response.status_code, 200)
+        workbook = openpyxl.load_workbook(io.BytesIO(b"".join(response)))
+        self.assertEqual(workbook.active.max_row, 7)
+
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(status["download_url"]).status_code, 404)
+
+    def test_active_jobs_are_limited(self):
+        with override_settings(EXPORT_JOB_MAX_QUEUED=3):
+            self.assertEqual(self.submit(self.officer).status_code, 202)
+            self.assertEqual(self.submit(self.officer).status_code, 202)
+            response = self.submit(self.officer)
+            self.assertEqual(response.status_code, 429)
+            self.assertIn("in progress", response.json()["error"])
+
+            self.assertEqual(self.submit(self.other).status_code, 202)
+            response = self.submit(self.other)
+            self.assertEqual(response.status_code, 429)
+            self.assertIn("queue is full", response.json()["error"])
+
+            self.executor.run_all()
+            self.assertEqual(self.submit(self.officer).status_code, 202)
+        self.assertEqual(self.submit(self.officer, kind="csv").status_code, 400)
+        response = self.submit(self.officer, kind="pdf", query="?engine=bogus")
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(ASSET_PDF_ENGINE="reportlab")
+    def test_pdf_jobs_default_to_the_configured_engine(self):
+        for query, engine in [("", "reportlab"), ("?engine=xhtml2pdf", "xhtml2pdf")]:
+            response = self.submit(self.officer, kind="pdf", query=query)
+            self.assertEqual(response.status_code, 202)
+            job = ExportJob.objects.get(pk=response.json()["id"])
+            self.assertEqual(job.params["engine"], engine)
+
+    def test_failed_job(self):
+        job = export_jobs.submit_export(self.officer, "pdf", {"engine": "bogus"})
+        with self.assertLogs("myapp.export_jobs", "ERROR"):
+            self.executor.run_all()
+
+        self.client.force_login(self.officer)
+        status = self.client.get(reverse("export_job_status", args=[job.pk])).json()
+        self.assertEqual(status["status"], "failed")
+        self.assertIn("bogus", status["error"])
+        self.assertIsNone(status["download_url"])
+        response = self.client.get(reverse("export_job_download", args=[job.pk]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(os.listdir(os.path.join(settings.MEDIA_ROOT, "exports")), [])
+
+    def test_cleanup(self):
+        expired = export_jobs.submit_export(self.officer, "excel", {})
+        kept = export_jobs.submit_export(self.other, "excel", {})
+        self.executor.run_all()
+        lost = export_jobs.submit_export(self.officer, "excel", {})
+        self.executor.queued.clear()
+
+        now = timezone.now()
+        ExportJob.objects.filter(pk=expired.pk).update(
+            expires_at=now - datetime.timedelta(seconds=1)
+        )
+        ExportJob.objects.filter(pk=lost.pk).update(
+            created_at=now - datetime.timedelta(seconds=settings.EXPORT_JOB_TIMEOUT + 1)
+        )
+        expired.refresh_from_db()
+        path = expired.file.path
+        self.assertTrue(os.path.exists(path))
+
+        out = io.StringIO()
+        call_command("cleanup_export_jobs", stdout=out)
+        self.assertIn("Deleted 1 expired export jobs", out.getvalue())
+
+        self.assertFalse(ExportJob.objects.filter(pk=expired.pk).exists())
+        self.assertFalse(os.path.exists(path))
+        kept.refresh_from_db()
+        self.assertTrue(os.path.exists(kept.file.path))
+        lost.refresh_from_db()
+        self.assertEqual(lost.status, "failed")
+        self.assertIsNotNone(lost.expires_at)
+
+
+@override_settings(EXPORT_CACHE_DIR=None)
+class ReportLabPdfTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branches = make_branches(2)
+        make_assets(cls.branches, 200)
+        cls.officer = make_user("officer", "inventory_officer", cls.branches[0])
+
+    def test_engine_selected_per_request(self):
+        self.client.force_login(self.officer)
+        response = self.client.get(
+            reverse("export_assets_pdf"), {"engine": "reportlab"}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        pages = PdfReader(io.BytesIO(response.getvalue())).pages
+        self.assertGreater(len(pages), 1)
+        text = [page.extract_text() for page in pages]
+        self.assertIn("PCC HEALTH SERVICES", text[0])
+        # The column header repeats on every page, and only the officer's
+        # branch is exported.
+        self.assertTrue(all("Serial Number" in page for page in text))
+        self.assertEqual(
+            sum(page.count("AST-TEST-") for page in text),
+            Asset.objects.filter(branch=self.branches[0]).count(),
+        )
+
+    def test_branch_sections_merged(self):
+        admin = make_user("admin", "super_admin")
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse("export_assets_pdf"), {"engine": "reportlab"}
+        )
+        reader = PdfReader(io.BytesIO(response.getvalue()))
+
+        self.assertEqual(
+            [item.title for item in reader.outline],
+            [f"{branch.name} ({branch.code})" for branch in self.branches],
+        )
+        total = len(reader.pages)
+        for number, page in enumerate(reader.pages, 1):
+            self.assertIn(f"Page {number} of {total}", page.extract_text())
+
+    def test_markup_in_branch_names_is_escaped(self):
+        branch = self.branches[1]
+        branch.name = "A <b Hospital & Clinic"
+        branch.save()
+        self.client.force_login(make_user("admin", "super_admin"))
+        response = self.client.get(
+            reverse("export_assets_pdf"), {"engine": "reportlab"}
+        )
+        self.assertEqual(response.status_code, 200)
+        reader = PdfReader(io.BytesIO(response.getvalue()))
+        self.assertIn(
+            f"A <b Hospital & Clinic ({branch.code})",
+            [item.title for item in reader.outline],
+        )
+
+    def test_unknown_engine(self):
+        self.client.force_login(self.officer)
+        response = self.client.get(reverse("export_assets_pdf"), {"engine": "nope"})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(ASSET_PDF_WORKERS=2)
+class ReportLabPdfWorkerTests(TransactionTestCase):
+    # Worker processes only see committed rows in a database file.
+    databases = {"default"}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.databases = {"default", "pdf_workers"}
+        directory = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, directory)
+        settings_dict = {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.path.join(directory, "pdf_workers.sqlite3"),
+        }
+        cls.enterClassContext(scratch_database("pdf_workers", settings_dict))
+        call_command("migrate", database="pdf_workers", verbosity=0)
+
+    def setUp(self):
+        branches = Branch.objects.using("pdf_workers").bulk_create(
+            Branch(
+                name=f"Hospital {i}",
+                code=f"HOS-{i}",
+                city="City",
+                region="Centre",
+                manager_name="Dr. Test",
+                manager_phone="+237 600 000 000",
+            )
+            for i in range(3)
+        )
+        Asset.objects.using("pdf_workers").bulk_create(
+            Asset(
+                asset_id=f"AST-TEST-{i:07d}",
+                name=f"Asset {i}",
+                category="computer",
+                serial_number=f"SN-{i:07d}",
+                branch_id=branches[i % 3].pk,
+                department="other",
+                purchase_date=datetime.date(2024, 1, 1),
+                purchase_cost=1000,
+                supplier_name="Supplier",
+                status="in_use",
+                custodian_name="Custodian",
+                custodian_phone="+237 600 000 000",
+            )
+            for i in range(150)
+        )
+        self.branches = branches
+        self.addCleanup(self.shutdown_pool)
+
+    def shutdown_pool(self):
+        if pdf_reports._pool is not None:
+            pdf_reports._pool.shutdown()
+            pdf_reports._pool = None
+
+    def test_sections_rendered_in_worker_processes(self):
+        assets = Asset.objects.using("pdf_workers").all()
+        output = io.BytesIO()
+        rendered = []
+        self.assertTrue(
+            pdf_reports.render_assets_pdf_reportlab(assets, output, rendered.append)
+        )
+        self.assertIsNotNone(pdf_reports._pool)
+        self.assertEqual(rendered[-1], 150)
+
+        reader = PdfReader(output)
+        self.assertEqual(
+            [item.title for item in reader.outline],
+            [f"{branch.name} ({branch.code})" for branch in self.branches],
+        )
+        text = [page.extract_text() for page in reader.pages]
+        self.assertEqual(sum(page.count("AST-TEST-") for page in text), 150)
+        total = len(reader.pages)
+        self.assertGreaterEqual(total, 3)
+        self.assertIn(f"Page {total} of {total}", text[-1])
+
+
+class ExportCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branches = make_branches(2)
+        make_assets(cls.branches, 20)
+        cls.manager = make_user("manager", "branch_manager", cls.branches[0])
+        cls.officer = make_user("officer", "inventory_officer", cls.branches[0])
+        cls.other = make_user("other", "inventory_officer", cls.branches[1])
+
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.enterContext(self.settings(EXPORT_CACHE_DIR=cache_dir))
+        self.cache_dir = cache_dir
+
+    def export(self, user):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("export_assets_excel"))
+        self.assertEqual(response.status_code, 200)
+        content = b"".join(response.streaming_content)
+        response.close()
+        return content, len(queries)
+
+    def test_reused_within_branch_scope(self):
+        first, first_queries = self.export(self.manager)
+        second, second_queries = self.export(self.officer)
+        self.assertEqual(first, second)
+        self.assertLess(second_queries, first_queries)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+        self.export(self.other)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_exports_follow_filters_and_scope(self):
+        response = self.client.get(reverse("export_assets_excel"))
+        self.assertEqual(response.status_code, 302)
+
+        params = {"status": "available", "branch": str(self.branches[1].pk)}
+        self.client.force_login(self.officer)
+        response = self.client.get(reverse("export_assets_excel"), params)
+        sheet = openpyxl.load_workbook(io.BytesIO(response.getvalue())).active
+        exported = {row[0] for row in sheet.iter_rows(min_row=2, values_only=True)}
+
+        # The branch filter is ignored outside the officer's own branch.
+        expected = Asset.objects.filter(branch=self.branches[0], status="available")
+        self.assertEqual(exported, set(expected.values_list("asset_id", flat=True)))
+
+    def test_asset_write_only_regenerates_exports_of_its_branch(self):
+        _, miss_queries = self.export(self.manager)
+        self.export(self.other)
+        asset = Asset.objects.filter(branch=self.branches[0]).first()
+        asset.name = "Renamed Asset"
+        with self.captureOnCommitCallbacks(execute=True):
+            asset.save()
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+        content, queries = self.export(self.manager)
+        self.assertEqual(queries, miss_queries)
+        sheet = openpyxl.load_workbook(io.BytesIO(content)).active
+        self.assertIn("Renamed Asset", [row[1] for row in sheet.values])
+
+        _, queries = self.export(self.other)
+        self.assertLess(queries, miss_queries)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            asset.delete()
+        _, queries = self.export(self.manager)
+        self.assertEqual(queries, miss_queries)
+
+    def test_bulk_update_regenerates_exports(self):
+        _, miss_queries = self.export(self.manager)
+        self.export(self.other)
+        with self.captureOnCommitCallbacks(execute=True):
+            Asset.objects.filter(branch=self.branches[0]).update(name="Bulk Renamed")
+        content, queries = self.export(self.manager)
+        self.assertEqual(queries, miss_queries)
+        sheet = openpyxl.load_workbook(io.BytesIO(content)).active
+        self.assertIn("Bulk Renamed", [row[1] for row in sheet.values])
+        _, queries = self.export(self.other)
+        self.assertLess(queries, miss_queries)
+
+        # Moving rows supersedes the exports of the branch they move to.
+        with self.captureOnCommitCallbacks(execute=True):
+            Asset.objects.filter(name="Bulk Renamed").update(branch=self.branches[1])
+        content, _ = self.export(self.other)
+        sheet = openpyxl.load_workbook(io.BytesIO(content)).active
+        self.assertIn("Bulk Renamed", [row[1] for row in sheet.values])
+
+    def test_file_evicted_after_opening_is_regenerated(self):
+        self.export(self.manager)
+        _, hit_queries = self.export(self.manager)
+        with mock.patch("myapp.export_cache.os.utime", side_effect=FileNotFoundError):
+            content, queries = self.export(self.manager)
+        self.assertGreater(queries, hit_queries)
+        sheet = openpyxl.load_workbook(io.BytesIO(content)).active
+        self.assertEqual(len(list(sheet.values)), 21)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_pdf_key_includes_report_period(self):
+        self.client.force_login(self.manager)
+        url = reverse("export_assets_pdf")
+        with mock.patch("myapp.export_views.datetime") as clock:
+            clock.now.return_value = datetime.datetime(2026, 9, 30, 12)
+            self.client.get(url, {"engine": "reportlab"}).close()
+            self.client.get(url, {"engine": "reportlab"}).close()
+            self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+            clock.now.return_value = datetime.datetime(2026, 10, 1, 12)
+            self.client.get(url, {"engine": "reportlab"}).close()
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_least_recently_used_evicted(self):
+        _, miss_queries = self.export(self.manager)
+        self.export(self.other)
+        self.export(self.manager)
+        size = sum(
+            os.path.getsize(os.path.join(self.cache_dir, name))
+            for name in os.listdir(self.cache_dir)
+        )
+        evict_export_cache(max_size=size - 1)
+
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        _, queries = self.export(self.manager)
+        self.assertLess(queries, miss_queries)
+
+
+class AssetImportTests(TestCase):
+    HEADERS = [
+        "name",
+        "category",
+        "serial_number",
+        "branch",
+        "department",
+        "purchase_date",
+        "purchase_cost",
+        "supplier_name",
+        "status",
+        "custodian_name",
+        "custodian_phone",
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.branches = make_branches(2)
+
+    def dataset(self, rows):
+        return tablib.Dataset(*rows, headers=self.HEADERS)
+
+    def row(self, i, **overrides):
+        values = {
+            "name": f"Imported {i}",
+            "category": "Medical Equipment",
+            "serial_number": f"IMP-{i:05d}",
+            "branch": self.branches[i % 2].code,
+            "department": "radiology",
+            "purchase_date": "2024-05-01",
+            "purchase_cost": "2500.00",
+            "supplier_name": "Supplier",
+            "status": "in_use",
+            "custodian_name": "Custodian",
+            "custodian_phone": "+237 600 000 000",
+        }
+        values.update(overrides)
+        return [values[header] for header in self.HEADERS]
+
+    def test_bulk_import(self):
+        rows = [self.row(i) for i in range(2500)]
+        with CaptureQueriesContext(connection) as queries:
+            result = AssetResource().import_data(self.dataset(rows))
+        self.assertFalse(result.has_errors() or result.has_validation_errors())
+        # Queries grow with the number of batches, not the number of rows.
+        self.assertLess(len(queries), 250)
+
+        assets = Asset.objects.all()
+        self.assertEqual(assets.count(), 2500)
+        self.assertEqual(
+            len(set(assets.values_list("asset_id", flat=True))), assets.count()
+        )
+        self.assertEqual(assets.filter(category="medical_equipment").count(), 2500)
+        self.assertEqual(
+            AssetRollup.objects.compute(),
+            {
+                (row.branch_id, row.status, row.category, row.department): (
+                    row.asset_count,
+                    row.total_cost,
+                )
+                for row in AssetRollup.objects.all()
+            },
+        )
+
+    def test_invalid_rows_reported(self):
+        rows = [
+            self.row(1),
+            self.row(2, branch="NOPE", purchase_cost="abc"),
+            self.row(3, serial_number="IMP-00001"),
+        ]
+        result = AssetResource().import_data(
+            self.dataset(rows), rollback_on_validation_errors=True
+        )
+        self.assertEqual(
+            sorted(import_error_rows(result)),
+            [
+                (2, "branch", "Unknown branch code 'NOPE'."),
+                (2, "purchase_cost", "'abc' is not a valid amount."),
+                (
+                    3,
+                    "serial_number",
+                    "This serial number appears more than once in the file.",
+                ),
+            ],
+        )
+        self.assertFalse(Asset.objects.exists())
+
+    def test_admin_import_page(self):
+        admin = User.objects.create_superuser("root", password="x")
+        self.client.force_login(admin)
+        response = self.client.get(reverse("admin:myapp_asset_import"))
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(EXPORT_CACHE_DIR=None)
+class XlsxImportTests(TestCase):
+    FIELDS = [
+        "name",
+        "category",
+        "brand",
+        "model",
+        "serial_number",
+        "branch_id",
+        "department",
+        "purchase_date",
+        "purchase_cost",
+        "supplier_name",
+        "status",
+        "condition",
+        "custodian_name",
+        "custodian_phone",
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.branches = make_branches(2)
+        make_assets(cls.branches, 250)
+        cls.admin = make_user("admin", "super_admin")
+
+    def export_workbook(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("export_assets_excel"))
+        handle, path = tempfile.mkstemp(suffix=".xlsx")
+        with os.fdopen(handle, "wb") as f:
+            f.write(response.getvalue())
+        self.addCleanup(os.remove, path)
+        return path
+
+    def snapshot(self):
+        return sorted(Asset.objects.values_list(*self.FIELDS))
+
+    def test_export_round_trips(self):
+        path = self.export_workbook()
+        before = self.snapshot()
+        Asset.objects.all().delete()
+
+        checkpoint = import_workbook(path, batch_size=100)
+        self.assertEqual(checkpoint.assets_created, 250)
+        self.assertEqual(checkpoint.rows_invalid, 0)
+        self.assertEqual(self.snapshot(), before)
+
+    def test_interrupted_import_resumes(self):
+        path = self.export_workbook()
+        Asset.objects.all().delete()
+
+        def stop_after_first_batch(checkpoint):
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            import_workbook(path, batch_size=100, progress=stop_after_first_batch)
+        self.assertEqual(Asset.objects.count(), 100)
+
+        errors = []
+        checkpoint = import_workbook(
+            path, batch_size=100, on_error=lambda *error: errors.append(error)
+        )
+        self.assertEqual(errors, [])
+        self.assertEqual(checkpoint.rows_done, 250)
+        self.assertEqual(Asset.objects.count(), 250)
+        self.assertIsNotNone(checkpoint.finished_at)
+
+        # Rows already in the database are rejected, not duplicated.
+        checkpoint = import_workbook(path, restart=True, on_error=lambda *e: None)
+        self.assertEqual((checkpoint.assets_created, checkpoint.rows_invalid), (0, 250))
+
+
+class SampleDataTests(TestCase):
+    def populate(self, **options):
+        call_command("populate_sample_data", stdout=io.StringIO(), **options)
+
+    def test_scale_mode_covers_every_choice(self):
+        self.populate(branches=4, assets=2000, users=10, seed=3)
+
+        self.assertEqual(Branch.objects.count(), 4)
+        self.assertEqual(UserRole.objects.filter(role="branch_manager").count(), 4)
+        self.assertEqual(User.objects.count(), 10)
+        assets = Asset.objects.all()
+        self.assertEqual(assets.count(), 2000)
+        for field in ["category", "department", "status", "condition"]:
+            choices = {value for value, _ in Asset._meta.get_field(field).choices}
+            values = set(assets.values_list(field, flat=True).distinct())
+            self.assertEqual(values, choices, field)
+
+        # Rollups and the search index are kept in step with the raw inserts.
+        self.assertEqual(
+            {
+                rollup.get_bucket(): (rollup.asset_count, rollup.total_cost)
+                for rollup in AssetRollup.objects.all()
+            },
+            AssetRollup.objects.compute(),
+        )
+        self.assertEqual(
+            search_assets(assets, "ultrasound").count(),
+            assets.filter(name="Ultrasound Machine").count(),
+        )
+        self.assertEqual(len(set(assets.values_list("asset_id", flat=True))), 2000)
+
+        with self.assertRaises(CommandError):
+            self.populate(branches=4, seed=3)
+
+    def test_load_restores_the_asset_indexes(self):
+        def indexes():
+            with connection.cursor() as cursor:
+                constraints = connection.introspection.get_constraints(
+                    cursor, Asset._meta.db_table
+                )
+            return {name for name, info in constraints.items() if info["index"]}
+
+        before = indexes()
+        self.populate(branches=2, assets=300, users=4, seed=5)
+        self.assertEqual(indexes(), before)
+        self.assertIn("asset_branch_created_idx", before)
+
+    def test_load_into_existing_assets_keeps_the_indexes(self):
+        make_assets(make_branches(1), 30)
+        with CaptureQueriesContext(connection) as queries:
+            self.populate(branches=2, assets=30, users=4, seed=5)
+        self.assertEqual(Asset.objects.count(), 60)
+        self.assertFalse(
+            [query for query in queries if "DROP INDEX" in query["sql"]]
+        )
+
+    def test_same_seed_same_data(self):
+        def generate(seed):
+            rng = random.Random(seed)
+            branches = sample_data.generate_branches(rng, 3)
+            for pk, branch in enumerate(branches, start=1):
+                branch.pk = pk
+            users = sample_data.generate_users(rng, 5, branches)
+            rows = sample_data.generate_asset_rows(rng, branches, users, 500, 200)
+            return [
+                [(branch.code, branch.manager_name) for branch in branches],
+                [(user.username, role) for user, role, _ in users],
+                list(itertools.chain.from_iterable(rows)),
+            ]
+
+        self.assertEqual(generate(1), generate(1))
+        self.assertNotEqual(generate(1), generate(2))
+
+    def test_default_demo_data_is_unchanged(self):
+        self.populate()
+        self.assertEqual(Branch.objects.count(), 3)
+        self.assertEqual(Asset.objects.count(), 10)
+
+
+@override_settings(ASSET_PDF_WORKERS=1)
+class BenchCommandTests(TestCase):
+    def bench(self, **options):
+        call_command(
+            "bench",
+            sizes=[60],
+            branches=2,
+            iterations=2,
+            export_iterations=1,
+            stdout=io.StringIO(),
+            **options,
+        )
+
+    def test_report_covers_every_role_and_view(self):
+        report_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, report_dir)
+        path = os.path.join(report_dir, "bench.json")
+        self.bench(output=path)
+
+        with open(path) as f:
+            report = json.load(f)
+        results = {(r["role"], r["view"]): r for r in report["results"]}
+        self.assertEqual(len(results), 18)
+        self.assertEqual(results["inventory_officer", "branch_list"]["status"], 302)
+        for result in results.values():
+            self.assertGreater(result["queries"], 0)
+            self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+        # The benchmark runs in scratch databases; nothing reaches this one.
+        self.assertFalse(Asset.objects.exists())
+        self.assertFalse(Branch.objects.exists())
+
+        # The same run compared with itself passes; a baseline that needed
+        # fewer queries is reported as a regression.
+        self.bench(views=["dashboard"], baseline=path, threshold=100)
+        results["super_admin", "dashboard"]["queries"] -= 1
+        with open(path, "w") as f:
+            json.dump(report, f)
+        with self.assertRaises(CommandError):
+            self.bench(views=["dashboard"], baseline=path, threshold=100)
+
+
+@override_settings(EXPORT_CACHE_DIR=None)
+class RequestTimingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branches = make_branches(2)
+        make_assets(cls.branches, 40)
+        cls.admin = make_user("admin", "super_admin")
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def server_timing(self, response):
+        metrics = {}
+        for metric in response["Server-Timing"].split(", "):
+            name, *params = metric.split(";")
+            metrics[name] = dict(param.split("=", 1) for param in params)
+        return metrics
+
+    def test_server_timing_header(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("asset_list"))
+        metrics = self.server_timing(response)
+        self.assertEqual(metrics["sql"]["desc"], f'"{len(queries)} queries"')
+        self.assertIn("render", metrics)
+        self.assertGreaterEqual(
+            float(metrics["total"]["dur"]), float(metrics["render"]["dur"])
+        )
+
+        response = self.client.get(reverse("export_assets_excel"))
+        self.assertIn("excel", self.server_timing(response))
+
+    @override_settings(REQUEST_TIMING_SLOW_MS=0, REQUEST_TIMING_SLOW_QUERIES=2)
+    def test_slow_requests_are_logged_with_their_slowest_queries(self):
+        with self.assertLogs("myapp.timing", "WARNING") as logs:
+            self.client.get(reverse("asset_list"))
+        (message,) = logs.output
+        self.assertIn("GET /assets/ (asset_list) 200", message)
+        self.assertEqual(message.count("SELECT"), 2)
+
+    def test_header_only_sent_to_staff(self):
+        officer = make_user("officer", "inventory_officer", self.branches[0])
+        self.client.force_login(officer)
+        response = self.client.get(reverse("asset_list"))
+        self.assertFalse(response.has_header("Server-Timing"))
+        self.client.logout()
+        response = self.client.get(reverse("login"))
+        self.assertFalse(response.has_header("Server-Timing"))
+
+        with override_settings(DEBUG=True):
+            response = self.client.get(reverse("login"))
+        self.assertIn("total", self.server_timing(response))
+
+    @override_settings(REQUEST_TIMING_ENABLED=False)
+    def test_disabled(self):
+        response = self.client.get(reverse("asset_list"))
+        self.assertFalse(response.has_header("Server-Timing"))
+
+
+@override_settings(EXPORT_CACHE_DIR=None)
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branches = make_branches(2)
+        make_assets(cls.branches, 40)
+        cls.admin = make_user("admin", "super_admin")
+        cls.officer = make_user("officer", "inventory_officer", cls.branches[0])
+
+    def setUp(self):
+        metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, metrics_dir)
+        self.path = os.path.join(metrics_dir, "metrics.sqlite3")
+        settings_override = override_settings(
+            METRICS_DB_PATH=self.path, METRICS_FLUSH_INTERVAL=60
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # Counts recorded after the last read go to the file before it is removed.
+        self.addCleanup(lambda: get_store().flush())
+
+    def test_endpoint(self):
+        self.client.force_login(self.officer)
+        self.client.get(reverse("asset_list"))
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+
+        self.client.force_login(self.admin)
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        with override_settings(EXPORT_CACHE_DIR=cache_dir):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse("export_assets_excel"))
+            self.client.get(reverse("export_assets_excel"))
+            for engine in ("reportlab", "xhtml2pdf"):
+                self.client.get(reverse("export_assets_pdf"), {"engine": engine})
+        # The renderers report how many rows they wrote.
+        self.assertFalse([query for query in queries if "COUNT(" in query["sql"]])
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        lines = response.content.decode().splitlines()
+
+        self.assertIn("# TYPE myapp_http_requests_total counter", lines)
+        self.assertIn(
+            'myapp_http_requests_total{view="asset_list",role="inventory_officer",'
+            'method="GET",status="200"} 1',
+            lines,
+        )
+        self.assertIn(
+            'myapp_http_request_duration_seconds_count{view="export_assets_excel",'
+            'role="super_admin"} 2',
+            lines,
+        )
+        self.assertIn('myapp_export_rows_total{kind="excel"} 40', lines)
+        self.assertIn('myapp_export_rows_total{kind="pdf"} 80', lines)
+        self.assertIn('myapp_export_cache_total{kind="excel",result="hit"} 1', lines)
+        self.assertIn('myapp_export_cache_total{kind="excel",result="miss"} 1', lines)
+        self.assertIn(
+            'myapp_export_render_seconds_bucket{kind="excel",le="+Inf"} 1', lines
+        )
+
+    def test_processes_share_totals(self):
+        workers = [MetricsStore(self.path, 60) for _ in range(2)]
+        for seconds, store in zip([0.02, 3], workers):
+            store.inc("myapp_export_rows_total", [("kind", "pdf")], 10)
+            store.observe(
+                "myapp_export_render_seconds", [("kind", "pdf")], seconds, (0.1, 1)
+            )
+        workers[0].flush()
+
+        lines = workers[1].exposition().splitlines()
+        self.assertIn('myapp_export_rows_total{kind="pdf"} 20', lines)
+        buckets = [line for line in lines if "_bucket" in line]
+        self.assertEqual(
+            buckets,
+            [
+                'myapp_export_render_seconds_bucket{kind="pdf",le="0.1"} 1',
+                'myapp_export_render_seconds_bucket{kind="pdf",le="1"} 1',
+                'myapp_export_render_seconds_bucket{kind="pdf",le="+Inf"} 2',
+            ],
+        )
+        self.assertIn('myapp_export_render_seconds_count{kind="pdf"} 2', lines)
+
+    def test_periodic_flush_runs_in_the_background(self):
+        store = MetricsStore(self.path, 0)
+        store.inc("myapp_export_rows_total", [("kind", "pdf")], 3)
+        for thread in threading.enumerate():
+            if thread.name == "metrics-flush":
+                thread.join()
+        self.assertEqual(store.pending, {})
+        lines = MetricsStore(self.path, 60).exposition().splitlines()
+        self.assertIn('myapp_export_rows_total{kind="pdf"} 3', lines)
+
+
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branches = make_branches(2)
+        make_assets(cls.branches, 40)
+        cls.admin = make_user("admin", "super_admin")
+        cls.manager = make_user("manager", "branch_manager", cls.branches[0])
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings_override = override_settings(PROFILE_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_staff_can_profile_a_request(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("asset_list"), {"_profile": "1"})
+        self.assertEqual(response.status_code, 200)
+        name = response["X-Profile"]
+
+        stats = pstats.Stats(os.path.join(self.directory, f"{name}.prof"))
+        self.assertTrue(stats.total_calls)
+        with open(os.path.join(self.directory, f"{name}.txt")) as f:
+            report = f.read()
+        self.assertIn("GET /assets/?_profile=1 (asset_list) user admin", report)
+        self.assertIn("allocations by line", report)
+
+        self.client.force_login(self.manager)
+        response = self.client.get(reverse("asset_list"), HTTP_X_PROFILE="1")
+        self.assertFalse(response.has_header("X-Profile"))
+
+    @override_settings(PROFILE_SAMPLING={"asset_list": 2}, PROFILE_MAX_FILES=1)
+    def test_sampling_keeps_the_newest_profiles(self):
+        self.client.force_login(self.manager)
+        profiled = [
+            self.client.get(reverse("asset_list")).has_header("X-Profile")
+            for _ in range(4)
+        ]
+        self.assertEqual(profiled, [False, True, False, True])
+        self.assertFalse(self.client.get(reverse("dashboard")).has_header("X-Profile"))
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+    def test_overlapping_calls_are_not_profiled(self):
+        started, release = threading.Event(), threading.Event()
+
+        def slow_view():
+            started.set()
+            release.wait(5)
+            return "slow"
+
+        results = []
+        thread = threading.Thread(
+            target=lambda: results.append(
+                profile_call(slow_view, self.directory, "slow")
+            )
+        )
+        thread.start()
+        try:
+            started.wait(5)
+            self.assertEqual(
+                profile_call(lambda: "fast", self.directory, "fast"), ("fast", None)
+            )
+        finally:
+            release.set()
+            thread.join()
+        result, name = results[0]
+        self.assertEqual(result, "slow")
+        self.assertTrue(os.path.exists(os.path.join(self.directory, f"{name}.prof")))
+        self.assertEqual(profile_call(lambda: 1, self.directory, "next")[0], 1)
+        self.assertEqual(len(os.listdir(self.directory)), 4)
+
+
+class BenchSqliteCommandTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Scratch databases the command registers while it runs.
+        cls.databases = {"bench_template", "bench_stock", "bench_tuned"}
+
+    def test_configured_profile_has_no_lock_errors(self):
+        out = io.StringIO()
+        call_command(
+            "bench_sqlite",
+            threads=4,
+            operations=25,
+            write_ratio=0.5,
+            assets=100,
+            branches=2,
+            stdout=out,
+        )
+        lines = out.getvalue().splitlines()
+        self.assertTrue(any(line.startswith("stock ") for line in lines))
+        self.assertTrue(
+            any(line.startswith("tuned ") and "0 lock errors" in line for line in lines)
+        )
+        self.assertNotIn("bench_tuned", connections)
+
+
+@override_settings(READ_REPLICA_ENABLED=True, EXPORT_CACHE_DIR=None)
+class ReadReplicaTests(TransactionTestCase):
+    # In tests the replica mirrors the default database through another
+    # connection, which only sees committed rows.
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        self.branches = make_branches(2)
+        make_assets(self.branches, 10)
+        self.asset = Asset.objects.first()
+        self.client.force_login(make_user("admin", "super_admin"))
+
+    def app_queries(self, url, method="get", data=None):
+        """Queries of this app's tables per alias while ``url`` is served."""
+        with CaptureQueriesContext(connections["default"]) as primary:
+            with CaptureQueriesContext(connections["replica"]) as replica:
+                response = getattr(self.client, method)(url, data)
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+        return {
+            alias: [query for query in queries if '"myapp_' in query["sql"]]
+            for alias, queries in [("default", primary), ("replica", replica)]
+        }
+
+    def test_read_only_views_read_from_the_replica(self):
+        for url in (reverse("asset_list"), reverse("export_assets_csv")):
+            with self.subTest(url=url):
+                queries = self.app_queries(url)
+                self.assertTrue(queries["replica"])
+                self.assertEqual(queries["default"], [])
+
+    def test_writes_and_other_views_use_the_primary(self):
+        queries = self.app_queries(reverse("asset_edit", args=[self.asset.pk]))
+        self.assertTrue(queries["default"])
+        self.assertEqual(queries["replica"], [])
+
+        asset = Asset.objects.using("replica").get(pk=self.asset.pk)
+        self.assertEqual(router.db_for_write(Asset, instance=asset), "default")
+
+    def test_users_read_the_primary_after_saving(self):
+        url = reverse("asset_delete", args=[self.asset.pk])
+        queries = self.app_queries(url, "post")
+        self.assertEqual(queries["replica"], [])
+        self.assertIn("read_primary", self.client.cookies)
+
+        queries = self.app_queries(reverse("asset_list"))
+        self.assertTrue(queries["default"])
+        self.assertEqual(queries["replica"], [])
+
+    def test_refresh_copies_the_primary(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "replica.sqlite3")
+        copy_database(connections["default"], path)
+
+        copy = sqlite3.connect(path)
+        self.addCleanup(copy.close)
+        (count,) = copy.execute("SELECT COUNT(*) FROM myapp_asset").fetchone()
+        self.assertEqual(count, 10)
+
+
+SHARDS = {
+    "shard_north": {"number": 1, "regions": ["North"]},
+    "shard_south": {"number": 2, "regions": ["South"]},
+}
+
+
+@override_settings(ASSET_SHARDS=SHARDS, EXPORT_CACHE_DIR=None)
+class AssetShardingTests(TransactionTestCase):
+    databases = {"default"}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Shards registered at runtime, as a deployment would list them.
+        cls.databases = {"default", *SHARDS}
+        directory = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, directory)
+        for alias in SHARDS:
+            settings_dict = {
+                "ENGINE": "django.db.backends.sqlite3",
+                "NAME": os.path.join(directory, f"{alias}.sqlite3"),
+                "OPTIONS": {"init_command": "PRAGMA foreign_keys=OFF;"},
+            }
+            cls.enterClassContext(scratch_database(alias, settings_dict))
+            call_command("migrate", database=alias, verbosity=0)
+            # Migrations turn foreign key checks back on for the connection.
+            close_connection(alias)
+
+    def setUp(self):
+        self.north, self.south, self.centre = [
+            Branch.objects.create(
+                name=f"{region} Hospital",
+                code=f"HOS-{region.upper()}",
+                city="City",
+                region=region,
+                manager_name="Dr. Test",
+                manager_phone="+237 600 000 000",
+            )
+            for region in ("North", "South", "Centre")
+        ]
+        self.admin = make_user("admin", "super_admin")
+        for i in range(12):
+            create_asset(
+                [self.north, self.south, self.centre][i % 3], i, created_by=self.admin
+            )
+
+    def test_assets_are_stored_in_their_branch_shard(self):
+        span = settings.ASSET_SHARD_ID_SPAN
+        for alias, branch, number in [
+            ("shard_north", self.north, 1),
+            ("shard_south", self.south, 2),
+            ("default", self.centre, 0),
+        ]:
+            with self.subTest(alias=alias):
+                assets = Asset.objects.using(alias)
+                self.assertEqual(
+                    set(assets.values_list("branch_id", flat=True)), {branch.pk}
+                )
+                self.assertEqual(assets.count(), 4)
+                self.assertTrue(
+                    all(
+                        pk // span == number
+                        for pk in assets.values_list("pk", flat=True)
+                    )
+                )
+                self.assertEqual(AssetRollup.objects.using(alias).get().asset_count, 4)
+        self.assertTrue(
+            Branch.objects.using("shard_north").filter(pk=self.north.pk).exists()
+        )
+        self.assertFalse(
+            Branch.objects.using("shard_north").filter(pk=self.south.pk).exists()
+        )
+
+    def test_branch_users_only_query_their_shard(self):
+        self.client.force_login(make_user("manager", "branch_manager", self.north))
+        with CaptureQueriesContext(connections["default"]) as primary:
+            with CaptureQueriesContext(connections["shard_north"]) as shard:
+                response = self.client.get(reverse("asset_list"))
+        self.assertEqual(response.context["total_count"], 4)
+        self.assertTrue(shard.captured_queries)
+        self.assertFalse(
+            [query for query in primary if '"myapp_asset"' in query["sql"]]
+        )
+
+    def test_super_admin_views_span_every_shard(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("dashboard"))
+        self.assertEqual(response.context["total_assets"], 12)
+        recent = [asset.created_at for asset in response.context["recent_assets"]]
+        self.assertEqual(recent, sorted(recent, reverse=True))
+        self.assertEqual(len(recent), 5)
+
+        seen = []
+        params = {"per_page": 5}
+        while True:
+            page = self.client.get(reverse("asset_list"), params).context["page"]
+            seen.extend(asset.pk for asset in page)
+            if not page.has_next:
+                break
+            params["after"] = page.next_cursor
+        self.assertEqual(len(seen), 12)
+        self.assertEqual(
+            seen, [asset.pk for asset in Asset.objects.for_user(self.admin)]
+        )
+
+        response = self.client.get(
+            reverse("export_assets_ndjson"), {"updated_since": "2000-01-01"}
+        )
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual(len(rows), 12)
+        updated = [row["updated_at"] for row in rows]
+        self.assertEqual(updated, sorted(updated))
+
+        for asset in Asset.objects.for_user(self.admin):
+            response = self.client.get(reverse("asset_detail", args=[asset.pk]))
+            self.assertEqual(response.context["asset"].created_by, self.admin)
+
+    def test_moving_an_asset_to_another_region_moves_it_between_shards(self):
+        asset = Asset.objects.using("shard_north").first()
+        asset.branch = self.south
+        asset.save()
+
+        self.assertFalse(
+            Asset.objects.using("shard_north").filter(pk=asset.pk).exists()
+        )
+        self.assertEqual(
+            Asset.objects.for_user(self.admin).get(pk=asset.pk).branch_id, self.south.pk
+        )
+        call_command("rebuild_asset_rollups", verify=True, stdout=io.StringIO())
+
+        form = BranchForm(
+            {
+                "name": self.north.name,
+                "code": self.north.code,
+                "city": self.north.city,
+                "region": "South",
+                "manager_name": self.north.manager_name,
+                "manager_phone": self.north.manager_phone,
+                "status": self.north.status,
+            },
+            instance=self.north,
+        )
+        self.assertIn("region", form.errors)
+
+    def test_branch_shards_are_looked_up_once_until_a_branch_changes(self):
+        self.assertEqual(shard_for_branch(self.north.pk), "shard_north")
+        with self.assertNumQueries(0):
+            self.assertEqual(shard_for_branch(self.north.pk), "shard_north")
+
+        self.assertEqual(shard_for_branch(self.centre.pk), "default")
+        self.centre.region = "South"
+        self.centre.save()
+        self.assertEqual(shard_for_branch(self.centre.pk), "shard_south")
+
+    def test_shard_assets_moves_rows_loaded_into_default(self):
+        make_assets([self.north], 3)
+        self.assertEqual(Asset.objects.filter(branch=self.north).count(), 3)
+
+        call_command("shard_assets", stdout=io.StringIO())
+
+        self.assertFalse(Asset.objects.filter(branch=self.north).exists())
+        self.assertEqual(Asset.objects.using("shard_north").count(), 7)
+        call_command("rebuild_asset_rollups", verify=True, stdout=io.StringIO())
+
+    def test_sharded_queries_run_and_merge_in_threads(self):
+        # Both shards are files, so their queries run in parallel threads.
+        assets = ShardedQuerySet(
+            [Asset.objects.using(alias) for alias in SHARDS]
+        ).order_by("serial_number")
+        expected = sorted(
+            serial
+            for alias in SHARDS
+            for serial in Asset.objects.using(alias).values_list(
+                "serial_number", flat=True
+            )
+        )
+        self.assertEqual([asset.serial_number for asset in assets], expected)
+        self.assertEqual(
+            list(assets.values_list("serial_number", flat=True).iterator(chunk_size=3)),
+            expected,
+        )
+        self.assertEqual(
+            list(assets.values("name")[:3]),
+            [{"name": "Asset 0"}, {"name": "Asset 1"}, {"name": "Asset 3"}],
+        )
+        self.assertEqual(assets.count(), 8)
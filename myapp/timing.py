@@ -0,0 +1,107 @@
+"""
+Per-request performance measurements, collected by ``RequestTimingMiddleware``.
+
+While a request is measured its ``RequestTiming`` is the current one: SQL
+statements are recorded by a database execute wrapper, Django template
+rendering by a wrapper installed on the template backend, and other steps
+(such as rendering an export) can be timed with ``timed()``. Outside a
+measured request, ``timed()`` does nothing.
+"""
+
+import heapq
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar("request_timing", default=None)
+
+
+class RequestTiming:
+    """Timings for one request; also usable as a database execute wrapper."""
+
+    def __init__(self, slow_queries=5):
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.spans = {}
+        self.slow_queries = slow_queries
+        # Min-heap of (seconds, sequence, sql) for the slowest statements.
+        self._slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = time.perf_counter() - started
+            self.sql_count += 1
+            self.sql_seconds += seconds
+            if self.slow_queries:
+                entry = (seconds, self.sql_count, sql)
+                if len(self._slowest) < self.slow_queries:
+                    heapq.heappush(self._slowest, entry)
+                else:
+                    heapq.heappushpop(self._slowest, entry)
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def stop(self):
+        self.seconds = time.perf_counter() - self.started
+
+    def slowest_queries(self):
+        """``(seconds, sql)`` for the slowest statements, slowest first."""
+        return [(seconds, sql) for seconds, _, sql in sorted(self._slowest)[::-1]]
+
+    def server_timing(self):
+        """The ``Server-Timing`` header value, in milliseconds."""
+        metrics = [
+            f"total;dur={self.seconds * 1000:.1f}",
+            f'sql;dur={self.sql_seconds * 1000:.1f};desc="{self.sql_count} queries"',
+        ]
+        metrics.extend(
+            f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.spans.items()
+        )
+        return ", ".join(metrics)
+
+
+@contextmanager
+def measure_request(timing):
+    """Make ``timing`` the current request's measurements."""
+    token = _current.set(timing)
+    try:
+        yield timing
+    finally:
+        _current.reset(token)
+        timing.stop()
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to the current request's ``name`` span."""
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - started)
+
+
+def instrument_templates():
+    """Time Django template rendering as the ``render`` span."""
+    from django.template.backends.django import Template
+
+    if getattr(Template.render, "timed", False):
+        return
+    render = Template.render
+
+    def timed_render(self, context=None, request=None):
+        with timed("render"):
+            return render(self, context, request)
+
+    timed_render.timed = True
+    Template.render = timed_render
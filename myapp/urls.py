@@ -14,6 +14,7 @@ urlpatterns = [
     path("assets/<int:asset_id>/", views.asset_detail, name="asset_detail"),
     path("assets/<int:asset_id>/edit/", views.asset_edit, name="asset_edit"),
     path("assets/<int:asset_id>/delete/", views.asset_delete, name="asset_delete"),
+    path("metrics/", views.metrics, name="metrics"),
     # export URLs
     path(
         "export/assets/pdf/", export_views.export_assets_pdf, name="export_assets_pdf"
@@ -23,4 +24,23 @@ urlpatterns = [
         export_views.export_assets_excel,
         name="export_assets_excel",
     ),
+    path(
+        "export/assets/csv/", export_views.export_assets_csv, name="export_assets_csv"
+    ),
+    path(
+        "export/assets/ndjson/",
+        export_views.export_assets_ndjson,
+        name="export_assets_ndjson",
+    ),
+    path("export/jobs/", export_views.export_job_submit, name="export_job_submit"),
+    path(
+        "export/jobs/<uuid:job_id>/",
+        export_views.export_job_status,
+        name="export_job_status",
+    ),
+    path(
+        "export/jobs/<uuid:job_id>/download/",
+        export_views.export_job_download,
+        name="export_job_download",
+    ),
 ]
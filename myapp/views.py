@@ -1,16 +1,18 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.models import User
 from django.contrib import messages
-from django.db.models import Q, Count
-from django.http import Http404
-from .models import Branch, Asset, UserRole
+from django.conf import settings
+from django.db.models import Sum
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
+from collections import Counter
+from .models import Branch, Asset, AssetRollup
 from .forms import BranchForm, AssetForm
-
-from django.db.models import Q, Count, Case, When, IntegerField
-from django.core.paginator import Paginator
-from datetime import date
+from .metrics import get_store
+from .pagination import KeysetPaginator, cached_count
+from .search import search_assets
+from .sharding import across_shards, on_branch_shard, sharding_enabled
 
 
 def login_view(request):
@@ -36,64 +38,40 @@ def logout_view(request):
     return redirect("login")
 
 
-def get_user_role(user):
-    if user.is_superuser:
-        return "super_admin"
-    try:
-        return user.role.role
-    except UserRole.DoesNotExist:
-        return None
-
-
-def user_has_permission(user, asset_or_branch):
-    role = get_user_role(user)
-
-    if role == "super_admin":
-        return True
-
-    if isinstance(asset_or_branch, Asset):
-        branch = asset_or_branch.branch
-    else:
-        branch = asset_or_branch
-
-    if hasattr(user, "role") and user.role.branch:
-        return user.role.branch == branch
-
-    return False
-
-
 @login_required
 def dashboard(request):
-    role = get_user_role(request.user)
+    access = request.access
 
-    if role == "super_admin":
+    # Counts come from the incrementally maintained rollups, so this reads
+    # a handful of rows per branch instead of scanning the asset table.
+    if access.is_super_admin:
         total_branches = Branch.objects.count()
-        total_assets = Asset.objects.count()
-        recent_assets = Asset.objects.all()[:5]
-        assets_by_status = Asset.objects.values("status").annotate(count=Count("id"))
+        rollups = across_shards(AssetRollup.objects.all())
     else:
-        if not hasattr(request.user, "role") or not request.user.role.branch:
-            branch = None
-        else:
-            branch = request.user.role.branch
-
-        total_branches = 1 if branch else 0
-        total_assets = Asset.objects.filter(branch=branch).count() if branch else 0
-        recent_assets = Asset.objects.filter(branch=branch)[:5] if branch else []
-        assets_by_status = (
-            Asset.objects.filter(branch=branch)
-            .values("status")
-            .annotate(count=Count("id"))
-            if branch
-            else []
+        total_branches = 1 if access.branch_id else 0
+        rollups = on_branch_shard(
+            AssetRollup.objects.filter(branch_id=access.branch_id), access.branch_id
         )
+    recent_assets = Asset.objects.for_user(request.user).select_related("branch")[:5]
+
+    # Each shard's counts are added up here.
+    counts = Counter()
+    if access.is_super_admin or access.branch_id:
+        for row in rollups.values("status").annotate(count=Sum("asset_count")):
+            counts[row["status"]] += row["count"]
+    assets_by_status = [
+        {"status": status, "count": count}
+        for status, count in sorted(counts.items())
+        if count > 0
+    ]
+    total_assets = sum(counts.values())
 
     context = {
         "total_branches": total_branches,
         "total_assets": total_assets,
         "recent_assets": recent_assets,
         "assets_by_status": assets_by_status,
-        "role": role,
+        "role": access.role,
     }
 
     return render(request, "dashboard.html", context)
@@ -101,21 +79,21 @@ def dashboard(request):
 
 @login_required
 def branch_list(request):
-    role = get_user_role(request.user)
+    access = request.access
 
-    if role not in ["super_admin", "branch_manager"]:
+    if not access.can_view_branches:
         messages.error(request, "You do not have permission to view branches.")
         return redirect("dashboard")
 
-    branches = Branch.objects.all()
+    branches = Branch.objects.for_user(request.user)
     return render(request, "branches/list.html", {"branches": branches})
 
 
 @login_required
 def branch_add(request):
-    role = get_user_role(request.user)
+    access = request.access
 
-    if role != "super_admin":
+    if not access.is_super_admin:
         messages.error(request, "Only Super Admins can add branches.")
         return redirect("branch_list")
 
@@ -133,9 +111,9 @@ def branch_add(request):
 
 @login_required
 def branch_edit(request, branch_id):
-    role = get_user_role(request.user)
+    access = request.access
 
-    if role != "super_admin":
+    if not access.is_super_admin:
         messages.error(request, "Only Super Admins can edit branches.")
         return redirect("branch_list")
 
@@ -157,46 +135,85 @@ def branch_edit(request, branch_id):
     )
 
 
+ASSET_FILTER_PARAMS = ("search", "branch", "status", "category")
+
+
+def asset_filter_params(params):
+    """The non-empty asset list filters in ``params``, as a plain dict."""
+    return {key: params[key] for key in ASSET_FILTER_PARAMS if params.get(key)}
+
+
+def filter_assets(assets, params, access, ranked=False):
+    """
+    Apply the asset list's search and filter ``params`` (``request.GET`` or
+    a plain dict) to ``assets``. With ``ranked=True`` a search orders the
+    rows best match first (see ``search_assets``).
+    """
+    search_query = params.get("search", "").strip()
+    filter_branch = params.get("branch", "")
+    filter_status = params.get("status", "")
+    filter_category = params.get("category", "")
+
+    if search_query:
+        assets = search_assets(assets, search_query, ranked=ranked)
+
+    if filter_branch.isdigit():
+        if access.is_super_admin:
+            assets = assets.filter(branch_id=filter_branch)
+
+    if filter_status:
+        assets = assets.filter(status=filter_status)
+
+    if filter_category:
+        assets = assets.filter(category=filter_category)
+
+    return assets
+
+
 @login_required
 def asset_list(request):
-    role = get_user_role(request.user)
+    access = request.access
     search_query = request.GET.get("search", "")
     filter_branch = request.GET.get("branch", "")
     filter_status = request.GET.get("status", "")
     filter_category = request.GET.get("category", "")
 
-    if role == "super_admin":
-        assets = Asset.objects.all()
-        branches = Branch.objects.all()
-    else:
-        if not hasattr(request.user, "role") or not request.user.role.branch:
-            assets = Asset.objects.none()
-            branches = Branch.objects.none()
-        else:
-            assets = Asset.objects.filter(branch=request.user.role.branch)
-            branches = Branch.objects.filter(id=request.user.role.branch.id)
+    # The template shows each row's branch code.
+    ranked = bool(search_query.strip())
+    assets = filter_assets(
+        Asset.objects.for_user(request.user).select_related("branch"),
+        request.GET,
+        request.access,
+        ranked=ranked,
+    )
+    branches = Branch.objects.for_user(request.user)
 
-    if search_query:
-        assets = assets.filter(
-            Q(name__icontains=search_query) | Q(asset_id__icontains=search_query)
-        )
+    try:
+        per_page = int(request.GET.get("per_page", settings.ASSET_LIST_PAGE_SIZE))
+    except ValueError:
+        per_page = settings.ASSET_LIST_PAGE_SIZE
+    per_page = max(1, min(per_page, settings.ASSET_LIST_MAX_PAGE_SIZE))
 
-    if filter_branch:
-        if role == "super_admin":
-            assets = assets.filter(branch_id=filter_branch)
+    page = KeysetPaginator(assets, per_page, ranked=ranked).get_page(
+        after=request.GET.get("after"), before=request.GET.get("before")
+    )
 
-    if filter_status:
-        assets = assets.filter(status=filter_status)
+    total_count = None
+    if settings.ASSET_LIST_COUNT_CACHE_TIMEOUT is not None:
+        total_count = cached_count(assets, settings.ASSET_LIST_COUNT_CACHE_TIMEOUT)
 
     context = {
-        "assets": assets,
+        "assets": page,
+        "page": page,
+        "total_count": total_count,
         "branches": branches,
         "search_query": search_query,
         "filter_category": filter_category,
         "filter_branch": filter_branch,
         "filter_status": filter_status,
         "status_choices": Asset._meta.get_field("status").choices,
-        "role": role,
+        "category_choices": Asset._meta.get_field("category").choices,
+        "role": access.role,
     }
 
     return render(request, "assets/list.html", context)
@@ -204,9 +221,9 @@ def asset_list(request):
 
 @login_required
 def asset_add(request):
-    role = get_user_role(request.user)
+    access = request.access
 
-    if role not in ["branch_manager", "inventory_officer", "super_admin"]:
+    if access.role not in ["branch_manager", "inventory_officer", "super_admin"]:
         messages.error(request, "You do not have permission to add assets.")
         return redirect("asset_list")
 
@@ -216,46 +233,42 @@ def asset_add(request):
             asset = form.save(commit=False)
             asset.created_by = request.user
 
-            if role in ["branch_manager", "inventory_officer"]:
-                if not hasattr(request.user, "role") or not request.user.role.branch:
+            if not access.is_super_admin:
+                if not access.branch_id:
                     messages.error(request, "You must be assigned to a branch.")
                     return redirect("asset_list")
-                asset.branch = request.user.role.branch
+                asset.branch_id = access.branch_id
 
             asset.save()
             messages.success(request, "Asset added successfully.")
             return redirect("asset_list")
     else:
         form = AssetForm()
-        if role in ["branch_manager", "inventory_officer"]:
-            if hasattr(request.user, "role") and request.user.role.branch:
-                form.fields["branch"].initial = request.user.role.branch
-                form.fields["branch"].queryset = Branch.objects.filter(
-                    id=request.user.role.branch.id
-                )
+        if not access.is_super_admin and access.branch_id:
+            form.fields["branch"].initial = access.branch_id
+            form.fields["branch"].queryset = Branch.objects.for_user(request.user)
 
     return render(request, "assets/form.html", {"form": form, "title": "Add Asset"})
 
 
 @login_required
 def asset_edit(request, asset_id):
-    asset = get_object_or_404(Asset, id=asset_id)
-    role = get_user_role(request.user)
-
-    if not user_has_permission(request.user, asset):
-        messages.error(request, "You do not have permission to edit this asset.")
-        raise Http404
+    # Scoping the lookup means assets outside the user's branch are a plain
+    # 404, without loading them first.
+    asset = get_object_or_404(Asset.objects.for_user(request.user), id=asset_id)
 
     if request.method == "POST":
         form = AssetForm(request.POST, request.FILES, instance=asset)
-        if form.is_valid():
-            form.save()
-            messages.success(request, "Asset updated successfully.")
-            return redirect("asset_list")
     else:
         form = AssetForm(instance=asset)
-        if role in ["branch_manager", "inventory_officer"]:
-            form.fields["branch"].queryset = Branch.objects.filter(id=asset.branch.id)
+
+    if not request.access.is_super_admin:
+        form.fields["branch"].queryset = Branch.objects.for_user(request.user)
+
+    if request.method == "POST" and form.is_valid():
+        form.save()
+        messages.success(request, "Asset updated successfully.")
+        return redirect("asset_list")
 
     return render(
         request,
@@ -266,24 +279,27 @@ def asset_edit(request, asset_id):
 
 @login_required
 def asset_detail(request, asset_id):
-    asset = get_object_or_404(Asset, id=asset_id)
-
-    if not user_has_permission(request.user, asset):
-        messages.error(request, "You do not have permission to view this asset.")
-        raise Http404
+    # Users are only in the default database, so a sharded asset's creator
+    # is loaded from there rather than joined.
+    related = ["branch"] if sharding_enabled() else ["branch", "created_by"]
+    asset = get_object_or_404(
+        Asset.objects.for_user(request.user).select_related(*related),
+        id=asset_id,
+    )
 
     return render(request, "assets/detail.html", {"asset": asset})
 
 
 @login_required
 def asset_delete(request, asset_id):
-    asset = get_object_or_404(Asset, id=asset_id)
-    role = get_user_role(request.user)
+    access = request.access
 
-    if role != "super_admin":
+    if not access.is_super_admin:
         messages.error(request, "Only Super Admins can delete assets.")
         raise Http404
 
+    asset = get_object_or_404(Asset.objects.for_user(request.user), id=asset_id)
+
     if request.method == "POST":
         asset.delete()
         messages.success(request, "Asset deleted successfully.")
@@ -292,6 +308,19 @@ def asset_delete(request, asset_id):
     return render(request, "assets/confirm_delete.html", {"asset": asset})
 
 
+@login_required
+def metrics(request):
+    """Request and export metrics for Prometheus; staff only."""
+    if not request.user.is_staff:
+        raise PermissionDenied
+    store = get_store()
+    if store is None:
+        raise Http404
+    return HttpResponse(
+        store.exposition(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 # @login_required
 # def maintenance_list(request):
 #     # Get all assets that are in maintenance or have maintenance records
@@ -0,0 +1,235 @@
+"""
+Streaming import of asset workbooks laid out like the Excel export.
+
+The workbook is opened read-only and rows flow through generators: read,
+convert and validate, then commit in fixed-size batches. Each batch is saved
+together with its ``AssetImport`` checkpoint, so an interrupted import of the
+same file continues after the last committed batch, and memory use does not
+depend on the size of the file.
+"""
+
+import hashlib
+import os
+import re
+from itertools import islice
+
+import openpyxl
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.utils import timezone
+from import_export import widgets
+
+from .columns import EXCEL_COLUMNS
+from .models import Asset, AssetImport, Branch
+from .resources import LOOKUP_CHUNK_SIZE, AssetResource, ChoiceWidget, CostWidget
+from .sharding import across_shards, bulk_create_assets
+
+DEFAULT_BATCH_SIZE = 1000
+
+BRANCH_CODE_RE = re.compile(r"\(([^()]+)\)\s*$")
+
+
+class WorkbookError(Exception):
+    pass
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def branch_code(value):
+    """Accept a bare code or the export's "Name (CODE)" form."""
+    text = str(value or "").strip()
+    match = BRANCH_CODE_RE.search(text)
+    return match.group(1).strip() if match else text
+
+
+def _widget_for(field):
+    if field.choices:
+        return ChoiceWidget(field.choices, default=field.get_default() or None)
+    if isinstance(field, models.DecimalField):
+        return CostWidget()
+    if isinstance(field, models.DateField):
+        return widgets.DateWidget()
+    return widgets.CharWidget()
+
+
+def column_map(headers):
+    """
+    Match the workbook's header row against ``EXCEL_COLUMNS`` and return
+    ``[(index, field name, widget)]``. Asset IDs are always allocated anew.
+    """
+    positions = {
+        str(header).strip().lower(): index
+        for index, header in enumerate(headers)
+        if header is not None
+    }
+    columns = []
+    missing = []
+    for header, lookups in EXCEL_COLUMNS:
+        name = lookups[0].split("__")[0]
+        if name == "asset_id":
+            continue
+        field = Asset._meta.get_field(name)
+        index = positions.get(header.lower())
+        if index is None:
+            if not field.blank and not field.has_default():
+                missing.append(header)
+            continue
+        widget = None if name == "branch" else _widget_for(field)
+        columns.append((index, name, widget))
+    if missing:
+        raise WorkbookError(f"Missing columns: {', '.join(missing)}")
+    return columns
+
+
+def read_rows(worksheet):
+    """Yield ``(row number, values)`` for each row after the header."""
+    for number, values in enumerate(
+        worksheet.iter_rows(min_row=2, values_only=True), start=2
+    ):
+        yield number, values
+
+
+def convert_rows(rows, columns, branches):
+    """
+    Turn raw rows into unsaved assets. Yields ``(row number, asset, errors)``
+    where ``errors`` maps field names to messages; blank rows yield None.
+    """
+    for number, values in rows:
+        if not any(value not in (None, "") for value in values):
+            yield number, None, {}
+            continue
+
+        asset = Asset()
+        errors = {}
+        for index, name, widget in columns:
+            value = values[index] if index < len(values) else None
+            if name == "branch":
+                code = branch_code(value)
+                asset.branch_id = branches.get(code)
+                if asset.branch_id is None:
+                    errors["branch"] = [
+                        f"Unknown branch code '{code}'." if code else "Required."
+                    ]
+                continue
+            try:
+                cleaned = widget.clean(value)
+            except ValueError as e:
+                errors[name] = [str(e)]
+                continue
+            if cleaned is not None:
+                setattr(
+                    asset,
+                    name,
+                    cleaned.strip() if isinstance(cleaned, str) else cleaned,
+                )
+
+        try:
+            asset.clean_fields(exclude=[*errors, *AssetResource.UNVALIDATED_FIELDS])
+        except ValidationError as e:
+            errors.update(e.message_dict)
+        yield number, asset, errors
+
+
+def import_workbook(
+    path, batch_size=DEFAULT_BATCH_SIZE, progress=None, on_error=None, restart=False
+):
+    """
+    Import the workbook at ``path`` and return its ``AssetImport`` record.
+
+    ``progress(checkpoint)`` is called after every committed batch and
+    ``on_error(row number, field, message)`` for every rejected row.
+    Importing a file that was already imported does nothing unless
+    ``restart`` is set.
+    """
+    checkpoint, _ = AssetImport.objects.get_or_create(
+        file_hash=file_hash(path), defaults={"file_name": os.path.basename(path)}
+    )
+    if restart:
+        checkpoint.rows_done = checkpoint.assets_created = checkpoint.rows_invalid = 0
+        checkpoint.finished_at = None
+        checkpoint.save()
+    if checkpoint.finished_at is not None:
+        return checkpoint
+
+    branches = dict(Branch.objects.values_list("code", "id"))
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook.worksheets[0]
+        header = next(worksheet.iter_rows(max_row=1, values_only=True), ())
+        columns = column_map(header)
+
+        rows = islice(read_rows(worksheet), checkpoint.rows_done, None)
+        converted = convert_rows(rows, columns, branches)
+        while True:
+            batch = list(islice(converted, batch_size))
+            if not batch:
+                break
+            _commit_batch(checkpoint, batch, on_error)
+            if progress is not None:
+                progress(checkpoint)
+    finally:
+        workbook.close()
+
+    checkpoint.finished_at = timezone.now()
+    checkpoint.save(update_fields=["finished_at", "updated_at"])
+    return checkpoint
+
+
+def _commit_batch(checkpoint, batch, on_error):
+    serials = [
+        asset.serial_number for _, asset, errors in batch if asset and not errors
+    ]
+    with transaction.atomic():
+        # Earlier batches are already committed, so checking the database
+        # also catches serial numbers repeated across batches.
+        taken = set()
+        for start in range(0, len(serials), LOOKUP_CHUNK_SIZE):
+            taken.update(
+                across_shards(
+                    Asset.objects.filter(
+                        serial_number__in=serials[start : start + LOOKUP_CHUNK_SIZE]
+                    )
+                ).values_list("serial_number", flat=True)
+            )
+        valid = []
+        rejected = []
+        for number, asset, errors in batch:
+            if asset is None:
+                continue
+            if not errors and asset.serial_number in taken:
+                errors = {
+                    "serial_number": [
+                        "An asset with this serial number already exists."
+                    ]
+                }
+            if errors:
+                rejected.append((number, errors))
+                continue
+            taken.add(asset.serial_number)
+            valid.append(asset)
+
+        if valid:
+            for asset, asset_id in zip(valid, Asset.allocate_asset_ids(len(valid))):
+                asset.asset_id = asset_id
+            # With sharding on, rows in other shards are written outside
+            # this transaction, which only covers the default database.
+            bulk_create_assets(valid)
+
+        checkpoint.rows_done += len(batch)
+        checkpoint.assets_created += len(valid)
+        checkpoint.rows_invalid += len(rejected)
+        checkpoint.save()
+
+    # Reported only once the batch is committed, so a resumed import never
+    # repeats them.
+    if on_error is not None:
+        for number, errors in rejected:
+            for field, messages in errors.items():
+                for message in messages:
+                    on_error(number, field, message)